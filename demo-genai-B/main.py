@@ -22,35 +22,25 @@ if __name__ == "__main__":
         sys_prompt = "Answer in vietnamese only"
         
         # Compress into API POST request to send to knowledge base
-        kb_kwargs = {
-            "knowledgeBaseId": "AYP6WXNCZ0",
-            "retrievalConfiguration": {
-                "vectorSearchConfiguration": {
-                    "numberOfResults": 15,
-                    "overrideSearchType": "HYBRID"   
+        def retrieve(query):
+            return bedrock_agent_runtime.retrieve(**{
+                "knowledgeBaseId": "AYP6WXNCZ0",
+                "retrievalConfiguration": {
+                    "vectorSearchConfiguration": {
+                        "numberOfResults": 15,
+                        "overrideSearchType": "HYBRID"   
+                    }
+                },
+                "retrievalQuery": {
+                    "text": query
                 }
-            },
-            "retrievalQuery": {
-                "text": usr_prompt
-            }
-        }
-        
-        # Retrieve from knowledge base
-        retrieve_response = bedrock_agent_runtime.retrieve(**kb_kwargs)
-        
-        #Parser the retrived response into context prompt
-        ctx_prompt = utils.build_context_prompt(retrieve_response)
+            })
         
-        # Format user prompt and add instructions (CoT technique)
-        usr_prompt = utils.build_user_prompt(usr_prompt)
-        cot_prompt = utils.build_cot_prompt()
-        
-        # Add examples (Multishot technique)
-        exmaples = utils.read_txt_file("data/example_answers.txt")
-        exm_prompt = utils.build_example_prompt(exmaples)
-
-        # Build in payload with inference parameters
-        payload = utils.build_payload(usr_prompt, sys_prompt, ctx_prompt, cot_prompt)
+        # Retrieve from knowledge base while the user, CoT and example prompts are built,
+        # then build in payload with inference parameters
+        timer = utils.StageTimer()
+        payload = utils.prepare_turn(usr_prompt, retrieve, sys_prompt, 
+                                     example_file="data/example_answers.txt", timer=timer)
 
         # Compress into API POST request to send to amazon bedrock service
         kwargs = {
@@ -66,7 +56,11 @@ if __name__ == "__main__":
         
         # With streaming
         # Get the response back from the model
-        response = bedrock_runtime.invoke_model_with_response_stream(**kwargs)
+        with timer.stage("invoke"):
+            response = bedrock_runtime.invoke_model_with_response_stream(**kwargs)
         
         # Stream the response into console
-        utils.stream_response(response)
\ No newline at end of file
+        with timer.stage("stream"):
+            utils.stream_response(response)
+        
+        print(timer.report())
@@ -1,7 +1,12 @@
 import boto3
 import json
+import os
+import threading
+import time
 
-import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from functools import lru_cache
 
 
 def create_services(
@@ -242,6 +247,39 @@ def read_txt_file(file_name: str) -> str:
     return file_contents
 
 
+# Prompts built from files, with the modification time and size of the file they were built from
+_file_prompts = {}
+_file_prompts_lock = threading.Lock()
+
+
+def read_cached_file_prompt(file_name: str, build=None) -> str:
+    """
+    Read a text file and build its prompt once, again only when the file changes.
+
+    The file is only stat-ed on later calls; a new modification time or size
+    invalidates the cached prompt.
+
+    @param file_name: The path to the text file to be read.
+    @param build: Optional function building the prompt from the file contents.
+
+    @return: The prompt, or the contents of the file without build function.
+    """
+    stat = os.stat(file_name)
+    key = (os.path.abspath(file_name), build)
+    version = (stat.st_mtime_ns, stat.st_size)
+    with _file_prompts_lock:
+        cached = _file_prompts.get(key)
+    if cached and cached[0] == version:
+        return cached[1]
+
+    prompt = read_txt_file(file_name)
+    if build:
+        prompt = build(prompt)
+    with _file_prompts_lock:
+        _file_prompts[key] = (version, prompt)
+    return prompt
+
+
 def sanitize_input(text: str) -> str:
     """
     Remove leading and trailing whitespace
@@ -258,6 +296,42 @@ def sanitize_input(text: str) -> str:
     return text
         
         
+def escape_text(text: str) -> str:
+    """
+    Escape XML element text exactly like xml.etree.ElementTree does.
+
+    @param text: A string containing the raw text.
+
+    @return: The text with &, < and > escaped.
+    """
+    
+    if "&" in text:
+        text = text.replace("&", "&amp;")
+    if "<" in text:
+        text = text.replace("<", "&lt;")
+    if ">" in text:
+        text = text.replace(">", "&gt;")
+    return text
+
+
+def render_element(tag: str, text: str|None) -> str:
+    """
+    Render a text-only XML element without building an ElementTree.
+
+    The output is identical to ET.tostring(element, encoding="unicode", method="xml"),
+    including the "<tag />" form when the text is empty.
+
+    @param tag: The name of the XML tag.
+    @param text: The text content of the element.
+
+    @return: A string containing the XML representation of the element.
+    """
+    
+    if not text:
+        return f"<{tag} />"
+    return f"<{tag}>{escape_text(text)}</{tag}>"
+        
+        
 def build_context_prompt(retrieved_json_file: json, min_relevant_percentage: float = 0.5, debug=False):
     """
     Build a structured long context prompt in XML format from a retrieved JSON file.
@@ -276,15 +350,15 @@ def build_context_prompt(retrieved_json_file: json, min_relevant_percentage: flo
     # Start creating structure context block
     # Follow the GUIDELINE from 
     # https://docs.anthropic.com/en/docs/build-with-claude/prompt-engineering/long-context-tips#example-multi-document-structure
-    documents = ET.Element("documents")
-    
     if retrieved_json_file["ResponseMetadata"]["HTTPStatusCode"] != 200:
-        documents.text = "Error in getting data source from knowledge base. No context is provided"
+        return render_element("documents", "Error in getting data source from knowledge base. No context is provided")
     else:
         body = retrieved_json_file["retrievalResults"]
         
         # Iterate through body retrieve each into document
         # Example to add multiple document elements with an incrementing index attribute
+        # Collect every piece and join once, so the document texts are copied a single time
+        parts = ["<documents>"]
         for i, context_block in enumerate(body):
             
             # Filter irrelevant knowledge
@@ -292,19 +366,19 @@ def build_context_prompt(retrieved_json_file: json, min_relevant_percentage: flo
                 break
             
             # Create XML tag follow the Claude guideline above
-            document = ET.SubElement(documents, "document", {"index": str(i + 1)})
-            source = ET.SubElement(document, "source")
-            content = ET.SubElement(document, "document_content")
-            
             # Add source and content to assigned XML tag
-            source.text = iterate_through_location(context_block["location"])
-            content.text = context_block["content"]["text"]
+            parts.append(f'<document index="{i + 1}">')
+            parts.append(render_element("source", iterate_through_location(context_block["location"])))
+            parts.append(render_element("document_content", context_block["content"]["text"]))
+            parts.append("</document>")
+        
+        documents = "".join(parts) + "</documents>" if len(parts) > 1 else "<documents />"
         
         # For debug only
         if debug:
-            ET.dump(documents)
+            print(documents)
     
-    return ET.tostring(documents, encoding="unicode", method="xml")
+    return documents
 
 
 def build_example_prompt(prompt: str):
@@ -319,9 +393,7 @@ def build_example_prompt(prompt: str):
     @return: A string containing the XML representation of the example prompt.
     """
     
-    example_prompt = ET.Element("example")
-    example_prompt.text = prompt
-    return ET.tostring(example_prompt, encoding="unicode", method="xml")
+    return render_element("example", prompt)
 
 
 def build_user_prompt(prompt: str):
@@ -336,13 +408,12 @@ def build_user_prompt(prompt: str):
     @return: A string containing the XML representation of the user prompt.
     """
     
-    user_prompt = ET.Element("request")
-    user_prompt.text = prompt
-    return ET.tostring(user_prompt, encoding="unicode", method="xml")
+    return render_element("request", prompt)
 
 
 
 
+@lru_cache(maxsize=32)
 def build_cot_prompt(prompt: str|None = None):
     """
     Constructs an XML representation of a Chain of Thought (CoT) prompt.
@@ -367,8 +438,82 @@ def build_cot_prompt(prompt: str|None = None):
             else feel free to use your format. \
         "
     
-    cot_prompt = ET.Element("instruction")
-    cot_prompt.text = prompt
-    return ET.tostring(cot_prompt, encoding="unicode", method="xml")
+    return render_element("instruction", prompt)
+
+    
+
+
+class StageTimer:
+    """
+    Wall time of the stages of a turn, stages may run in different threads.
+    """
+
+    def __init__(self) -> None:
+        self.started = time.perf_counter()
+        self.timings = {}
+        self.__lock = threading.Lock()
+
+
+    @contextmanager
+    def stage(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            with self.__lock:
+                self.timings[name] = self.timings.get(name, 0.0) + time.perf_counter() - start
+
+
+    def report(self) -> str:
+        """
+        @return: One line with the milliseconds of each stage and of the whole turn.
+        """
+        stages = " | ".join(f"{name} {seconds * 1000:.0f} ms" for name, seconds in self.timings.items())
+        return f"{stages} | total {(time.perf_counter() - self.started) * 1000:.0f} ms"
+
+
+# Retrieval and example loading of the turns, the calls wait on the network or the disk
+_turn_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="turn")
+
+
+def prepare_turn(user_prompt: str, retrieve, system_prompt: str="",
+                 example_file: str="data/example_answers.txt",
+                 timer: StageTimer|None=None) -> str:
+    """
+    Build the payload of a turn, with the retrieval running while the prompts are assembled.
+
+    The knowledge base lookup and the loading of the examples are started
+    first; the user and chain-of-thought prompts are built meanwhile, and
+    the payload as soon as the retrieved context arrives.
+
+    @param user_prompt: The question of the user.
+    @param retrieve: Function returning the knowledge base response for a query.
+    @param system_prompt: A string containing the system prompt.
+    @param example_file: Path of the example answers (Multishot technique).
+    @param timer: Optional StageTimer recording the time of each stage.
+
+    @return: A JSON string representing the API request payload.
+    """
+    timer = timer or StageTimer()
+
+    def retrieve_context():
+        with timer.stage("retrieve"):
+            response = retrieve(user_prompt)
+        with timer.stage("context"):
+            return build_context_prompt(response)
+
+    def load_examples():
+        with timer.stage("examples"):
+            return read_cached_file_prompt(example_file, build_example_prompt)
+
+    context = _turn_executor.submit(retrieve_context)
+    examples = _turn_executor.submit(load_examples)
+
+    with timer.stage("prompts"):
+        request_prompt = build_user_prompt(user_prompt)
+        cot_prompt = build_cot_prompt()
 
-    
\ No newline at end of file
+    example_prompt = examples.result()
+    context_prompt = context.result()
+    with timer.stage("payload"):
+        return build_payload(request_prompt, system_prompt, context_prompt, example_prompt, cot_prompt)
@@ -6,6 +6,10 @@ from toolsdata import return_tool
 from termcolor import cprint
 
 
+# Tool rounds of one answer before the loop gives up
+MAX_TOOL_ROUNDS = 6
+
+
 system_prompt = """
     If answering the question requires data you were not trained on, you can use the get_article tool to get the contents of a recent wikipedia article about the topic.
     You can search for background information by using get_article, get_vnexpress_news, get_relevant_news tool for background and related content for more indetail information.
@@ -44,7 +48,7 @@ if __name__ == "__main__":
         claudeModel.add_to_memory("user", prompt) 
         
         # Sub-loop for tool use
-        while True: 
+        for _ in range(MAX_TOOL_ROUNDS + 1): 
             
             result = claudeModel.invoke(system_prompt, streaming=True)
             response = claudeModel.response(result)
@@ -63,4 +67,9 @@ if __name__ == "__main__":
                 claudeModel.add_tool_result_to_memory(tool_results)
             
             cprint(claudeModel.memory.messages, "light_magenta")
+        
+        else:
+            # The history must alternate, the unanswered tool results get a closing answer
+            cprint("Too many tool calls, stopping", "red")
+            claudeModel.add_to_memory("assistant", "(stopped after too many tool calls)")
         
\ No newline at end of file
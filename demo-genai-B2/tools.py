@@ -8,6 +8,11 @@ import requests
 from langchain_community.tools import DuckDuckGoSearchRun
 
 import urllib.parse
+from botocore.config import Config
+
+# Timeouts in seconds of the network calls, so a stuck tool can not hang the chat
+HTTP_TIMEOUT = 15
+RETRIEVE_TIMEOUT = 30
 
 
 @Tools.tool("retrieve", "data")
@@ -20,7 +25,7 @@ def call_wolframalpha(query: str) -> str:
     
     url = f"https://www.wolframalpha.com/api/v1/llm-api?input={encoded_query}s&appid=AQHXEG-WE9WU4T6K6"
     
-    return requests.get(url).text
+    return requests.get(url, timeout=HTTP_TIMEOUT).text
 
 
 @Tools.tool("retrieve","data")
@@ -47,7 +52,8 @@ def link_to_knowledgebase(query: str) -> json:
     @return: Compressed json file with chunking base and link-sources
     """
         
-    runtime = boto3.client("bedrock-agent-runtime", region_name="us-east-1")
+    runtime = boto3.client("bedrock-agent-runtime", region_name="us-east-1",
+                           config=Config(connect_timeout=5, read_timeout=RETRIEVE_TIMEOUT))
     
     # Compress into API POST request to send to knowledge base
     kwargs = {
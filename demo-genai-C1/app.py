@@ -1,39 +1,28 @@
-import boto3
+import boto3, json
 
 from termcolor import colored   # type: ignore
+from techxmodule.cancellation import cancel_on_interrupt
+from techxmodule.context import ContextPacker
 from techxmodule.core import Guardrail, Prompts
-from techxmodule.events import EventBus
+from techxmodule.deadline import Deadline
+from techxmodule.events import CONTEXT_PACKED
+from techxmodule.messages import LlamaTranscript
 from techxmodule.models.chat import Claude
 from techxmodule.models.instruct import LLama
+from techxmodule.usage import UsageLedger
 from techxmodule.utils import real_time
+from toolsdata import return_tool
 
 USER = "user"
 BOT = "assistant"
+TOOL = "ipython"
 REGION = "us-east-1"
 END_CODE = "/bye"
-
-
-function_list = [{
-        "name": "get_weather",
-        "description": "Get weather info for places",
-        "parameters": {
-            "type": "dict",
-            "required": [
-                "city"
-            ],
-            "properties": {
-                "city": {
-                    "type": "string",
-                    "description": "The name of the city to get the weather for"
-                },
-                "metric": {
-                    "type": "string",
-                    "description": "The metric for weather. Options are: celsius, fahrenheit",
-                    "default": "celsius"
-                }
-            }
-        }
-    }]
+MAX_INPUT_TOKEN = 4096
+SESSION_ID = "default"
+SESSION_TOKEN_BUDGET = None
+TURN_SECONDS = 60
+MAX_TOOL_ROUNDS = 4
 
 
 instruction = f"""You are an introvert shy assistant bot. Today time and Date: {real_time()}"""
@@ -44,13 +33,21 @@ if __name__ == "__main__":
     claude = Claude("3-haiku", session, REGION, 10)
     llama = LLama("3.2-3B", session, REGION, 0)
     llama_prompt = Prompts(llama)
+    ledger = UsageLedger(budget=SESSION_TOKEN_BUDGET)
+    llama.ledger = ledger
+    # Report the knowledge base documents and tokens kept in each tool result
+    llama.events.subscribe(CONTEXT_PACKED,
+                           lambda event: print(colored(ContextPacker.describe(event.data), "cyan")))
     claude_prompt = Prompts(claude)
     
-    prompt = f"""<s>[INST] <<SYS>>\n{instruction}\n<</SYS>\n\n"""
+    llama.tool_add(return_tool())
+    transcript = LlamaTranscript(llama_prompt.build_system(instruction, llama.tools), 
+                                 max_tokens=MAX_INPUT_TOKEN)
     
     while True:
         user_input = input("\n\nEnter your prompt (or '/bye' to exit): ")
         if user_input.lower() == END_CODE:
+            print(colored(ledger.report(), "cyan"))
             break
         
         
@@ -61,16 +58,58 @@ if __name__ == "__main__":
         
         # claude.add_to_memory(USER, claude_formated_prompt)
         
-        format_prompt = f"""{user_input} [/INST]"""
-        
-        prompt += format_prompt
+        transcript.append(USER, user_input)
         
 
         print("\nLLama answer: ")
-        llama_response = llama.invoke(
-            messages=prompt, 
-            max_token=512,
-            streaming=True)     
+        
+        # Sub-loop for tool use, Ctrl-C stops the answer being streamed
+        iteration = 0
+        deadline = Deadline(TURN_SECONDS, MAX_TOOL_ROUNDS)
+        final_prompt = f"{instruction}\n{llama.FINAL_ANSWER_PROMPT}"
+        refused = False
+        # Text saved as the bot turn, the answer unless Llama never gave one
+        answer = None
+        while True:
+            # Once the deadline is spent, Llama answers with a system prompt without tool definitions
+            final_answer = deadline.spent
+            with cancel_on_interrupt() as cancel:
+                llama_response = llama.invoke(
+                    messages=transcript.render(final_prompt if final_answer else None), 
+                    max_token=512,
+                    streaming=True,
+                    cancel=cancel,
+                    session_id=SESSION_ID,
+                    iteration=iteration)
+            
+            if llama_response and llama_response.stop_reason == "cancelled":
+                print(colored(f"\n[Stopped, up to {cancel.saved_tokens} output tokens saved]", "yellow"))
+            
+            if not llama_response or llama_response.stop_reason != "tool_use":
+                break
+            
+            if final_answer and not refused:
+                # Still calling tools: ask once more, telling Llama the calls are refused
+                final_prompt = f"{final_prompt}\n{llama.TOOLS_REFUSED_PROMPT}"
+                refused = True
+                continue
+            
+            if final_answer:
+                print(colored("\n[Time budget of the answer spent, tools not called]", "yellow"))
+                answer = "(no answer in time)"
+                break
+            
+            if ledger.exceeded(SESSION_ID):
+                print(colored("\n[Token budget exhausted, tools not called]", "yellow"))
+                answer = "(token budget exhausted)"
+                break
+            
+            # Tool results go back to Llama in the ipython role for the follow-up turn,
+            # past the deadline they say the tools were not called or timed out
+            transcript.append(BOT, llama_response.response)
+            tool_results = llama.tool_use(llama_response.tool, deadline)
+            transcript.append(TOOL, json.dumps(tool_results, ensure_ascii=False))
+            iteration += 1
         
         # print("\n\nClaude answer: ")
         # claude_response = claude.invoke(
@@ -80,8 +119,8 @@ if __name__ == "__main__":
         
         # claude.add_to_memory(BOT, claude_response["response"])
         
-        format_response = f"""{llama_response} </s><s> [INST]\n"""
-        
-        prompt += format_response
+        if llama_response:
+            # A call list left unanswered is not saved as the bot's turn
+            transcript.append(BOT, answer or llama_response.response)
         
         
\ No newline at end of file
@@ -0,0 +1,80 @@
+"""
+Tool HTTP calls through the shared keep-alive pool against bare requests.get.
+
+A local HTTP/1.1 server answers with a gzip-compressed body. Bare calls open
+a new connection for each request, the pool reuses one per host; over the
+internet each new connection also costs a DNS lookup and a TLS handshake, so
+the local gap is the smallest it gets. The pool's per-host metrics are
+printed at the end.
+
+Run from demo-genai-C1:
+    python -m benchmarks.bench_http [requests]
+"""
+import asyncio
+import gzip
+import sys
+import threading
+import time
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+from techxmodule.httppool import HttpPool
+
+
+BODY = gzip.compress(b"Chi Pheo is a short story by Nam Cao. " * 200)
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    connections = set()
+
+    def do_GET(self):
+        Handler.connections.add(self.client_address)
+        self.send_response(200)
+        self.send_header("Content-Encoding", "gzip")
+        self.send_header("Content-Length", str(len(BODY)))
+        self.end_headers()
+        self.wfile.write(BODY)
+
+    def log_message(self, *args):
+        pass
+
+
+def timed(label, count, call):
+    Handler.connections.clear()
+    start = time.perf_counter()
+    for _ in range(count):
+        call()
+    seconds = time.perf_counter() - start
+    print(f"{label:>8}: {seconds / count * 1000:6.2f} ms per call, {len(Handler.connections)} connections")
+
+
+async def concurrent(pool, url, count):
+    await asyncio.gather(*[pool.aget(url) for _ in range(count)])
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_port}/w/api.php"
+    pool = HttpPool()
+
+    timed("bare", count, lambda: requests.get(url, timeout=15).text)
+    timed("pooled", count, lambda: pool.get(url).text)
+
+    Handler.connections.clear()
+    start = time.perf_counter()
+    asyncio.run(concurrent(pool, url, count))
+    print(f"{'async':>8}: {(time.perf_counter() - start) / count * 1000:6.2f} ms per call, "
+          f"{len(Handler.connections)} connections")
+
+    print(pool.report())
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""
+Resident bytes per chat session: nested dict messages against `__slots__` message objects.
+
+The message texts are created before measuring and shared by both layouts,
+so the numbers are the per-object overhead of the containers themselves.
+
+Run from demo-genai-C1:
+    python -m benchmarks.bench_memory
+"""
+import random
+import tracemalloc
+
+from techxmodule.messages import ChatMessage, ToolUse, ToolResult
+
+
+SESSIONS = 1_000
+TURNS = 7  # ChatMessage keeps about max_chat_message messages, 4 per tool-using turn
+
+
+def texts(rng):
+    return [{
+        "question": f"<request>question {rng.random()}</request>",
+        "answer": f"answer {rng.random()}",
+        "tool_id": f"toolu_{rng.getrandbits(64):x}",
+        "query": f"query {rng.random()}",
+        "result": f"<documents>{rng.random()}</documents>",
+    } for _ in range(TURNS)]
+
+
+def dict_session(turns):
+    """
+    The message layout ChatMessage used before, nested dicts of dicts.
+    """
+    messages = []
+    for t in turns:
+        messages.append({"role": "user", "content": [{"type": "text", "text": t["question"]}]})
+        messages.append({"role": "assistant", "content": [
+            {"type": "tool_use", "id": t["tool_id"], "name": "get_article", "input": {"search_term": t["query"]}}
+        ]})
+        messages.append({"role": "user", "content": [{
+            "type": "tool_result", "tool_use_id": t["tool_id"],
+            "content": [{"type": "text", "text": t["result"]}]
+        }]})
+        messages.append({"role": "assistant", "content": [{"type": "text", "text": t["answer"]}]})
+    return messages
+
+
+def object_session(turns):
+    memory = ChatMessage(max_chat_message=TURNS * 4)
+    for t in turns:
+        memory.append_message("user", t["question"])
+        memory.append_tool([ToolUse(t["tool_id"], "get_article", {"search_term": t["query"]})])
+        memory.append_tool_result([ToolResult(t["tool_id"], t["result"])])
+        memory.append_message("assistant", t["answer"])
+    return memory
+
+
+def measure(build, corpus):
+    tracemalloc.start()
+    sessions = [build(turns) for turns in corpus]
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del sessions
+    return size / len(corpus)
+
+
+if __name__ == "__main__":
+    rng = random.Random(3)
+    corpus = [texts(rng) for _ in range(SESSIONS)]
+
+    before = measure(dict_session, corpus)
+    after = measure(object_session, corpus)
+    print(f"{SESSIONS} sessions, {TURNS * 4} messages each (texts excluded)")
+    print(f"nested dicts     {before:10.0f} bytes/session")
+    print(f"__slots__ objects {after:9.0f} bytes/session")
+    print(f"saved            {before - after:10.0f} bytes/session ({(1 - after / before) * 100:.0f}%)")
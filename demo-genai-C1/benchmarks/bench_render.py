@@ -0,0 +1,114 @@
+"""
+Template prompt rendering against the ElementTree round trip it replaces.
+
+Checks that `techxmodule.render` and demo-genai-B's `utils` produce
+byte-identical output to the previous ET.Element + ET.tostring code, then
+times a 100-document knowledge base context.
+
+Run from demo-genai-C1:
+    python -m benchmarks.bench_render
+"""
+import importlib.util
+import os
+import random
+import timeit
+import xml.etree.ElementTree as ET
+
+from techxmodule import render
+
+
+DOCUMENTS = 100
+REPEAT = 200
+ALPHABET = "abc xyz Chí Phèo Bá Kiến & < > \" ' \n\t"
+WORDS = "Chí Phèo Bá Kiến Thị Nở làng Vũ Đại rượu cháo hành say 1930 (Nam Cao), ...".split()
+
+
+def et_element(tag, text):
+    element = ET.Element(tag)
+    element.text = text
+    return ET.tostring(element, encoding="unicode", method="xml")
+
+
+def et_documents(results, min_relevance=0.5):
+    documents = ET.Element("documents")
+    for i, context in enumerate(results):
+        if context["score"] < min_relevance:
+            break
+        document = ET.SubElement(documents, "document", {"index": str(i + 1)})
+        ET.SubElement(document, "source").text = context["location"]["s3Location"]["uri"]
+        ET.SubElement(document, "document_content").text = context["content"]["text"]
+    return ET.tostring(documents, encoding="unicode", method="xml")
+
+
+def render_documents(results, min_relevance=0.5):
+    kept = []
+    for context in results:
+        if context["score"] < min_relevance:
+            break
+        kept.append((context["location"]["s3Location"]["uri"], context["content"]["text"]))
+    return render.render_documents(kept)
+
+
+def load_demo_b_utils():
+    path = os.path.join(os.path.dirname(__file__), "..", "..", "demo-genai-B", "utils.py")
+    spec = importlib.util.spec_from_file_location("demo_genai_b_utils", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def random_text(rng, words):
+    text = " ".join(rng.choices(WORDS, k=words))
+    # Knowledge base chunks occasionally contain characters that need escaping
+    return text + " R&D <ghi chú>" if rng.random() < 0.2 else text
+
+
+def random_results(rng, count, words=250):
+    return [{
+        "content": {"text": random_text(rng, words)},
+        "location": {"type": "S3", "s3Location": {"uri": f"s3://kb/chi-pheo-{i}.txt?a=1&b=<2>"}},
+        "score": 1 - i / (count * 1.5)
+    } for i in range(count)]
+
+
+def verify(rng, demo_b):
+    texts = ["", None, "plain", "<request>&amp;</request>", "\"quoted\" 'single'",
+             "".join(rng.choices(ALPHABET, k=5000))]
+    fragments = {
+        "context": render.CONTEXT, "instructions": render.INSTRUCTIONS,
+        "examples": render.EXAMPLES, "request": render.REQUEST, "documents": render.DOCUMENTS
+    }
+    for text in texts:
+        for tag, fragment in fragments.items():
+            assert fragment(text) == et_element(tag, text), (tag, text)
+        for tag in ("example", "request", "instruction"):
+            assert demo_b.render_element(tag, text) == et_element(tag, text), (tag, text)
+
+    for count in (0, 1, DOCUMENTS):
+        results = random_results(rng, count)
+        expected = et_documents(results)
+        assert render_documents(results) == expected
+        assert demo_b.build_context_prompt({
+            "ResponseMetadata": {"HTTPStatusCode": 200},
+            "retrievalResults": results
+        }) == expected
+    assert demo_b.build_context_prompt({"ResponseMetadata": {"HTTPStatusCode": 500}}) == \
+        et_element("documents", "Error in getting data source from knowledge base. No context is provided")
+
+
+if __name__ == "__main__":
+    rng = random.Random(7)
+    verify(rng, load_demo_b_utils())
+    print("Output is byte-identical to ElementTree.")
+
+    results = random_results(rng, DOCUMENTS)
+    user = random_text(rng, 60)
+    for name, fn in (
+        ("documents (100)", lambda impl: impl[0](results)),
+        ("request", lambda impl: impl[1]("request", user)),
+    ):
+        et = timeit.timeit(lambda: fn((et_documents, et_element)), number=REPEAT) / REPEAT
+        fast = timeit.timeit(lambda: fn((render_documents, lambda tag, text: render.REQUEST(text))),
+                             number=REPEAT) / REPEAT
+        print(f"{name:<16} ElementTree {et * 1e6:9.1f} us   template {fast * 1e6:9.1f} us   "
+              f"speedup {et / fast:5.1f}x")
@@ -0,0 +1,136 @@
+"""
+Parser throughput and turn latency replayed from recorded Bedrock streams.
+
+Record real traffic by setting a recorder on the model, e.g. in main.py:
+    claudeModel.recorder = StreamRecorder("recordings/session.jsonl.gz")
+
+The recordings are then replayed through the model's own response parsing,
+first as fast as possible to measure the parser alone (chunks and tokens per
+second), then at the recorded pace to measure the latency of a turn and of
+its first token as the user would see it. Run the same file against two
+versions of the tree to compare them. Without a file, a synthetic recording
+of a streamed answer is made first.
+
+Run from demo-genai-C1:
+    python -m benchmarks.bench_replay [recording.jsonl.gz] [speed]
+"""
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+from techxmodule.models.chat import Claude
+from techxmodule.models.instruct import LLama
+from techxmodule.replay import ReplaySession, StreamRecorder, load_recordings
+
+
+TOKENS = 400
+INTERVAL = 0.005
+RUNS = 200
+
+
+class SyntheticStream:
+    """
+    Claude event stream arriving one chunk every INTERVAL seconds.
+    """
+
+    def __iter__(self):
+        events = [{"type": "message_start", "message": {"usage": {"input_tokens": 1200, "output_tokens": 1}}},
+                  {"type": "content_block_start", "index": 0, "content_block": {"type": "text", "text": ""}}]
+        events += [{"type": "content_block_delta", "index": 0,
+                    "delta": {"type": "text_delta", "text": f"token{i} "}} for i in range(TOKENS)]
+        events += [{"type": "content_block_stop", "index": 0},
+                   {"type": "message_delta", "delta": {"stop_reason": "end_turn"},
+                    "usage": {"output_tokens": TOKENS}}]
+        for event in events:
+            time.sleep(INTERVAL)
+            yield {"chunk": {"bytes": json.dumps(event).encode()}}
+
+
+class SyntheticRuntime:
+
+    def invoke_model_with_response_stream(self, **kwargs):
+        time.sleep(0.2)
+        return {"body": SyntheticStream()}
+
+
+class SyntheticSession:
+
+    def client(self, *args, **kwargs):
+        return SyntheticRuntime()
+
+
+def synthetic_recording():
+    """
+    Record one streamed answer of a fake runtime, as a live session would.
+    """
+    path = os.path.join(tempfile.mkdtemp(), "synthetic.jsonl.gz")
+    model = Claude("3.5-sonnet", SyntheticSession(), "local", 4)
+    model.echo = False
+    model.recorder = StreamRecorder(path)
+    model.add_to_memory("user", "Who is Chi Pheo?")
+    model.invoke(streaming=True)
+    return path
+
+
+def replay_model(recording, speed):
+    session = ReplaySession([recording], speed)
+    if "anthropic" in recording.model_id:
+        model = Claude("3.5-sonnet", session, "local", 4)
+        model.add_to_memory("user", "replay")
+        invoke = lambda **kwargs: model.invoke(**kwargs)
+    else:
+        model = LLama("3.2-1B", session, "local")
+        invoke = lambda **kwargs: model.invoke(recording.payload.get("prompt", ""), **kwargs)
+    model.echo = False
+    return invoke
+
+
+def replay(recording, speed, runs):
+    """
+    @return: (seconds of each turn, seconds to the first token of each turn)
+    """
+    invoke = replay_model(recording, speed)
+    turns, first_tokens = [], []
+    for _ in range(runs):
+        first = []
+        start = time.perf_counter()
+        invoke(streaming=recording.streaming,
+               on_token=lambda text: first or first.append(time.perf_counter()))
+        turns.append(time.perf_counter() - start)
+        first_tokens.append((first[0] if first else time.perf_counter()) - start)
+    return turns, first_tokens
+
+
+def percentile(values, p):
+    return sorted(values)[min(len(values) - 1, int(len(values) * p))]
+
+
+def main():
+    path = sys.argv[1] if len(sys.argv) > 1 else synthetic_recording()
+    speed = float(sys.argv[2]) if len(sys.argv) > 2 else 1.0
+    recordings = load_recordings(path)
+    print(f"{len(recordings)} recordings from {path}")
+
+    for n, recording in enumerate(recordings):
+        chunks = len(recording.chunks) if recording.streaming else 1
+        size = sum(len(chunk) for _, chunk in recording.chunks) if recording.streaming else len(recording.body)
+        print(f"\n#{n} {recording.model_id}, {'streaming' if recording.streaming else 'non-streaming'}, "
+              f"{chunks} chunks, {size / 1024:.1f} KB{', truncated' if recording.truncated else ''}")
+
+        turns, _ = replay(recording, None, RUNS)
+        parse = statistics.median(turns)
+        print(f"  parser:   {parse * 1000:7.2f} ms per response, {chunks / parse:10.0f} chunks/s, "
+              f"{size / parse / 1e6:6.1f} MB/s")
+
+        recorded = recording.latency + (recording.chunks[-1][0] if recording.chunks else 0)
+        turns, first_tokens = replay(recording, speed, 3)
+        print(f"  recorded: {recorded * 1000:7.1f} ms turn")
+        print(f"  replayed: {percentile(turns, 0.5) * 1000:7.1f} ms turn, "
+              f"{percentile(first_tokens, 0.5) * 1000:7.1f} ms to first token at {speed}x")
+
+
+if __name__ == "__main__":
+    main()
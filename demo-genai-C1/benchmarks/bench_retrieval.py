@@ -0,0 +1,115 @@
+"""
+Queries per second of the local hybrid retriever against corpus size.
+
+First checks that chunks only the keyword ranking finds (a name the vectors
+miss) keep a score passing the 0.5 relevance filter of the context builders.
+
+Run from demo-genai-C1:
+    python -m benchmarks.bench_retrieval
+"""
+import random
+import tempfile
+import time
+
+from array import array
+from techxmodule.index import LocalIndex, IndexWriter, normalize_vector
+from techxmodule.retrieval import HybridRetriever
+
+
+SYLLABLES = ("chí phèo bá kiến thị nở tự lãng làng vũ đại rượu cháo hành "
+             "say ngủ đầu trò sáng mai nông dân địa chủ nhà tù con người "
+             "trở về đời sống xã hội tha hóa lương thiện yêu thương").split()
+DIMENSIONS = 256
+CORPUS_SIZES = (1_000, 5_000, 20_000)
+QUERIES = 200
+
+
+def build_index(path: str, size: int, rng: random.Random) -> LocalIndex:
+    writer = IndexWriter(path, DIMENSIONS, "synthetic")
+    chunks, vectors = [], array("f")
+    for i in range(size):
+        chunks.append({
+            "text": " ".join(rng.choices(SYLLABLES, k=rng.randint(80, 200))),
+            "source": f"doc-{i // 20}.txt",
+            "offset": 0,
+            "location": {"type": "LOCAL", "localLocation": {"uri": f"file:///doc-{i // 20}.txt"}}
+        })
+        vectors.extend(normalize_vector(rng.gauss(0, 1) for _ in range(DIMENSIONS)))
+    writer.add_file("synthetic", "", chunks, vectors.tobytes())
+    writer.commit()
+    return LocalIndex(path)
+
+
+def check_keyword_scores(rng: random.Random, min_relevance: float = 0.5) -> None:
+    """
+    The top 3 BM25-only hits of a hybrid query must pass the relevance filter.
+    """
+    with tempfile.TemporaryDirectory() as path:
+        index = build_index(path, 1_000, rng)
+        for doc_id in (10, 20, 30):
+            index.chunks[doc_id]["text"] += " bá kiến" * (4 - doc_id // 10)
+        retriever = HybridRetriever(index)
+        query_vector = [rng.gauss(0, 1) for _ in range(DIMENSIONS)]
+        dense = {doc_id for doc_id, _ in index.search(query_vector, 50)}
+        keyword = [doc_id for doc_id, _ in retriever.bm25.search("bá kiến", 50)]
+        keyword_only = [doc_id for doc_id in keyword[:3] if doc_id not in dense]
+
+        results = retriever.retrieve("bá kiến", 50, query_vector=query_vector)["retrievalResults"]
+        by_chunk = {result["metadata"]["chunkId"]: result["score"] for result in results}
+        scores = [by_chunk[index.chunks[doc_id]["id"]] for doc_id in keyword_only]
+        for doc_id, score in zip(keyword_only, scores):
+            assert score >= min_relevance, f"keyword-only hit {doc_id} scored {score:.2f}"
+        print(f"keyword-only hits at ranks <= 3 score {', '.join(f'{score:.2f}' for score in scores)}, "
+              f">= {min_relevance}")
+        index.close()
+
+
+def check_score_order(rng: random.Random, number_of_results: int = 10) -> None:
+    """
+    Hybrid results must come ordered by the score they return, and a
+    shorter result list must keep the highest scores of a longer one.
+    """
+    with tempfile.TemporaryDirectory() as path:
+        index = build_index(path, 1_000, rng)
+        retriever = HybridRetriever(index)
+        query = " ".join(rng.choices(SYLLABLES, k=4))
+        query_vector = [rng.gauss(0, 1) for _ in range(DIMENSIONS)]
+        everything = retriever.retrieve(query, 100, query_vector=query_vector)["retrievalResults"]
+        top = retriever.retrieve(query, number_of_results, query_vector=query_vector)["retrievalResults"]
+        scores = [result["score"] for result in everything]
+        assert scores == sorted(scores, reverse=True), "results not ordered by score"
+        assert [result["score"] for result in top] == scores[:number_of_results], \
+            "top results are not the highest scores"
+        print(f"hybrid results ordered by score, top {number_of_results} "
+              f"{scores[0]:.2f}..{scores[number_of_results - 1]:.2f} of {len(scores)}")
+        index.close()
+
+
+def queries_per_second(fn, queries) -> float:
+    start = time.perf_counter()
+    for query in queries:
+        fn(query)
+    return len(queries) / (time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+    rng = random.Random(42)
+    check_keyword_scores(rng)
+    check_score_order(rng)
+    print(f"{'chunks':>8} {'build s':>8} {'bm25 qps':>10} {'dense qps':>10} {'hybrid qps':>11}")
+    for size in CORPUS_SIZES:
+        with tempfile.TemporaryDirectory() as path:
+            index = build_index(path, size, rng)
+            start = time.perf_counter()
+            retriever = HybridRetriever(index)
+            build = time.perf_counter() - start
+
+            queries = [(" ".join(rng.choices(SYLLABLES, k=4)),
+                        [rng.gauss(0, 1) for _ in range(DIMENSIONS)])
+                       for _ in range(QUERIES)]
+
+            bm25 = queries_per_second(lambda q: retriever.bm25.search(q[0], 50), queries)
+            dense = queries_per_second(lambda q: index.search(q[1], 50), queries)
+            hybrid = queries_per_second(lambda q: retriever.retrieve(q[0], query_vector=q[1]), queries)
+            print(f"{size:>8} {build:>8.2f} {bm25:>10.1f} {dense:>10.1f} {hybrid:>11.1f}")
+            index.close()
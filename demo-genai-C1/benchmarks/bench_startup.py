@@ -0,0 +1,74 @@
+"""
+Cold start of the CLI entry points, measured with `python -X importtime`.
+
+Each entry point is imported in a fresh interpreter (so nothing is cached
+in `sys.modules`), the import time report is parsed, and the slowest
+top-level imports are listed. Exits with status 1 if any entry point
+takes longer than the target, so it can guard against a heavy import
+(geo stack, langchain, wikipedia) creeping back to module level.
+
+Run from demo-genai-C1:
+    python -m benchmarks.bench_startup [target_ms]
+"""
+import os
+import re
+import subprocess
+import sys
+
+
+ENTRY_POINTS = ["main", "app"]
+TARGET_MS = 1500
+RUNS = 5
+TOP = 8
+LINE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+
+def import_times(module):
+    """
+    Import a module in a new interpreter.
+
+    @return: Cumulative microseconds of the module, and {direct import: cumulative microseconds}.
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{result.stderr[-2000:]}")
+
+    total = 0
+    direct = {}
+    for line in result.stderr.splitlines():
+        match = LINE.match(line)
+        if not match:
+            continue
+        # Nesting is shown by indentation: one space for a top-level import, three for
+        # its own imports, which are listed before it
+        depth = len(match.group(3))
+        if depth == 1 and match.group(4) == module:
+            total = int(match.group(2))
+            break
+        elif depth == 1:
+            direct = {}
+        elif depth == 3:
+            direct[match.group(4)] = int(match.group(2))
+    return total, direct
+
+
+def main():
+    target_ms = float(sys.argv[1]) if len(sys.argv) > 1 else TARGET_MS
+    failed = False
+    for module in ENTRY_POINTS:
+        runs = [import_times(module) for _ in range(RUNS)]
+        total, breakdown = min(runs, key=lambda run: run[0])
+        status = "ok" if total / 1000 <= target_ms else "OVER TARGET"
+        failed |= status != "ok"
+        print(f"import {module}: {total / 1000:8.1f} ms (best of {RUNS}, target {target_ms:.0f} ms) {status}")
+        for name, micros in sorted(breakdown.items(), key=lambda item: item[1], reverse=True)[:TOP]:
+            print(f"    {micros / 1000:8.1f} ms  {name}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
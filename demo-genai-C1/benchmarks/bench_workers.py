@@ -0,0 +1,132 @@
+"""
+Chat server throughput against the number of worker processes.
+
+Workers serve Claude with a fake Bedrock runtime that replays a prerecorded
+event stream without waiting, so a turn is all CPU-bound Python: parsing the
+stream chunks, sanitizing the history and encoding the SSE events. Many
+sessions are driven concurrently through the router; with one worker per
+core the turns per second should grow with the number of workers.
+
+Run from demo-genai-C1:
+    python -m benchmarks.bench_workers [max_workers]
+"""
+import asyncio
+import json
+import os
+import socket
+import sys
+import time
+
+from techxmodule.workers import Supervisor
+
+
+TOKENS = 300
+SESSIONS = 256
+TURNS = 768
+CONNECTIONS = 64
+
+
+def recorded_stream():
+    events = [{"type": "message_start"},
+              {"type": "content_block_start", "index": 0, "content_block": {"type": "text", "text": ""}}]
+    events += [{"type": "content_block_delta", "index": 0,
+                "delta": {"type": "text_delta", "text": f"token{i} "}} for i in range(TOKENS)]
+    events += [{"type": "content_block_stop", "index": 0},
+               {"type": "message_delta", "delta": {"stop_reason": "end_turn"}, "usage": {"output_tokens": TOKENS}}]
+    return [{"chunk": {"bytes": json.dumps(event).encode()}} for event in events]
+
+
+class FakeRuntime:
+
+    def __init__(self):
+        self.stream = recorded_stream()
+
+    def invoke_model_with_response_stream(self, **kwargs):
+        return {"body": iter(self.stream)}
+
+
+class FakeSession:
+
+    def __init__(self):
+        self.runtime = FakeRuntime()
+
+    def client(self, *args, **kwargs):
+        return self.runtime
+
+
+def fake_factory():
+    """
+    Model factory of a worker, called in the worker process.
+    """
+    from techxmodule.models.chat import Claude
+
+    # Keep the history messages of the models out of the benchmark output
+    sys.stdout = open(os.devnull, "w")
+    boto_session = FakeSession()
+    return lambda session_id: Claude("3.5-sonnet", boto_session, "local", 4)
+
+
+async def turn(port, session_id):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    body = json.dumps({"message": "Who is Chi Pheo?"}).encode()
+    writer.write(f"POST /sessions/{session_id}/messages HTTP/1.1\r\nHost: bench\r\n"
+                 f"Content-Length: {len(body)}\r\n\r\n".encode() + body)
+    await writer.drain()
+    response = await reader.read()
+    writer.close()
+    if b"event: done" not in response:
+        raise RuntimeError(f"Turn of {session_id} failed: {response[-200:]!r}")
+
+
+async def drive(port):
+    queue = asyncio.Queue()
+    for i in range(TURNS):
+        queue.put_nowait(f"session-{i % SESSIONS}")
+
+    async def client():
+        while not queue.empty():
+            await turn(port, queue.get_nowait())
+
+    # Warm up: create every session once, and let every worker import its modules
+    await asyncio.gather(*(turn(port, f"session-{i}") for i in range(SESSIONS)))
+    start = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(CONNECTIONS)))
+    return TURNS / (time.perf_counter() - start)
+
+
+async def measure(workers, port):
+    supervisor = Supervisor(fake_factory, workers=workers,
+                            server_options={"max_concurrency": 8})
+    server = asyncio.ensure_future(supervisor.serve("127.0.0.1", port))
+    try:
+        # Wait until the router and every worker accept connections
+        while not all(os.path.exists(supervisor.socket_path(i)) for i in range(workers)):
+            await asyncio.sleep(0.1)
+        return await drive(port)
+    finally:
+        server.cancel()
+        try:
+            await server
+        except asyncio.CancelledError:
+            pass
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def main():
+    max_workers = int(sys.argv[1]) if len(sys.argv) > 1 else (os.cpu_count() or 1)
+    counts = sorted({1, *(2 ** i for i in range(1, 8) if 2 ** i <= max_workers), max_workers})
+    print(f"{os.cpu_count()} cores, {TURNS} turns of {TOKENS} tokens over {SESSIONS} sessions")
+    baseline = None
+    for workers in counts:
+        throughput = asyncio.run(measure(workers, free_port()))
+        baseline = baseline or throughput
+        print(f"{workers:3d} workers: {throughput:8.1f} turns/s  x{throughput / baseline:.2f}")
+
+
+if __name__ == "__main__":
+    main()
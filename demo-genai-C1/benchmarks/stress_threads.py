@@ -0,0 +1,103 @@
+"""
+Stress test of one Claude instance shared by many threads.
+
+Every thread runs its own chat session (its own ChatMessage) against the
+same model object, mixing streaming and non-streaming calls. A fake Bedrock
+runtime answers each call by echoing the session's latest question, with
+random pauses between stream chunks so the calls interleave. Any state
+shared between calls (streaming mode, memory, token callbacks) shows up as
+an answer, a history or a token stream belonging to another session.
+
+Run from demo-genai-C1:
+    python -m benchmarks.stress_threads [threads] [turns]
+"""
+import io
+import json
+import random
+import sys
+import threading
+import time
+
+from techxmodule.messages import ChatMessage
+from techxmodule.models.chat import Claude
+
+
+class EchoRuntime:
+    """
+    Answers with "echo: <last user text>", streamed word by word or at once.
+    """
+
+    def answer(self, kwargs):
+        messages = json.loads(kwargs["body"])["messages"]
+        return "echo: " + messages[-1]["content"][-1]["text"]
+
+    def invoke_model(self, **kwargs):
+        body = {"content": [{"type": "text", "text": self.answer(kwargs)}],
+                "stop_reason": "end_turn", "stop_sequence": None, "usage": {"output_tokens": 1}}
+        return {"body": io.BytesIO(json.dumps(body).encode())}
+
+    def invoke_model_with_response_stream(self, **kwargs):
+        return {"body": self.stream(self.answer(kwargs))}
+
+    def stream(self, text):
+        events = [{"type": "content_block_start", "index": 0, "content_block": {"type": "text", "text": ""}}]
+        events += [{"type": "content_block_delta", "index": 0, "delta": {"type": "text_delta", "text": word}}
+                   for word in text.split(" ")[:1] + [" " + word for word in text.split(" ")[1:]]]
+        events += [{"type": "content_block_stop", "index": 0},
+                   {"type": "message_delta", "delta": {"stop_reason": "end_turn"}, "usage": {"output_tokens": 1}}]
+        for event in events:
+            time.sleep(random.random() * 0.001)
+            yield {"chunk": {"bytes": json.dumps(event).encode()}}
+
+
+class EchoSession:
+
+    def client(self, *args, **kwargs):
+        return EchoRuntime()
+
+
+def session(model, index, turns, errors):
+    memory = ChatMessage(max_chat_message=model.memory.max_chat_message)
+    for turn in range(turns):
+        question = f"session {index} turn {turn}"
+        tokens = []
+        model.add_to_memory("user", question, memory=memory)
+        response = model.invoke(streaming=turn % 2 == 0, memory=memory, on_token=tokens.append)
+        expected = "echo: " + question
+        if response is None or response.response != expected or "".join(tokens) != expected:
+            errors.append(f"session {index} turn {turn}: got {response and response.response!r}, "
+                          f"tokens {''.join(tokens)!r}")
+            return
+        model.add_to_memory("assistant", response.response, memory=memory)
+        foreign = [block.text for message in memory.messages for block in message.content
+                   if f"session {index} " not in block.text]
+        if foreign:
+            errors.append(f"session {index} turn {turn}: foreign messages {foreign}")
+            return
+
+
+def main():
+    threads = int(sys.argv[1]) if len(sys.argv) > 1 else 32
+    turns = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+    # Switch threads as often as possible to provoke interleavings
+    sys.setswitchinterval(1e-6)
+
+    model = Claude("3.5-sonnet", EchoSession(), "local", 4)
+    model.echo = False
+    errors = []
+    workers = [threading.Thread(target=session, args=(model, i, turns, errors)) for i in range(threads)]
+    start = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+    print(f"{threads} threads x {turns} turns on one model in {time.perf_counter() - start:.1f}s")
+    if errors:
+        print(f"{len(errors)} sessions corrupted, first: {errors[0]}")
+        sys.exit(1)
+    print("No cross-session corruption")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,29 @@
-import boto3, pytz
+import boto3
 
+from techxmodule.cancellation import cancel_on_interrupt
 from techxmodule.models.chat import Claude
+from techxmodule.context import ContextPacker
 from techxmodule.core import Prompts
-from techxmodule.utils import system, location
+from techxmodule.deadline import Deadline
+from techxmodule.events import CONTEXT_PACKED
+from techxmodule.httppool import pool as http_pool
+from techxmodule.replay import StreamRecorder
+from techxmodule.usage import UsageLedger
+from techxmodule.utils import probe_environment, real_time
 from toolsdata import return_tool
 from termcolor import cprint    # type: ignore
 
-from datetime import datetime
+# Tokens the session may use before tools are no longer called, None for unlimited
+SESSION_TOKEN_BUDGET = None
 
-system_prompt = f"""
+# Seconds and tool rounds of one answer, after which Gracie answers without tools
+TURN_SECONDS = 60
+MAX_TOOL_ROUNDS = 6
+
+# Gzip JSON lines file recording every Bedrock call for replay benchmarks, None to disable
+RECORD_PATH = None
+
+SYSTEM_PROMPT = """
     You are a personal robot name Gracie, you are Vietnamese mixed with French. You are every sympathy to every one, you know thier emotional and always show thier way what to do base on
     thier surrounding environment, you notice environment and times around the user carefully before analysing their emotional state and sentences.
     You are understand people so when people want to share, you want to leave them some space for thier.
@@ -18,9 +33,9 @@ system_prompt = f"""
     Please include some analogies, possibly with an overarching storytelling-type narative, to make the content sound more human.
     Always feel curiousity about something and always suggest something new for people, you are also desired to do with them, always ask about new things, even if you already know the answer.
     Always have some intrusive thought, gave mixed and new ideas for everyone.
-    Realtime is: {datetime.now(tz = pytz.timezone("Asia/Bangkok")).strftime('%Y-%m-%d %H:%M:%S %Z')}.
-    The current user computer system information is: {system()}. Use this when user asking any topic related to computer, software, science.
-    The current user location is: {location()}.
+    Realtime is: {real_time}.
+    The current user computer system information is: {system}. Use this when user asking any topic related to computer, software, science.
+    The current user location is: {location}.
     If answering the question requires data, first check from the chat history to see if there any reuse data, documents, context in pass that you have found before.
     If the data you is not on the chat history or you were not trained on, you can use the get_article tool to get the contents of a recent wikipedia article about the topic.
     You can search for background information by using get_article, get_vnexpress_news, get_relevant_news tool for background and related content for more indetail information.
@@ -34,8 +49,22 @@ system_prompt = f"""
     """
 
 
+def build_system_prompt(environment: dict) -> str:
+    """
+    Fill the system prompt with the current time and the probed environment.
+
+    @param environment: Result of `probe_environment`.
+    @return: System prompt.
+    """
+    return SYSTEM_PROMPT.format(real_time=real_time(), **environment)
+
+
 if __name__ == "__main__":
     
+    # Probe system and location in the background while the user types
+    environment = probe_environment()
+    system_prompt = None
+    
     # Create session
     session = boto3.Session()
     
@@ -43,6 +72,17 @@ if __name__ == "__main__":
     claudeModel = Claude("3.5-sonnet", session, "us-east-1", 10)
     claudePrompt = Prompts(claudeModel)
     
+    # Record the tokens and estimated cost of every call
+    ledger = UsageLedger(budget=SESSION_TOKEN_BUDGET)
+    claudeModel.ledger = ledger
+    
+    # Report the knowledge base documents and tokens kept in each tool result
+    claudeModel.events.subscribe(CONTEXT_PACKED,
+                                 lambda event: cprint(ContextPacker.describe(event.data), "cyan"))
+    
+    if RECORD_PATH:
+        claudeModel.recorder = StreamRecorder(RECORD_PATH)
+    
     # Add tool for the model to use
     claudeModel.tool_add(return_tool())
     
@@ -54,25 +94,52 @@ if __name__ == "__main__":
         
         # Exit app conditions
         if userPrompt == "\\bye":
+            cprint(ledger.report(), "cyan")
+            cprint(http_pool.report(), "cyan")
             break
         
+        if system_prompt is None:
+            system_prompt = build_system_prompt(environment.result())
+        
         prompt = claudePrompt.build(userPrompt)
         
         claudeModel.add_to_memory("user", prompt) 
+        deadline = Deadline(TURN_SECONDS, MAX_TOOL_ROUNDS)
         
-        # Sub-loop for tool use
+        # Sub-loop for tool use, Ctrl-C stops the answer being streamed,
+        # once the deadline is spent the answer comes without tools
         while True:
             
-            response = claudeModel.invoke(system_prompt=system_prompt, streaming=True)
+            with cancel_on_interrupt() as cancel:
+                response = claudeModel.invoke(system_prompt=system_prompt, streaming=True, cancel=cancel,
+                                              dispatch_tools=True, deadline=deadline)
 
-            if response["stop_reason"] == "end_turn":
+            if response.stop_reason == "cancelled":
+                
+                cprint(f"\n[Stopped, up to {cancel.saved_tokens} output tokens saved]", "yellow")
+                claudeModel.add_to_memory("assistant", response.response or "(cancelled)")
+                break
+
+            elif response.stop_reason == "end_turn":
+                
+                claudeModel.add_to_memory("assistant", response.response)
+                break
+            
+            elif response.stop_reason == "deadline_exceeded":
+                
+                claudeModel.add_to_memory("assistant", response.response or "(no answer in time)")
+                break
+            
+            elif response.stop_reason == "tool_use" and ledger.exceeded(claudeModel.memory.session_id):
                 
-                claudeModel.add_to_memory("assistant", response["response"])
+                cprint("\n[Token budget exhausted, tools not called]", "yellow")
+                claudeModel.cancel_tools(response.tool)
+                claudeModel.add_to_memory("assistant", response.response or "(token budget exhausted)")
                 break
             
-            elif response["stop_reason"] == "tool_use":
+            elif response.stop_reason == "tool_use":
                 
-                claudeModel.add_tool_to_memory(response["body"])
-                tool_results = claudeModel.tool_use(response["tool"])
+                claudeModel.add_tool_to_memory(response.body)
+                tool_results = claudeModel.tool_use(response.tool, deadline)
                 claudeModel.add_tool_result_to_memory(tool_results)
         
\ No newline at end of file
@@ -0,0 +1,86 @@
+import signal
+import threading
+
+from contextlib import contextmanager
+from typing import Callable, Iterator, List
+
+
+class CancellationToken:
+    """
+    Thread-safe request to stop a model call.
+
+    Cancelling runs the registered callbacks at once; a streaming model call
+    registers the close of its event-stream body, which releases the HTTP
+    connection and stops Bedrock from generating (and billing) more tokens.
+    A token is meant for one user turn.
+    """
+
+    def __init__(self) -> None:
+        self.saved_tokens = 0
+        self.__event = threading.Event()
+        self.__callbacks: List[Callable[[], None]] = []
+        self.__lock = threading.Lock()
+
+
+    @property
+    def cancelled(self) -> bool:
+        return self.__event.is_set()
+
+
+    def cancel(self) -> None:
+        with self.__lock:
+            if self.__event.is_set():
+                return
+            self.__event.set()
+            callbacks, self.__callbacks = self.__callbacks, []
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception:
+                # The stream may already be closed or finished
+                pass
+
+
+    def on_cancel(self, callback: Callable[[], None]) -> None:
+        """
+        Register a callback run on cancellation, right away if already cancelled.
+        """
+        with self.__lock:
+            if not self.__event.is_set():
+                self.__callbacks.append(callback)
+                return
+        callback()
+
+
+    def record_saved(self, max_tokens: int, generated_tokens: int) -> None:
+        """
+        Record the output tokens a cancelled call did not generate.
+
+        The model may have stopped earlier on its own, so it is an upper bound.
+        """
+        self.saved_tokens += max(max_tokens - generated_tokens, 0)
+
+
+@contextmanager
+def cancel_on_interrupt(token: CancellationToken = None) -> Iterator[CancellationToken]:
+    """
+    Make Ctrl-C cancel the model call instead of killing the CLI.
+
+    A second Ctrl-C raises KeyboardInterrupt as usual. Only usable from the
+    main thread, where Python runs signal handlers.
+
+    @param token: Token to cancel, a new one by default.
+    @return: The token.
+    """
+    token = token or CancellationToken()
+
+    def interrupt(signum, frame):
+        if token.cancelled:
+            raise KeyboardInterrupt
+        token.cancel()
+
+    previous = signal.signal(signal.SIGINT, interrupt)
+    try:
+        yield token
+    finally:
+        signal.signal(signal.SIGINT, previous)
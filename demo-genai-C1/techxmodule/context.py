@@ -0,0 +1,162 @@
+import random
+
+from typing import List, Dict, Tuple
+from techxmodule import utils
+from techxmodule.retrieval import tokenize
+
+
+class ContextPacker:
+    """
+    Select knowledge base results that fit a token budget.
+
+    Results are filtered by relevance, near-duplicate chunks (overlapping
+    windows, the same passage indexed twice) are dropped with MinHash over
+    word shingles, and the remaining ones are added greedily by score per
+    token, optionally with maximal marginal relevance (MMR) to favour
+    documents that add something new.
+    """
+
+    # Tokens spent on the <document>, <source> and <document_content> tags of one result
+    DOCUMENT_OVERHEAD = 16
+    NUM_HASHES = 32
+
+
+    def __init__(self, token_budget: int = 8000,
+                 min_relevance: float = 0.5,
+                 duplicate_threshold: float = 0.8,
+                 shingle_size: int = 5,
+                 mmr_lambda: float = None) -> None:
+        """
+        @param token_budget: Maximum estimated tokens of all packed documents.
+        @param min_relevance: Minimum relevance score for including a result.
+        @param duplicate_threshold: Estimated Jaccard similarity above which
+                                    a result is a duplicate of a better one.
+        @param shingle_size: Number of words per shingle.
+        @param mmr_lambda: Relevance/diversity trade-off in [0, 1] for MMR.
+                           None disables MMR.
+        """
+        self.token_budget = token_budget
+        self.min_relevance = min_relevance
+        self.duplicate_threshold = duplicate_threshold
+        self.shingle_size = shingle_size
+        self.mmr_lambda = mmr_lambda
+        rng = random.Random(0)
+        self.__masks = [rng.getrandbits(64) for _ in range(self.NUM_HASHES)]
+
+
+    def pack(self, results: List[Dict],
+             min_relevance: float = None) -> Tuple[List[Dict], Dict]:
+        """
+        Choose which retrieval results go into the context.
+
+        @param results: `retrievalResults` from a knowledge base query.
+        @param min_relevance: Overrides the packer's minimum relevance score.
+        @return: The selected results in their original order, and a report
+                 with the number of documents and tokens kept and dropped.
+        """
+        if min_relevance is None:
+            min_relevance = self.min_relevance
+        candidates = []
+        dropped_tokens = 0
+        for result in results:
+            tokens = self.DOCUMENT_OVERHEAD + \
+                utils.estimate_tokens(result["content"]["text"]) + \
+                utils.estimate_tokens(utils.iterate_through_location(result["location"]))
+            if result["score"] < min_relevance:
+                dropped_tokens += tokens
+                continue
+            candidates.append({
+                "result": result,
+                "tokens": tokens,
+                "signature": self.signature(result["content"]["text"])
+            })
+
+        # Highest scores first so the kept copy of a duplicate is the best one
+        candidates.sort(key=lambda c: c["result"]["score"], reverse=True)
+        unique = []
+        duplicates = 0
+        for candidate in candidates:
+            if any(self.similarity(candidate["signature"], kept["signature"]) >= self.duplicate_threshold
+                   for kept in unique):
+                duplicates += 1
+                dropped_tokens += candidate["tokens"]
+                continue
+            unique.append(candidate)
+
+        selected = self.__select(unique)
+        selected_ids = {id(c) for c in selected}
+        dropped_tokens += sum(c["tokens"] for c in unique if id(c) not in selected_ids)
+
+        order = {id(result): i for i, result in enumerate(results)}
+        packed = sorted((c["result"] for c in selected), key=lambda r: order[id(r)])
+        report = {
+            "kept_documents": len(packed),
+            "dropped_documents": len(results) - len(packed),
+            "duplicates": duplicates,
+            "kept_tokens": sum(c["tokens"] for c in selected),
+            "dropped_tokens": dropped_tokens
+        }
+        return packed, report
+
+
+    @staticmethod
+    def describe(report: Dict) -> str:
+        """
+        One line summary of a pack report.
+        """
+        return (f"Packed {report['kept_documents']} documents "
+                f"({report['kept_tokens']} tokens kept, "
+                f"{report['dropped_tokens']} tokens dropped)")
+
+
+    def __select(self, candidates: List[Dict]) -> List[Dict]:
+        """
+        Greedily fill the budget by score per token (or MMR gain per token).
+        """
+        budget = self.token_budget
+        if self.mmr_lambda is None:
+            selected = []
+            for candidate in sorted(candidates,
+                                    key=lambda c: c["result"]["score"] / c["tokens"],
+                                    reverse=True):
+                if candidate["tokens"] <= budget:
+                    selected.append(candidate)
+                    budget -= candidate["tokens"]
+            return selected
+
+        selected = []
+        remaining = [c for c in candidates if c["tokens"] <= budget]
+        while remaining:
+            def gain(candidate):
+                redundancy = max((self.similarity(candidate["signature"], s["signature"])
+                                  for s in selected), default=0.0)
+                relevance = self.mmr_lambda * candidate["result"]["score"] - \
+                    (1 - self.mmr_lambda) * redundancy
+                return relevance / candidate["tokens"]
+
+            best = max(remaining, key=gain)
+            selected.append(best)
+            budget -= best["tokens"]
+            remaining = [c for c in remaining if c is not best and c["tokens"] <= budget]
+        return selected
+
+
+    def signature(self, text: str) -> List[int]:
+        """
+        MinHash signature of the word shingles of a text.
+
+        Each of the hash functions is the shingle hash XOR-ed with a random mask.
+        """
+        words = tokenize(text, bigrams=False)
+        size = self.shingle_size
+        hashes = {hash(" ".join(words[i:i + size]))
+                  for i in range(max(len(words) - size + 1, 1))}
+        return [min(h ^ mask for h in hashes) for mask in self.__masks]
+
+
+    @staticmethod
+    def similarity(a: List[int], b: List[int]) -> float:
+        """
+        Estimated Jaccard similarity of two MinHash signatures.
+        """
+        return sum(x == y for x, y in zip(a, b)) / len(a)
@@ -1,5 +1,13 @@
+import inspect
+import json
+import re
+import string
+import typing
+
+from functools import wraps
 from techxmodule import utils
-from typing import List, Dict
+from techxmodule.toolcalls import ToolCallError
+from typing import List, Dict, Any, Callable, Iterable, Optional
 
 
 class Guardrail:
@@ -13,12 +21,97 @@ class Guardrail:
         return len(user_input.strip()) > 0
 
 
+class PromptTemplate:
+    """
+    A prompt template parsed once into literal text and dynamic slots.
+
+    Static slots are rendered into the literal text at construction,
+    so rendering only joins the literals with the values of the dynamic slots.
+    """
+
+    def __init__(self, template: str, **static: str) -> None:
+        """
+        @param template: Template text with `{slot}` placeholders.
+        @param static: Values of the slots that never change, rendered now.
+        """
+        self.__literals = [""]
+        self.__slots = []
+        for literal, slot, _, _ in string.Formatter().parse(template):
+            self.__literals[-1] += literal
+            if slot is None:
+                continue
+            if slot in static:
+                self.__literals[-1] += str(static[slot])
+            else:
+                self.__slots.append(slot)
+                self.__literals.append("")
+
+
+    def render(self, **slots: Any) -> str:
+        """
+        Fill the dynamic slots.
+
+        @return: The rendered prompt.
+        """
+        parts = [self.__literals[0]]
+        for slot, literal in zip(self.__slots, self.__literals[1:]):
+            parts.append(str(slots[slot]))
+            parts.append(literal)
+        return "".join(parts)
+
+
 class Prompts:
     
+    LLAMA_CONTEXT_HEADER = """
+                            Here is context:\n
+                            --------------------\n
+                         """
+    LLAMA_CONTEXT_FOOTER = """
+                            --------------------\n
+                            End of the context.\n
+                         """
+    LLAMA_EXAMPLE_HEADER = "Here is some examples:\n"
+    LLAMA_TOOL_HEADER = """
+                        You are an expert in composing functions. You are given a set of possible functions.
+                        Based on the question, you will need to make one or more function/tool calls to achieve the purpose.
+                        If none of the function can be used, point it out. 
+                        If the given question lacks the parameters required by the function, also point it out. 
+                        You should only return the function call in tools call sections.
+
+                        If you decide to invoke any of the function(s), you MUST put it in the format of [func_name1(params_name1=params_value1, params_name2=params_value2...), func_name2(params)]
+                        You SHOULD NOT include any other text in the response.
+
+                        Here is a list of functions in JSON format that you can invoke.
+                      """
+    LLAMA_HISTORY = """
+            Here is the chat histories between human and assistant, inside <histories></histories> XML tags.
+            
+            <histories>
+            {}
+            </histories>
+            """
+    LLAMA_TEMPLATE = """
+            <|begin_of_text|><|start_header_id|>system<|end_header_id|>
+            
+            {instruction}
+            {tool_list}
+            {context}
+            {example}
+            {history}
+            
+            <|eot_id|><|start_header_id|>user<|end_header_id|>
+            
+            {user_prompt}<|eot_id|><|start_header_id|>assistant<|end_header_id|>
+        """
+    
     def __init__(self, model: any = None) -> None:
         """
         Initializes the Prompts class with an optional model.
 
+        The template of the model is compiled once here: static sections
+        (tool instructions, default CoT, history wrapper) are pre-rendered
+        and only the dynamic slots are filled on each build.
+
         @param model: An optional model object. If provided, it should have a `name` attribute.
                       If no model is provided, `_prompt_type` is set to "None".
 
@@ -31,6 +124,25 @@ class Prompts:
         else:
             self.__prompt_type = model.name
 
+        self.__build_prompt_fn = {
+            "claude": self.__build_claude_prompt,
+            "llama": self.__build_llama_prompt,
+        }.get(self.__prompt_type, 
+              self.__build_default_prompt)
+
+        if self.__prompt_type == "claude":
+            self.__default_cot_prompt = self.__model.build_cot_prompt(None)
+        elif self.__prompt_type == "llama":
+            history = self.LLAMA_HISTORY \
+                if self.__model.memory.max_chat_message > 0 else ""
+            self.__llama_template = PromptTemplate(self.LLAMA_TEMPLATE, history=history)
+            self.__llama_context = PromptTemplate(utils.combine_string([
+                self.LLAMA_CONTEXT_HEADER, "{prompt}", self.LLAMA_CONTEXT_FOOTER]))
+            self.__llama_example = PromptTemplate(utils.combine_string([
+                self.LLAMA_EXAMPLE_HEADER, "{prompt}", ""]))
+            self.__llama_tools = PromptTemplate(utils.combine_string([
+                self.LLAMA_TOOL_HEADER, "{prompt}", ""]))
+
 
     def build(self, user: str, 
               context = "", 
@@ -56,19 +168,57 @@ class Prompts:
             str: A combined prompt as a single string.
         """
 
-        build_prompt_fn = {
-            "claude": self.__build_claude_prompt,
-            "llama": self.__build_llama_prompt,
-        }.get(self.__prompt_type, 
-              self.__build_default_prompt)
-
-        return build_prompt_fn(
+        return self.__build_prompt_fn(
             user, 
             context, 
             example, 
             instruction)
 
 
+    def build_system(self, instruction: str = "", 
+                     tools: List[Dict] = None) -> str:
+        """Builds a system prompt that carries the tool instructions, 
+        for chat transcripts that keep the system prompt apart.
+        
+        Args:
+            instruction (str):
+                Role or personality instruction.
+                Default is empty string.
+            tools (List[Dict]):
+                Tool schemas the model can call.
+                Default is None.
+        Returns:
+            str: The system prompt.
+        """
+        if not tools or self.__prompt_type != "llama":
+            return instruction
+        return utils.combine_string([
+            instruction, 
+            self.__llama_tools.render(prompt=json.dumps(tools, ensure_ascii=False))
+        ])
+
+
+    def build_many(self, prompts: Iterable[Dict[str, Any]]) -> List[str]:
+        """Builds many prompts at once, for offline batch jobs.
+
+        Args:
+            prompts (Iterable[Dict[str, Any]]): 
+                Keyword arguments of `build` for each prompt
+                ("user", and optionally "context", "example", "instruction").
+        Returns:
+            List[str]: The combined prompts, in the same order.
+        """
+        build_prompt_fn = self.__build_prompt_fn
+        return [
+            build_prompt_fn(
+                prompt["user"], 
+                prompt.get("context", ""), 
+                prompt.get("example", ""), 
+                prompt.get("instruction"))
+            for prompt in prompts
+        ]
+
+
     def __build_claude_prompt(self, 
                               user_prompt: str, 
                               context_prompt = "", 
@@ -82,7 +232,8 @@ class Prompts:
         prompt = utils.combine_string([
             self.__model.build_context_prompt(context_prompt),
             self.__model.build_user_prompt(user_prompt),
-            self.__model.build_cot_prompt(instruction),
+            self.__model.build_cot_prompt(instruction) 
+                if instruction else self.__default_cot_prompt,
             self.__model.build_example_prompt(example_prompt)
         ])
         
@@ -97,65 +248,18 @@ class Prompts:
                              tools: List[Dict] = None) -> str:
         """
         Builds a prompt specifically for the Llama model 
-        using the utility functions from the model.
+        from the pre-compiled templates.
         """
         
-        def format(prompt, text, footer=""):
-            if prompt:
-                return utils.combine_string([
-                text, f"{prompt}", footer
-                ])
-            else: return ""
-            
-        context = format(context_prompt,
-                         """
-                            Here is context:\n
-                            --------------------\n
-                         """, 
-                         """
-                            --------------------\n
-                            End of the context.\n
-                         """)
-        example = format(example_prompt,
-                         "Here is some examples:\n")
-        tool_list = format(tools,
-                      """
-                        You are an expert in composing functions. You are given a set of possible functions.
-                        Based on the question, you will need to make one or more function/tool calls to achieve the purpose.
-                        If none of the function can be used, point it out. 
-                        If the given question lacks the parameters required by the function, also point it out. 
-                        You should only return the function call in tools call sections.
-
-                        If you decide to invoke any of the function(s), you MUST put it in the format of [func_name1(params_name1=params_value1, params_name2=params_value2...), func_name2(params)]
-                        You SHOULD NOT include any other text in the response.
-
-                        Here is a list of functions in JSON format that you can invoke.
-                      """)
-        
-        if self.__model.memory.max_chat_message > 0:
-            history = """
-            Here is the chat histories between human and assistant, inside <histories></histories> XML tags.
-            
-            <histories>
-            {}
-            </histories>
-            """
-        else: history = ""
+        def format(template, prompt):
+            return template.render(prompt=prompt) if prompt else ""
         
-        # Format prompt
-        return f"""
-            <|begin_of_text|><|start_header_id|>system<|end_header_id|>
-            
-            {instruction}
-            {tool_list}
-            {context}
-            {example}
-            {history}
-            
-            <|eot_id|><|start_header_id|>user<|end_header_id|>
-            
-            {user_prompt}<|eot_id|><|start_header_id|>assistant<|end_header_id|>
-        """
+        return self.__llama_template.render(
+            instruction=instruction,
+            tool_list=format(self.__llama_tools, tools),
+            context=format(self.__llama_context, context_prompt),
+            example=format(self.__llama_example, example_prompt),
+            user_prompt=user_prompt)
     
 
     def __build_default_prompt(self, 
@@ -178,6 +282,188 @@ class Prompts:
         return utils.sanitize_input(prompt)
 
 
+class ToolRegistry:
+    """
+    Registry of the tool functions the models can call.
+
+    The `input_schema` of a tool is generated from the signature and the
+    docstring of its function when it is registered, so it can not drift
+    from the code. A validator is compiled at the same time: a call with
+    missing, unknown or mistyped parameters is rejected before the tool
+    runs, without any network work.
+
+    A tool may take a `deadline` parameter, left out of the schema: the
+    models pass it the Deadline of the turn.
+    """
+
+    JSON_TYPES = {str: "string", int: "integer", float: "number", bool: "boolean",
+                  list: "array", tuple: "array", dict: "object"}
+    PYTHON_TYPES = {"string": (str,), "integer": (int,), "number": (int, float),
+                    "boolean": (bool,), "array": (list,), "object": (dict,)}
+    PARAM_PATTERN = re.compile(r"^\s*[@:]param\s+(\w+)\s*:\s*(.*)$")
+    SECTION_PATTERN = re.compile(r"^\s*(@\w+|:\w+|Args:|Returns?:|Raises:)")
+    # Parameters given by the caller, not by the model
+    CALLER_PARAMETERS = ("deadline",)
+
+
+    def __init__(self) -> None:
+        self.__functions: Dict[str, Callable] = {}
+        self.__schemas: Dict[str, Dict] = {}
+        self.__validators: Dict[str, Callable[[Dict], None]] = {}
+        self.__takes_deadline: Dict[str, bool] = {}
+
+
+    def register(self, function: Callable, name: str = None) -> Callable:
+        """
+        Register a tool function, replacing any tool of the same name.
+
+        @param function: Tool function, called with the parameters as keywords.
+        @param name: Tool name, the function name by default.
+        @return: The function.
+        """
+        name = name or function.__name__
+        schema = self.schema_of(function, name)
+        self.__schemas[name] = schema
+        self.__validators[name] = self.__compile(name, schema["input_schema"])
+        self.__functions[name] = function
+        self.__takes_deadline[name] = "deadline" in inspect.signature(inspect.unwrap(function)).parameters
+        return function
+
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.__functions
+
+
+    def get(self, name: str) -> Callable:
+        """
+        @raises ToolCallError: If no tool has this name.
+        """
+        function = self.__functions.get(name)
+        if function is None:
+            raise ToolCallError(f"Unknown tool: {name}")
+        return function
+
+
+    def takes_deadline(self, name: str) -> bool:
+        return self.__takes_deadline.get(name, False)
+
+
+    def schemas(self, names: Iterable[str] = None) -> List[Dict]:
+        """
+        Tool schemas in the Claude layout, all registered tools by default.
+        """
+        return [self.__schemas[name] for name in (names or self.__schemas)]
+
+
+    def validate(self, name: str, parameters: Dict) -> None:
+        """
+        @raises ToolCallError: If the tool is unknown or the parameters do not match.
+        """
+        validator = self.__validators.get(name)
+        if validator is None:
+            raise ToolCallError(f"Unknown tool: {name}")
+        validator(parameters)
+
+
+    @classmethod
+    def schema_of(cls, function: Callable, name: str = None) -> Dict:
+        """
+        Generate the schema of a function from its signature and docstring.
+
+        The description is the docstring without its parameter and return
+        sections; parameters are described by their `@param` (or `:param`) lines.
+        """
+        function = inspect.unwrap(function)
+        description, params = cls.__parse_docstring(inspect.getdoc(function) or "")
+        properties, required = {}, []
+        for parameter in inspect.signature(function).parameters.values():
+            if parameter.kind in (parameter.VAR_POSITIONAL, parameter.VAR_KEYWORD) \
+                    or parameter.name in cls.CALLER_PARAMETERS:
+                continue
+            # Unannotated parameters are strings, like most model inputs
+            hint = str if parameter.annotation is parameter.empty else parameter.annotation
+            optional = type(None) in typing.get_args(hint)
+            properties[parameter.name] = cls.__json_type(hint)
+            if parameter.name in params:
+                properties[parameter.name]["description"] = params[parameter.name]
+            if parameter.default is parameter.empty and not optional:
+                required.append(parameter.name)
+        return {
+            "name": name or function.__name__,
+            "description": description,
+            "input_schema": {"type": "object", "properties": properties, "required": required},
+        }
+
+
+    @classmethod
+    def __json_type(cls, hint: Any) -> Dict:
+        origin = typing.get_origin(hint) or hint
+        args = [arg for arg in typing.get_args(hint) if arg is not type(None)]
+        if origin is typing.Union:
+            return cls.__json_type(args[0]) if len(args) == 1 else {}
+        json_type = cls.JSON_TYPES.get(origin, "string")
+        schema = {"type": json_type}
+        if json_type == "array" and args:
+            schema["items"] = cls.__json_type(args[0])
+        return schema
+
+
+    @classmethod
+    def __parse_docstring(cls, docstring: str) -> tuple:
+        description, params, current = [], {}, None
+        for line in docstring.splitlines():
+            match = cls.PARAM_PATTERN.match(line)
+            if match:
+                current = match.group(1)
+                params[current] = match.group(2).strip()
+            elif cls.SECTION_PATTERN.match(line):
+                current = ""
+            elif current is None:
+                description.append(line)
+            elif current and line.strip():
+                params[current] += " " + line.strip()
+        return "\n".join(description).strip(), params
+
+
+    @classmethod
+    def __compile(cls, name: str, input_schema: Dict) -> Callable[[Dict], None]:
+        properties = input_schema["properties"]
+        required = tuple(input_schema["required"])
+        checks = {parameter: cls.__compile_type(schema) for parameter, schema in properties.items()}
+
+        def validate(parameters: Dict) -> None:
+            missing = [parameter for parameter in required if parameter not in parameters]
+            if missing:
+                raise ToolCallError(f"Tool {name} is missing parameters: {', '.join(missing)}")
+            for parameter, value in parameters.items():
+                check = checks.get(parameter)
+                if check is None:
+                    raise ToolCallError(f"Tool {name} has no parameter {parameter}")
+                if not check(value):
+                    raise ToolCallError(f"Parameter {parameter} of tool {name} "
+                                        f"must be of type {properties[parameter]['type']}")
+        return validate
+
+
+    @classmethod
+    def __compile_type(cls, schema: Dict) -> Callable[[Any], bool]:
+        if "type" not in schema:
+            return lambda value: True
+        types = cls.PYTHON_TYPES[schema["type"]]
+        # bool is an int for Python, not for JSON
+        exclude_bool = schema["type"] in ("integer", "number")
+        item_check = cls.__compile_type(schema["items"]) if "items" in schema else None
+
+        def check(value: Any) -> bool:
+            if not isinstance(value, types) or (exclude_bool and isinstance(value, bool)):
+                return False
+            return item_check is None or all(item_check(item) for item in value)
+        return check
+
+
+registry = ToolRegistry()
+
+
 class Tools:
     """
     A utility class designed to manage and apply decorators to functions interacting with specific tools.
@@ -193,16 +479,19 @@ class Tools:
         pass
 
     @staticmethod
-    def tool(action: str, data_type: str):
+    def tool(action: str, data_type: str, tool_registry: Optional[ToolRegistry] = None):
         """
-        Decorator generator that adds metadata to the result of the decorated function.
+        Decorator generator that adds metadata to the result of the decorated function,
+        and registers the function as a tool.
 
         @param action: The action the tool performs (e.g., "fetch_data").
         @param data_type: The type of data the tool returns (e.g., "text").
+        @param tool_registry: Registry of the tool, the shared `registry` by default.
 
         @return: A decorator function that wraps the original function, adding metadata to its output.
         """
         def tool_decorator(func):
+            @wraps(func)
             def wrapper(*args, **kwargs):
                 try:
                     result = func(*args, **kwargs)
@@ -217,5 +506,6 @@ class Tools:
                         "type": "parameterError",
                         "action": action
                     }
+            (tool_registry or registry).register(wrapper)
             return wrapper
         return tool_decorator
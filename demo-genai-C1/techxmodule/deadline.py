@@ -0,0 +1,67 @@
+import time
+
+from typing import Optional
+
+
+class Deadline:
+    """
+    Time and tool round budget of one agent turn.
+
+    The deadline is passed to `invoke`, `tool_use` and the tools: each
+    network call of a tool gets the smaller of its own timeout and the time
+    left, and `tool_use` stops waiting for tools once the time is up. When
+    the budget is spent, the next `invoke` asks the model for a final answer
+    instead of more tool calls. Meant for one user turn.
+
+    @param seconds: Time budget of the turn, None for unlimited.
+    @param max_rounds: Tool rounds the turn may run, None for unlimited.
+    """
+
+    def __init__(self, seconds: Optional[float] = None, max_rounds: Optional[int] = None) -> None:
+        self.seconds = seconds
+        self.max_rounds = max_rounds
+        self.rounds = 0
+        self.__end = None if seconds is None else time.monotonic() + seconds
+
+
+    @property
+    def remaining(self) -> Optional[float]:
+        """
+        Seconds left, never negative, None without time budget.
+        """
+        if self.__end is None:
+            return None
+        return max(self.__end - time.monotonic(), 0.0)
+
+
+    @property
+    def expired(self) -> bool:
+        return self.__end is not None and time.monotonic() >= self.__end
+
+
+    @property
+    def spent(self) -> bool:
+        """
+        The time is up or the turn ran all its tool rounds.
+        """
+        return self.expired or (self.max_rounds is not None and self.rounds >= self.max_rounds)
+
+
+    def count_round(self) -> None:
+        self.rounds += 1
+
+
+    def timeout(self, default: float, minimum: float = 1.0) -> float:
+        """
+        Timeout of one call: its default, shortened to the time left.
+
+        @param minimum: Lower bound, so a call made right at the deadline fails fast instead of at once.
+        """
+        remaining = self.remaining
+        if remaining is None:
+            return default
+        return max(min(default, remaining), minimum)
+
+
+# Deadline of tools called without one
+NO_DEADLINE = Deadline()
@@ -1,24 +1,305 @@
-from typing import Any
+import asyncio
+import inspect
+import threading
+import time
+import weakref
+
+from collections import deque
+from fnmatch import fnmatchcase
+from typing import Any, Callable, Dict, List, Optional
+from termcolor import cprint    # type: ignore
+
+
+# Topics published by the model and tool layers
+TOKEN = "token"             # {"model", "text"}
+TOOL_START = "tool_start"   # {"model", "id", "name", "input"}
+TOOL_END = "tool_end"       # {"model", "id", "name", "seconds", "error"}
+USAGE = "usage"             # {"model", "model_id", "session_id", "iteration", "input_tokens",
+                            #  "output_tokens", "cache_read_tokens", "cache_write_tokens", "cost"}
+ERROR = "error"             # {"model", "error"}
+CONTEXT_PACKED = "context_packed"   # {"model", "kept_documents", "dropped_documents", "duplicates",
+                                    #  "kept_tokens", "dropped_tokens"}
+
+DROP = "drop"
+BLOCK = "block"
 
 
 class Event:
-    
+    """
+    A published event.
+
+    @param event_id: topic of the event, such as "token" or "tool_end"
+    @param data: payload of the event
+    """
+
+    __slots__ = ("id", "data", "time")
+
     def __init__(self, event_id: str, data: Any) -> None:
         self.id = event_id
-        self.data = Any
+        self.data = data
+        self.time = time.time()
+
+
+class Subscription:
+    """
+    A subscriber with its own bounded queue of events.
+
+    Events are delivered in order by a worker of the subscription: a thread
+    for plain callbacks, a task on an event loop for coroutine functions, so
+    a slow subscriber only ever delays itself. When the queue is full the
+    event is dropped (and counted in `dropped`) or, with the block policy,
+    the publisher waits for room. A coroutine subscriber's queue is only
+    drained by its event loop, so an event published from that loop's own
+    thread is dropped instead of blocking, which would deadlock the loop.
+    """
+
+    def __init__(self, bus: "EventBus", pattern: str, callback: Callable,
+                 maxsize: int, policy: str, weak: Optional[bool],
+                 loop: Optional[asyncio.AbstractEventLoop]) -> None:
+        if policy not in (DROP, BLOCK):
+            raise ValueError(f"Invalid queue policy: {policy}")
+        self.pattern = pattern
+        self.maxsize = maxsize
+        self.policy = policy
+        self.dropped = 0
+        self.active = True
+        self.is_async = inspect.iscoroutinefunction(callback)
+        self.__bus = weakref.ref(bus)
+        self.__buffer = deque()
+        self.__condition = threading.Condition()
+        self.__loop = loop
+        self.__wakeup: Optional[asyncio.Event] = None
+
+        # Bound methods are weakly referenced by default, so a subscribed object can be collected
+        if weak is None:
+            weak = inspect.ismethod(callback)
+        if not weak:
+            self.__callback = lambda: callback
+        elif inspect.ismethod(callback):
+            self.__callback = weakref.WeakMethod(callback, self.__collected)
+        else:
+            self.__callback = weakref.ref(callback, self.__collected)
+
+
+    def matches(self, topic: str) -> bool:
+        return fnmatchcase(topic, self.pattern)
+
+
+    def offer(self, event: Event) -> bool:
+        """
+        Queue an event, from the publishing thread.
+
+        @return: False if the event was dropped.
+        """
+        # Waiting on the thread of the loop that drains the queue would never end
+        block = self.policy == BLOCK and not (self.is_async and self.__in_loop_thread())
+        with self.__condition:
+            while len(self.__buffer) >= self.maxsize:
+                if not block or not self.active:
+                    self.dropped += 1
+                    return False
+                self.__condition.wait()
+            self.__buffer.append(event)
+            self.__condition.notify_all()
+        if self.is_async:
+            self.__loop.call_soon_threadsafe(self.__wakeup.set)
+        return True
+
+
+    def pending(self) -> int:
+        with self.__condition:
+            return len(self.__buffer)
+
+
+    def close(self) -> None:
+        """
+        Stop the delivery; events still queued are discarded.
+        """
+        bus = self.__bus()
+        if bus is not None:
+            bus.unsubscribe(self)
+        with self.__condition:
+            self.active = False
+            self.__buffer.clear()
+            self.__condition.notify_all()
+        if self.is_async and not self.__loop.is_closed():
+            self.__loop.call_soon_threadsafe(self.__wakeup.set)
+
+
+    def _start(self) -> None:
+        if self.is_async:
+            def start_task():
+                self.__wakeup = asyncio.Event()
+                self.__loop.create_task(self.__deliver_async())
+            # The wakeup event must be created on its loop before any offer
+            if self.__in_loop_thread():
+                start_task()
+                return
+            ready = threading.Event()
+            self.__loop.call_soon_threadsafe(lambda: (start_task(), ready.set()))
+            ready.wait()
+        else:
+            threading.Thread(target=self.__deliver, name=f"event-subscriber-{self.pattern}",
+                             daemon=True).start()
+
+
+    def __in_loop_thread(self) -> bool:
+        try:
+            return asyncio.get_running_loop() is self.__loop
+        except RuntimeError:
+            return False
+
+
+    def __take(self) -> Optional[Event]:
+        with self.__condition:
+            if not self.__buffer:
+                return None
+            event = self.__buffer.popleft()
+            self.__condition.notify_all()
+            return event
+
+
+    def __deliver(self) -> None:
+        while True:
+            with self.__condition:
+                while self.active and not self.__buffer:
+                    self.__condition.wait()
+                if not self.active:
+                    return
+            event = self.__take()
+            callback = self.__callback()
+            if callback is None:
+                return
+            try:
+                callback(event)
+            except Exception as e:
+                cprint(f"Event subscriber of {self.pattern} failed: {e}", "red")
+            # Do not keep a weakly referenced subscriber alive while waiting
+            del callback
+
+
+    async def __deliver_async(self) -> None:
+        while self.active:
+            await self.__wakeup.wait()
+            self.__wakeup.clear()
+            while self.active:
+                event = self.__take()
+                if event is None:
+                    break
+                callback = self.__callback()
+                if callback is None:
+                    return
+                try:
+                    await callback(event)
+                except Exception as e:
+                    cprint(f"Event subscriber of {self.pattern} failed: {e}", "red")
+                del callback
+
+
+    def __collected(self, _) -> None:
+        # Called by the weak reference once the subscriber is garbage collected
+        self.close()
 
 
 class EventBus:
-    
+    """
+    Publish/subscribe bus that never runs subscribers in the publisher's thread.
+
+    Topics are matched with shell-style wildcards ("tool_*", "*"). Publishing
+    only appends the event to the queue of each matching subscriber, so the
+    token stream of a model is not slowed down by loggers or network sinks.
+    """
+
     def __init__(self) -> None:
-        self.subscribers = {}
-        
-    def subscribe(self, event_type: str, callback) -> None:
-        if event_type not in self.subscribers:
-            self.subscribers[event_type] = []
-        self.subscribers[event_type].append(callback)
-    
+        self.subscribers: List[Subscription] = []
+        self.__matches: Dict[str, List[Subscription]] = {}
+        # Reentrant: a collected weak subscriber unsubscribes itself from whatever code runs the GC
+        self.__lock = threading.RLock()
+        self.__loop: Optional[asyncio.AbstractEventLoop] = None
+
+
+    def subscribe(self, event_type: str, callback: Callable,
+                  maxsize: int = 1024,
+                  policy: str = DROP,
+                  weak: Optional[bool] = None,
+                  loop: Optional[asyncio.AbstractEventLoop] = None) -> Subscription:
+        """
+        Subscribe to a topic.
+
+        @param event_type: Topic or wildcard pattern.
+        @param callback: Function or coroutine function called with each Event.
+        @param maxsize: Maximum number of events waiting for this subscriber.
+        @param policy: DROP new events when the queue is full, or BLOCK the publisher
+                       (except on the event loop of a coroutine subscriber, where it drops).
+        @param weak: Keep only a weak reference to the callback. Defaults to
+                     True for bound methods and False for functions.
+        @param loop: Event loop of a coroutine subscriber. Defaults to the
+                     running loop, or a loop thread owned by the bus.
+        @return: The subscription, `close()` it to unsubscribe.
+        """
+        if inspect.iscoroutinefunction(callback) and loop is None:
+            try:
+                loop = asyncio.get_running_loop()
+            except RuntimeError:
+                loop = self.__background_loop()
+        subscription = Subscription(self, event_type, callback, maxsize, policy, weak, loop)
+        subscription._start()
+        with self.__lock:
+            self.subscribers = self.subscribers + [subscription]
+            self.__matches = {}
+        return subscription
+
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        with self.__lock:
+            self.subscribers = [s for s in self.subscribers if s is not subscription]
+            self.__matches = {}
+
+
     def publish(self, event_type: str, data: Any) -> None:
-        if event_type in self.subscribers:
-            for callback in self.subscribers[event_type]:
-                callback(data)
+        """
+        Queue an event for every subscriber of its topic.
+        """
+        if not self.subscribers:
+            return
+        matches = self.__matches.get(event_type)
+        if matches is None:
+            with self.__lock:
+                matches = [s for s in self.subscribers if s.matches(event_type)]
+                self.__matches[event_type] = matches
+        if not matches:
+            return
+        event = Event(event_type, data)
+        for subscription in matches:
+            subscription.offer(event)
+
+
+    def flush(self, timeout: float = 5.0) -> bool:
+        """
+        Wait until every subscriber has taken its queued events.
+
+        @return: False if the timeout expired first.
+        """
+        deadline = time.monotonic() + timeout
+        while any(s.pending() for s in self.subscribers):
+            if time.monotonic() > deadline:
+                return False
+            time.sleep(0.005)
+        return True
+
+
+    def close(self) -> None:
+        for subscription in list(self.subscribers):
+            subscription.close()
+        if self.__loop is not None:
+            self.__loop.call_soon_threadsafe(self.__loop.stop)
+            self.__loop = None
+
+
+    def __background_loop(self) -> asyncio.AbstractEventLoop:
+        with self.__lock:
+            if self.__loop is None:
+                self.__loop = asyncio.new_event_loop()
+                threading.Thread(target=self.__loop.run_forever, name="event-bus-loop",
+                                 daemon=True).start()
+            return self.__loop
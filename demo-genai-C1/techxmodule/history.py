@@ -0,0 +1,133 @@
+from techxmodule import utils
+from techxmodule.messages import ChatMessage, Message
+
+
+class HistorySanitizer:
+    """
+    Pipeline stage that shrinks the chat history resent on every request.
+
+    - Prompt scaffolding (<instructions>, <examples>, <context>, <documents>)
+      is stripped from every user question except the one being answered.
+    - Tool results of turns older than `keep_tool_results` are replaced with
+      a short placeholder, since retrieved documents are the bulk of the history.
+    - Images of turns older than `keep_images`, and images sent again in a
+      later message, are replaced with a placeholder (`sanitize_images`).
+
+    Each message is marked in `Message.marks` once it has been processed,
+    so it is never scanned again.
+    """
+
+    CLEANED = 1
+    COMPACTED = 2
+    IMAGES_REMOVED = 4
+    PLACEHOLDER = "[Tool result removed from history. Use the tool again if this data is needed.]"
+    IMAGE_PLACEHOLDER = "[Image removed from history.]"
+    REPEATED_IMAGE_PLACEHOLDER = "[Same image as sent again later in the conversation.]"
+
+
+    def __init__(self, keep_tool_results: int = 2, keep_images: int = 2) -> None:
+        """
+        @param keep_tool_results: Number of most recent turns (including the
+                                  current one) whose tool results are kept whole.
+        @param keep_images: Number of most recent turns whose images are kept.
+        """
+        self.keep_tool_results = keep_tool_results
+        self.keep_images = keep_images
+        self.saved_tokens = 0
+        self.saved_bytes = 0
+
+
+    def sanitize(self, memory: ChatMessage) -> int:
+        """
+        Clean every message that became old enough since the last call.
+
+        @param memory: Chat memory to sanitize in place.
+        @return: Estimated input tokens saved on each following request.
+        """
+        saved = 0
+        turn_age = 0
+        # Walk from the newest message, counting user questions to know each message's turn age
+        for i in range(len(memory.messages) - 1, -1, -1):
+            message = memory.messages[i]
+            if message.role != "user":
+                continue
+
+            if self.__is_tool_result(message):
+                if turn_age >= self.keep_tool_results and not message.marks & self.COMPACTED:
+                    saved += self.__compact_tool_results(message)
+                    message.marks |= self.COMPACTED
+                continue
+
+            turn_age += 1
+            if turn_age > 1 and not message.marks & self.CLEANED:
+                saved += self.__clean_text(message)
+                message.marks |= self.CLEANED
+
+        self.saved_tokens += saved
+        return saved
+
+
+    def sanitize_images(self, memory: ChatMessage) -> int:
+        """
+        Replace old and repeated images with a text placeholder.
+
+        Only the newest copy of an image is kept, so an image sent again stays
+        visible to the model however old its first copy is.
+
+        @param memory: Chat memory to sanitize in place.
+        @return: Payload bytes saved on each following request.
+        """
+        saved = 0
+        turn_age = 0
+        seen = set()
+        for i in range(len(memory.messages) - 1, -1, -1):
+            message = memory.messages[i]
+            if message.role == "user" and not self.__is_tool_result(message):
+                turn_age += 1
+            for block in message.content:
+                if block.type != "image":
+                    continue
+                if block.image.digest in seen:
+                    placeholder = self.REPEATED_IMAGE_PLACEHOLDER
+                elif turn_age > self.keep_images:
+                    placeholder = self.IMAGE_PLACEHOLDER
+                else:
+                    seen.add(block.image.digest)
+                    continue
+                saved += block.image.encoded_size - len(placeholder)
+                # The "Image N:" label before the block keeps the numbering readable
+                block.type, block.text, block.image = "text", placeholder, None
+                message.marks |= self.IMAGES_REMOVED
+
+        self.saved_bytes += saved
+        return saved
+
+
+    @staticmethod
+    def __is_tool_result(message: Message) -> bool:
+        return any(block.type == "tool_result" for block in message.content)
+
+
+    @staticmethod
+    def __clean_text(message: Message) -> int:
+        saved = 0
+        for block in message.content:
+            if block.type == "text":
+                clean_text = utils.clean_tag(block.text)
+                saved += utils.estimate_tokens(block.text) - utils.estimate_tokens(clean_text)
+                block.text = clean_text
+        return saved
+
+
+    def __compact_tool_results(self, message: Message) -> int:
+        saved = 0
+        placeholder_tokens = utils.estimate_tokens(self.PLACEHOLDER)
+        for block in message.content:
+            if block.type != "tool_result":
+                continue
+            tokens = utils.estimate_tokens(block.content)
+            # The tool_result block itself must stay, it answers a tool_use of the assistant
+            if tokens > placeholder_tokens:
+                block.content = self.PLACEHOLDER
+                saved += tokens - placeholder_tokens
+        return saved
@@ -0,0 +1,200 @@
+"""
+Shared HTTP layer of the tools.
+
+One keep-alive `requests.Session` per host, so repeated tool calls reuse
+their connections instead of paying a DNS lookup and a TLS handshake each
+time. Every request gets a timeout, idempotent requests are retried with
+exponential backoff on connection errors and 429/5xx answers, responses are
+gzip-compressed, and the latency of every host is measured.
+
+    from techxmodule.httppool import pool
+    pool.get("https://en.wikipedia.org/w/api.php", params={...}, timeout=10).json()
+    pool.get(url, timeout=deadline.timeout(15), retries=0)    # bounded by a deadline
+    await pool.aget(url)    # from async code, runs in a thread
+
+requests is imported on the first request, importing this module is free.
+"""
+import asyncio
+import threading
+import time
+
+from collections import deque
+from typing import Any, Dict, Optional
+from urllib.parse import urlsplit
+
+
+class HostMetrics:
+    """
+    Latency of the requests to one host, retries included.
+
+    @param window: Number of most recent latencies kept for the percentiles.
+    """
+
+    __slots__ = ("requests", "errors", "total_seconds", "latencies")
+
+    def __init__(self, window: int = 256) -> None:
+        self.requests = 0
+        self.errors = 0
+        self.total_seconds = 0.0
+        self.latencies = deque(maxlen=window)
+
+
+    def add(self, seconds: float, error: bool) -> None:
+        self.requests += 1
+        self.errors += error
+        self.total_seconds += seconds
+        self.latencies.append(seconds)
+
+
+    def to_dict(self) -> Dict:
+        latencies = sorted(self.latencies)
+        percentile = lambda p: latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000 if latencies else 0.0
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "mean_ms": self.total_seconds / self.requests * 1000 if self.requests else 0.0,
+            "p50_ms": percentile(0.5),
+            "p95_ms": percentile(0.95),
+        }
+
+
+class HttpPool:
+    """
+    Thread-safe pool of keep-alive sessions, one per host and retry count.
+
+    @param timeout: Default timeout in seconds of a request.
+    @param retries: Retries of a failed idempotent request, timeouts included.
+    @param backoff: Backoff factor, retry n waits backoff * 2^(n-1) seconds.
+    @param pool_size: Connections kept open per host, the number of tools calling it at once.
+    @param user_agent: User-Agent header, some APIs (Wikipedia) ask for one.
+    """
+
+    RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+    def __init__(self, timeout: float = 15,
+                 retries: int = 2,
+                 backoff: float = 0.3,
+                 pool_size: int = 8,
+                 user_agent: str = "techxmodule-tools/1.0") -> None:
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.pool_size = pool_size
+        self.user_agent = user_agent
+        self.__sessions: Dict[str, Any] = {}
+        self.__metrics: Dict[str, HostMetrics] = {}
+        self.__lock = threading.Lock()
+
+
+    def session(self, url: str, retries: Optional[int] = None) -> Any:
+        """
+        Keep-alive session of the host of a URL, created on first use.
+
+        @param retries: Retries of its requests, the pool default if None.
+        """
+        host = urlsplit(url).netloc
+        retries = self.retries if retries is None else retries
+        with self.__lock:
+            session = self.__sessions.get((host, retries))
+            if session is None:
+                session = self.__sessions[(host, retries)] = self.__new_session(retries)
+                self.__metrics.setdefault(host, HostMetrics())
+        return session
+
+
+    def request(self, method: str, url: str, timeout: Optional[float] = None,
+                retries: Optional[int] = None, **kwargs) -> Any:
+        """
+        Send a request through the session of its host.
+
+        Each retry waits for the full timeout again, so a request that must
+        end by a deadline should pass `retries=0`.
+
+        @param timeout: Seconds, the pool default if None.
+        @param retries: Retries of the request, the pool default if None.
+        @param kwargs: Passed to `requests.Session.request`.
+        @return: The `requests.Response`, error statuses included: some APIs
+                 explain the error in the body (WolframAlpha answers 501 to
+                 a query it does not understand).
+        """
+        session = self.session(url, retries)
+        host = urlsplit(url).netloc
+        start = time.perf_counter()
+        error = True
+        try:
+            response = session.request(method, url, timeout=timeout or self.timeout, **kwargs)
+            error = response.status_code >= 400
+            return response
+        finally:
+            self.__metrics[host].add(time.perf_counter() - start, error)
+
+
+    def get(self, url: str, timeout: Optional[float] = None,
+            retries: Optional[int] = None, **kwargs) -> Any:
+        return self.request("GET", url, timeout, retries, **kwargs)
+
+
+    def post(self, url: str, timeout: Optional[float] = None,
+             retries: Optional[int] = None, **kwargs) -> Any:
+        return self.request("POST", url, timeout, retries, **kwargs)
+
+
+    async def arequest(self, method: str, url: str, timeout: Optional[float] = None,
+                       retries: Optional[int] = None, **kwargs) -> Any:
+        """
+        `request` for async code, run in a thread so the event loop is not blocked.
+
+        Many requests can be awaited together with `asyncio.gather`, they
+        share the pooled connections of their hosts.
+        """
+        return await asyncio.to_thread(self.request, method, url, timeout, retries, **kwargs)
+
+
+    async def aget(self, url: str, timeout: Optional[float] = None,
+                   retries: Optional[int] = None, **kwargs) -> Any:
+        return await self.arequest("GET", url, timeout, retries, **kwargs)
+
+
+    def metrics(self) -> Dict[str, Dict]:
+        """
+        @return: Requests, errors and latencies (mean, p50, p95 in ms) by host.
+        """
+        with self.__lock:
+            return {host: metrics.to_dict() for host, metrics in self.__metrics.items()}
+
+
+    def report(self) -> str:
+        """
+        @return: One line per host with its request count and latencies.
+        """
+        return "\n".join(f"{host}: {m['requests']} requests, {m['errors']} errors, "
+                         f"mean {m['mean_ms']:.0f} ms, p50 {m['p50_ms']:.0f} ms, p95 {m['p95_ms']:.0f} ms"
+                         for host, m in self.metrics().items())
+
+
+    def close(self) -> None:
+        with self.__lock:
+            sessions, self.__sessions = self.__sessions, {}
+        for session in sessions.values():
+            session.close()
+
+
+    def __new_session(self, retries: int) -> Any:
+        import requests
+        from requests.adapters import HTTPAdapter
+        from urllib3.util.retry import Retry
+
+        retry = Retry(total=retries, backoff_factor=self.backoff,
+                      status_forcelist=self.RETRY_STATUSES,
+                      allowed_methods=frozenset(("GET", "HEAD", "OPTIONS")),
+                      raise_on_status=False, respect_retry_after_header=True)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size, max_retries=retry)
+        session = requests.Session()
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        session.headers.update({"Accept-Encoding": "gzip, deflate", "User-Agent": self.user_agent})
+        return session
+
+
+# Pool shared by the tools
+pool = HttpPool()
@@ -0,0 +1,129 @@
+import io
+import logging
+import threading
+
+from collections import OrderedDict
+
+
+# Claude resizes images above this long edge anyway, sending more pixels only costs bytes
+MAX_EDGE = 1568
+# Bedrock rejects images above 3.75 MB
+MAX_BYTES = 3_750_000
+JPEG_QUALITY = 85
+
+FORMATS = {"image/jpeg": "JPEG", "image/png": "PNG", "image/webp": "WEBP", "image/gif": "GIF"}
+
+
+class ImagePipeline:
+    """
+    Prepares images once before they enter a chat history.
+
+    Images are identified by the hash of their content: an image already
+    seen is served from the cache, so the same screenshot sent twice is
+    decoded, resized and re-encoded only once and shared by both messages.
+    Images larger than the model limits are downscaled and re-encoded with
+    Pillow, which is imported on first use; without Pillow images are kept
+    as they are.
+
+    @param max_edge: Maximum width and height in pixels.
+    @param max_bytes: Maximum size of the encoded image.
+    @param cache_size: Number of prepared images kept in the cache.
+    """
+
+    def __init__(self, max_edge: int = MAX_EDGE, max_bytes: int = MAX_BYTES,
+                 cache_size: int = 64) -> None:
+        self.max_edge = max_edge
+        self.max_bytes = max_bytes
+        self.cache_size = cache_size
+        self.saved_bytes = 0
+        self.processed = 0
+        self.deduplicated = 0
+        self.__cache: OrderedDict = OrderedDict()
+        self.__lock = threading.Lock()
+        self.__pillow_missing = False
+
+
+    def prepare(self, image):
+        """
+        Return the image fit for the model, the cached one if already prepared.
+
+        @param image: Image to prepare.
+        @return: Image with the same content, possibly smaller.
+        """
+        digest = image.digest
+        with self.__lock:
+            prepared = self.__cache.get(digest)
+            if prepared is not None:
+                self.__cache.move_to_end(digest)
+                self.deduplicated += 1
+                return prepared
+
+        prepared = self.__shrink(image)
+        with self.__lock:
+            self.processed += 1
+            self.saved_bytes += image.encoded_size - prepared.encoded_size
+            self.__cache[digest] = prepared
+            while len(self.__cache) > self.cache_size:
+                self.__cache.popitem(last=False)
+        return prepared
+
+
+    def report(self) -> str:
+        return (f"{self.processed} images prepared, {self.deduplicated} duplicates, "
+                f"{self.saved_bytes / 1024:.0f} KB smaller")
+
+
+    def __shrink(self, image):
+        if image.type != "base64" or image.media_type not in FORMATS or image.media_type == "image/gif":
+            # Animated GIFs would lose their frames
+            return image
+        Pillow = self.__pillow()
+        if Pillow is None:
+            return image
+
+        try:
+            # Pillow only reads the header until the pixels are needed
+            with image.open() as file:
+                picture = Pillow.open(file)
+                if max(picture.size) <= self.max_edge and image.encoded_size <= self.max_bytes:
+                    return image
+                picture.load()
+        except Exception as e:
+            logging.warning(f"Can not decode {image.media_type} image: {e}")
+            return image
+
+        picture.thumbnail((self.max_edge, self.max_edge), Pillow.LANCZOS)
+        media_type, encoded = self.__encode(Pillow, picture, image.media_type, JPEG_QUALITY)
+        # Too big still: lossy JPEG with a lower quality, transparency is lost
+        quality = JPEG_QUALITY
+        while len(encoded) * 4 / 3 > self.max_bytes and quality > 30:
+            quality -= 15
+            media_type, encoded = self.__encode(Pillow, picture, "image/jpeg", quality)
+
+        if len(encoded) >= image.size:
+            return image
+        return image.__class__.from_bytes(encoded, media_type)
+
+
+    @staticmethod
+    def __encode(Pillow, picture, media_type: str, quality: int) -> tuple:
+        output = io.BytesIO()
+        if media_type == "image/jpeg" and picture.mode not in ("RGB", "L"):
+            picture = picture.convert("RGB")
+        picture.save(output, FORMATS[media_type], quality=quality, optimize=True)
+        return media_type, output.getvalue()
+
+
+    def __pillow(self):
+        if self.__pillow_missing:
+            return None
+        try:
+            from PIL import Image as Pillow     # type: ignore
+        except ImportError:
+            logging.warning("Pillow is not installed, images are sent without downscaling")
+            self.__pillow_missing = True
+            return None
+        return Pillow
+
+
+default_pipeline = ImagePipeline()
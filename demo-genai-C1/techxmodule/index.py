@@ -0,0 +1,204 @@
+import os
+import json
+import math
+import heapq
+import mmap
+import operator
+
+from array import array
+from typing import List, Dict, Tuple, Iterable
+
+try:
+    import numpy as np  # type: ignore
+except ImportError:     # The pure python scan below is used instead
+    np = None
+
+
+VECTORS_FILE = "vectors.f32"
+CHUNKS_FILE = "chunks.jsonl"
+MANIFEST_FILE = "manifest.json"
+FLOAT_SIZE = array("f").itemsize
+
+
+def normalize_vector(vector: Iterable[float]) -> array:
+    """
+    Scale a vector to unit length so cosine similarity becomes a dot product.
+
+    @param vector: Raw embedding vector.
+    @return: A float32 array with unit norm (unchanged if the norm is zero).
+    """
+    vector = array("f", vector)
+    norm = math.sqrt(sum(v * v for v in vector))
+    if norm:
+        vector = array("f", (v / norm for v in vector))
+    return vector
+
+
+def read_manifest(path: str) -> Dict:
+    """
+    Read the manifest of an index directory.
+
+    @param path: Index directory.
+    @return: The manifest, or an empty manifest if the index does not exist yet.
+    """
+    try:
+        with open(os.path.join(path, MANIFEST_FILE), "r", encoding="utf-8") as file:
+            return json.load(file)
+    except FileNotFoundError:
+        return {"dimensions": 0, "model": None, "count": 0, "files": {}}
+
+
+class LocalIndex:
+    """
+    Read-only view over an on-disk index.
+
+    The index directory holds three files:
+        - vectors.f32: unit-norm float32 vectors, row-major, memory mapped.
+        - chunks.jsonl: one metadata row per vector (text, source, location).
+        - manifest.json: dimensions, embedding model and per-file content hashes.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.manifest = read_manifest(path)
+        self.dimensions = self.manifest["dimensions"]
+        self.chunks: List[Dict] = []
+        self.__file = None
+        self.__mmap = None
+        self.__vectors = memoryview(array("f"))
+
+        chunks_path = os.path.join(path, CHUNKS_FILE)
+        if os.path.exists(chunks_path):
+            with open(chunks_path, "r", encoding="utf-8") as file:
+                self.chunks = [json.loads(line) for line in file]
+
+        vectors_path = os.path.join(path, VECTORS_FILE)
+        if self.chunks and os.path.getsize(vectors_path):
+            self.__file = open(vectors_path, "rb")
+            self.__mmap = mmap.mmap(self.__file.fileno(), 0, access=mmap.ACCESS_READ)
+            self.__vectors = memoryview(self.__mmap).cast("f")
+
+
+    def __len__(self) -> int:
+        return len(self.chunks)
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+    def vector(self, i: int) -> memoryview:
+        """
+        Return the stored vector of chunk `i` without copying it.
+        """
+        return self.__vectors[i * self.dimensions:(i + 1) * self.dimensions]
+
+
+    def raw_vectors(self, start: int, end: int) -> bytes:
+        """
+        Return the raw bytes of rows [start, end), used to carry vectors over on re-index.
+        """
+        row = self.dimensions * FLOAT_SIZE
+        return self.__mmap[start * row:end * row] if self.__mmap else b""
+
+
+    def search(self, query_vector: Iterable[float], top_k: int = 10) -> List[Tuple[int, float]]:
+        """
+        Exact cosine similarity search over every stored vector.
+
+        @param query_vector: Query embedding (normalized here).
+        @param top_k: Number of results to return.
+        @return: List of (chunk index, similarity) sorted by similarity descending.
+        """
+        if not self.chunks:
+            return []
+        query = normalize_vector(query_vector)
+
+        if np is not None:
+            matrix = np.frombuffer(self.__mmap, dtype=np.float32).reshape(len(self.chunks), self.dimensions)
+            scores = matrix @ np.frombuffer(query, dtype=np.float32)
+            top_k = min(top_k, len(scores))
+            best = np.argpartition(-scores, top_k - 1)[:top_k]
+            best = best[np.argsort(-scores[best])]
+            return [(int(i), float(scores[i])) for i in best]
+
+        scores = (
+            (i, sum(map(operator.mul, query, self.vector(i))))
+            for i in range(len(self.chunks))
+        )
+        return heapq.nlargest(top_k, scores, key=operator.itemgetter(1))
+
+
+    def close(self) -> None:
+        self.__vectors.release()
+        if self.__mmap:
+            self.__mmap.close()
+            self.__file.close()
+            self.__mmap = self.__file = None
+
+
+class IndexWriter:
+    """
+    Write a new generation of an index next to the current one and swap it in atomically.
+    """
+
+    def __init__(self, path: str, dimensions: int, model: str) -> None:
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.manifest = {"dimensions": dimensions, "model": model, "count": 0, "files": {}}
+        self.__vectors = open(os.path.join(path, VECTORS_FILE + ".tmp"), "wb")
+        self.__chunks = open(os.path.join(path, CHUNKS_FILE + ".tmp"), "w", encoding="utf-8")
+
+
+    def add_file(self, source: str, file_hash: str,
+                 chunks: List[Dict], vectors: bytes) -> None:
+        """
+        Append every chunk of one source file.
+
+        @param source: Path of the file relative to the ingested directory.
+        @param file_hash: Content hash used to skip the file on the next run.
+        @param chunks: Metadata rows, one per vector.
+        @param vectors: Packed float32 vectors for the chunks.
+        """
+        start = self.manifest["count"]
+        for i, chunk in enumerate(chunks):
+            chunk["id"] = start + i
+            self.__chunks.write(json.dumps(chunk, ensure_ascii=False) + "\n")
+        self.__vectors.write(vectors)
+        self.manifest["count"] += len(chunks)
+        self.manifest["files"][source] = {
+            "hash": file_hash,
+            "chunks": [start, self.manifest["count"]]
+        }
+
+
+    def copy_file(self, index: LocalIndex, source: str) -> None:
+        """
+        Carry an unchanged file over from the previous generation without re-embedding it.
+        """
+        entry = index.manifest["files"][source]
+        start, end = entry["chunks"]
+        self.add_file(source, entry["hash"],
+                      [dict(chunk) for chunk in index.chunks[start:end]],
+                      index.raw_vectors(start, end))
+
+
+    def commit(self) -> Dict:
+        """
+        Flush the new generation and replace the current index with it.
+
+        @return: The manifest of the committed index.
+        """
+        self.__vectors.close()
+        self.__chunks.close()
+        os.replace(os.path.join(self.path, VECTORS_FILE + ".tmp"),
+                   os.path.join(self.path, VECTORS_FILE))
+        os.replace(os.path.join(self.path, CHUNKS_FILE + ".tmp"),
+                   os.path.join(self.path, CHUNKS_FILE))
+        with open(os.path.join(self.path, MANIFEST_FILE), "w", encoding="utf-8") as file:
+            json.dump(self.manifest, file, ensure_ascii=False, indent=2)
+        return self.manifest
@@ -0,0 +1,238 @@
+import os
+import re
+import hashlib
+import pathlib
+import argparse
+import unicodedata
+
+from array import array
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import List, Dict, Tuple, Iterator, Optional
+from techxmodule.index import LocalIndex, IndexWriter, normalize_vector, read_manifest
+from techxmodule.models.embedding import Embedding
+
+
+DEFAULT_PATTERNS = ("*.txt", "*.md")
+HASH_BLOCK_SIZE = 1 << 20
+
+_WHITESPACE = re.compile(r"[ \t\f\v\u00a0]+")
+_BLANK_LINES = re.compile(r"\n{3,}")
+
+# Embedding model of each worker process, created once by `_init_worker`
+_worker_embedder = None
+
+
+def normalize_text(text: str) -> str:
+    """
+    Normalize raw file content before chunking.
+
+    Vietnamese text is composed to NFC so that the same syllable typed with
+    combining marks or precomposed characters produces the same chunk.
+
+    @param text: Raw file content.
+    @return: Normalized text.
+    """
+    text = unicodedata.normalize("NFC", text.lstrip("\ufeff"))
+    text = text.replace("\r\n", "\n").replace("\r", "\n")
+    text = _WHITESPACE.sub(" ", text)
+    return _BLANK_LINES.sub("\n\n", text).strip()
+
+
+def chunk_text(text: str, chunk_size: int = 1000,
+               overlap: int = 200) -> List[Tuple[int, str]]:
+    """
+    Split text into overlapping windows, cutting on whitespace when possible.
+
+    @param text: Normalized text.
+    @param chunk_size: Maximum number of characters per chunk.
+    @param overlap: Number of characters shared by two consecutive chunks.
+    @return: List of (character offset, chunk text).
+    """
+    if overlap >= chunk_size:
+        raise ValueError("overlap must be smaller than chunk_size")
+
+    chunks = []
+    start = 0
+    while start < len(text):
+        end = min(start + chunk_size, len(text))
+        if end < len(text):
+            cut = text.rfind(" ", start + overlap + 1, end)
+            end = cut if cut != -1 else end
+        chunks.append((start, text[start:end].strip()))
+        if end >= len(text):
+            break
+        start = end - overlap
+        # Do not start the next chunk in the middle of a word
+        space = text.find(" ", start, end)
+        start = space + 1 if space != -1 else start
+    return [(offset, chunk) for offset, chunk in chunks if chunk]
+
+
+def file_hash(path: str) -> str:
+    """
+    Compute the sha256 of a file without loading it whole.
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for block in iter(lambda: file.read(HASH_BLOCK_SIZE), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def walk_files(root: str, patterns=DEFAULT_PATTERNS) -> Iterator[str]:
+    """
+    Yield every file under `root` matching one of the glob patterns, in stable order.
+    """
+    root_path = pathlib.Path(root)
+    found = set()
+    for pattern in patterns:
+        found.update(p for p in root_path.rglob(pattern) if p.is_file())
+    for path in sorted(found):
+        yield str(path)
+
+
+def _init_worker(model_name: str, region_name: str) -> None:
+    """
+    Create the embedding client once per worker process (boto3 clients can not be pickled).
+    """
+    global _worker_embedder
+    import boto3
+    _worker_embedder = Embedding(model_name, boto3.Session(), region_name)
+
+
+def _process_file(path: str, chunk_size: int, overlap: int,
+                  batch_size: int) -> Tuple[List[Tuple[int, str]], bytes]:
+    """
+    Normalize, chunk and embed one file inside a worker process.
+
+    @return: The chunks and their packed unit-norm float32 vectors.
+    """
+    with open(path, "r", encoding="utf-8", errors="replace") as file:
+        chunks = chunk_text(normalize_text(file.read()), chunk_size, overlap)
+
+    vectors = array("f")
+    texts = [text for _, text in chunks]
+    for start in range(0, len(texts), batch_size):
+        for vector in _worker_embedder.embed(texts[start:start + batch_size]):
+            vectors.extend(normalize_vector(vector))
+    return chunks, vectors.tobytes()
+
+
+def ingest(source_dir: str, index_dir: str,
+           model_name: str = "cohere-multilingual-v3",
+           region_name: str = "us-east-1",
+           chunk_size: int = 1000,
+           overlap: int = 200,
+           batch_size: int = 32,
+           max_workers: Optional[int] = None,
+           patterns=DEFAULT_PATTERNS) -> Dict:
+    """Build or refresh a local knowledge base index from a directory.
+
+    Unchanged files (same sha256 as recorded in the manifest) are carried over
+    from the previous index without being re-read or re-embedded. New and
+    modified files are chunked and embedded in a process pool, and removed
+    files are dropped.
+
+    Args:
+        source_dir (str):
+            Directory to ingest, e.g. demo-genai-B's `data/`.
+        index_dir (str):
+            Directory of the on-disk index.
+        model_name (str, optional):
+            Embedding model name. Defaults to "cohere-multilingual-v3".
+        region_name (str, optional):
+            AWS region name. Defaults to "us-east-1".
+        chunk_size (int, optional):
+            Maximum characters per chunk. Defaults to 1000.
+        overlap (int, optional):
+            Characters shared by consecutive chunks. Defaults to 200.
+        batch_size (int, optional):
+            Chunks embedded per request. Defaults to 32.
+        max_workers (int, optional):
+            Size of the process pool. Defaults to the number of CPUs.
+        patterns (tuple, optional):
+            Glob patterns of files to ingest. Defaults to ("*.txt", "*.md").
+
+    Returns:
+        Dict: Number of files embedded, skipped and removed, and total chunks.
+    """
+    old_manifest = read_manifest(index_dir)
+    if old_manifest["files"] and old_manifest["model"] != model_name:
+        # Vectors from another model are not comparable, embed everything again
+        old_manifest = {"count": 0, "files": {}}
+
+    pending = {}
+    unchanged = []
+    for path in walk_files(source_dir, patterns):
+        source = os.path.relpath(path, source_dir)
+        digest = file_hash(path)
+        if old_manifest["files"].get(source, {}).get("hash") == digest:
+            unchanged.append(source)
+        else:
+            pending[path] = (source, digest)
+
+    report = {
+        "embedded": len(pending),
+        "skipped": len(unchanged),
+        "removed": len(set(old_manifest["files"]) - set(unchanged)
+                       - {source for source, _ in pending.values()}),
+        "chunks": 0
+    }
+    if not pending and not report["removed"]:
+        report["chunks"] = old_manifest["count"]
+        return report
+
+    writer = IndexWriter(index_dir, Embedding.dimensions_of(model_name), model_name)
+
+    with LocalIndex(index_dir) as old_index:
+        for source in unchanged:
+            writer.copy_file(old_index, source)
+
+    if pending:
+        with ProcessPoolExecutor(max_workers=max_workers,
+                                 initializer=_init_worker,
+                                 initargs=(model_name, region_name)) as executor:
+            futures = {
+                executor.submit(_process_file, path, chunk_size, overlap, batch_size): path
+                for path in pending
+            }
+            # Write each file as soon as it is embedded instead of holding the whole corpus
+            for future in as_completed(futures):
+                path = futures[future]
+                source, digest = pending[path]
+                chunks, vectors = future.result()
+                uri = pathlib.Path(path).resolve().as_uri()
+                writer.add_file(source, digest, [
+                    {
+                        "text": text,
+                        "source": source,
+                        "offset": offset,
+                        "location": {
+                            "type": "LOCAL",
+                            "localLocation": {"uri": uri}
+                        }
+                    }
+                    for offset, text in chunks
+                ], vectors)
+
+    report["chunks"] = writer.commit()["count"]
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Ingest a directory into a local knowledge base index.")
+    parser.add_argument("source_dir")
+    parser.add_argument("index_dir")
+    parser.add_argument("--model", default="cohere-multilingual-v3")
+    parser.add_argument("--region", default="us-east-1")
+    parser.add_argument("--chunk-size", type=int, default=1000)
+    parser.add_argument("--overlap", type=int, default=200)
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args()
+
+    print(ingest(args.source_dir, args.index_dir,
+                 model_name=args.model,
+                 region_name=args.region,
+                 chunk_size=args.chunk_size,
+                 overlap=args.overlap,
+                 max_workers=args.workers))
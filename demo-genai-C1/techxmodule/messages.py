@@ -1,30 +1,433 @@
+import base64
+import binascii
+import hashlib
+import io
+import mimetypes
+import mmap
+import os
+import threading
+
+from collections import OrderedDict
+
+from techxmodule import images as images_module, utils
+
+
 class Image:
     """
     An Image object class to represent an image with type, media type, and data.
+    
+    `Image.from_path`, `Image.from_bytes` and `Image.from_loader` keep only a
+    reference to the file, the bytes or where to read them (a session store
+    blob): the base64 `data` is encoded when a payload is built, and kept in
+    a small LRU shared by all images instead of in each object. A file must
+    not change while its image is in use.
+    
+    @param type: source type, "base64"
+    @param media_type: MIME type, such as "image/png"
+    @param data: base64 encoded image
     """
-    def __init__(self, type: str, media_type: str, data: str) -> None:
+    
+    __slots__ = ("type", "media_type", "__data", "__path", "__raw", "__load", "__size", "__digest")
+    
+    # Encoded blobs of lazy images, by digest
+    ENCODED_CACHE_BYTES = 16 * 1024 * 1024
+    _encoded: OrderedDict = OrderedDict()
+    _encoded_bytes = 0
+    _encoded_lock = threading.Lock()
+    
+    CHUNK_SIZE = 3 * 256 * 1024     # a multiple of 3, chunks encode without padding
+    
+    
+    def __init__(self, type: str, media_type: str, data: str = None) -> None:
         self.type = type
         self.media_type = media_type
-        self.data = data
+        self.__data = data
+        self.__path = None
+        self.__raw = None
+        self.__load = None
+        self.__size = None
+        self.__digest = None
+    
+    
+    @classmethod
+    def from_path(cls, path: str, media_type: str = None) -> "Image":
+        """
+        Image read from a file when it is sent.
+        
+        @param path: path of the image file
+        @param media_type: MIME type, guessed from the file extension by default
+        """
+        media_type = media_type or mimetypes.guess_type(path)[0]
+        if not media_type or not media_type.startswith("image/"):
+            raise ValueError(f"Unknown image type of {path}")
+        image = cls("base64", media_type)
+        image.__path = os.path.abspath(path)
+        return image
+    
+    
+    @classmethod
+    def from_bytes(cls, raw: bytes, media_type: str) -> "Image":
+        """
+        Image of raw bytes, not copied: bytes, memoryview or mmap.
+        """
+        image = cls("base64", media_type)
+        image.__raw = raw
+        return image
+    
+    
+    @classmethod
+    def from_loader(cls, load, media_type: str, digest: str, size: int) -> "Image":
+        """
+        Image whose raw bytes are read by `load()` only when they are needed.
+        
+        @param load: callable returning the raw bytes
+        @param digest: sha256 hex digest of the raw bytes
+        @param size: size in bytes of the raw image
+        """
+        image = cls("base64", media_type)
+        image.__load = load
+        image.__digest = digest
+        image.__size = size
+        return image
+    
+    
+    @property
+    def data(self) -> str:
+        """
+        Base64 encoded image, encoded on access for lazy images.
+        """
+        if self.__data is not None:
+            return self.__data
+        digest = self.digest
+        with self._encoded_lock:
+            data = self._encoded.get(digest)
+            if data is not None:
+                self._encoded.move_to_end(digest)
+                return data
+        data = self.__encode()
+        self.__cache_encoded(digest, data)
+        return data
+    
+    
+    @property
+    def size(self) -> int:
+        """
+        Size in bytes of the raw image.
+        """
+        if self.__data is not None:
+            return len(self.__data) * 3 // 4 - self.__data[-2:].count("=")
+        if self.__path is not None:
+            return os.path.getsize(self.__path)
+        if self.__load is not None:
+            return self.__size
+        return len(self.__raw)
+    
+    
+    @property
+    def encoded_size(self) -> int:
+        """
+        Length of `data`, without encoding it.
+        """
+        if self.__data is not None:
+            return len(self.__data)
+        return (self.size + 2) // 3 * 4
+    
+    
+    @property
+    def digest(self) -> str:
+        """
+        Hash of the image content, computed once.
+        """
+        if self.__digest is None:
+            sha = hashlib.sha256()
+            for chunk in self.__chunks():
+                sha.update(chunk)
+            self.__digest = sha.hexdigest()
+        return self.__digest
+    
+    
+    def open(self):
+        """
+        Binary file object of the raw image.
+        """
+        if self.__path is not None:
+            return open(self.__path, "rb")
+        if self.__raw is not None:
+            return io.BytesIO(self.__raw)
+        if self.__load is not None:
+            return io.BytesIO(self.__load())
+        return io.BytesIO(base64.b64decode(self.__data))
+    
+    
+    def __chunks(self):
+        if self.__data is not None:
+            yield base64.b64decode(self.__data)
+        elif self.__load is not None:
+            yield self.__load()
+        elif self.__path is not None:
+            with open(self.__path, "rb") as file:
+                if os.fstat(file.fileno()).st_size == 0:
+                    return
+                with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as view:
+                    for start in range(0, len(view), self.CHUNK_SIZE):
+                        yield view[start:start + self.CHUNK_SIZE]
+        else:
+            view = memoryview(self.__raw)
+            for start in range(0, len(view), self.CHUNK_SIZE):
+                yield view[start:start + self.CHUNK_SIZE]
+    
+    
+    def __encode(self) -> str:
+        # Chunk by chunk, the raw file is never copied whole into memory
+        return "".join(binascii.b2a_base64(chunk, newline=False).decode("ascii")
+                       for chunk in self.__chunks())
+    
+    
+    @classmethod
+    def __cache_encoded(cls, digest: str, data: str) -> None:
+        if len(data) > cls.ENCODED_CACHE_BYTES:
+            return
+        with cls._encoded_lock:
+            if digest in cls._encoded:
+                return
+            cls._encoded[digest] = data
+            Image._encoded_bytes += len(data)
+            while Image._encoded_bytes > cls.ENCODED_CACHE_BYTES:
+                _, evicted = cls._encoded.popitem(last=False)
+                Image._encoded_bytes -= len(evicted)
+
+
+class ContentBlock:
+    """
+    A text or image block of a message.
+    
+    @param type: "text" or "image"
+    @param text: text of a text block
+    @param image: Image object of an image block
+    """
+    
+    __slots__ = ("type", "text", "image")
+    
+    def __init__(self, type: str, text: str = None, image: Image = None) -> None:
+        self.type = type
+        self.text = text
+        self.image = image
+    
+    
+    def to_payload(self) -> dict:
+        if self.type == "text":
+            return {"type": "text", "text": self.text}
+        return {
+            "type": "image",
+            "source": {
+                "type": self.image.type,
+                "media_type": self.image.media_type,
+                "data": self.image.data,
+            },
+        }
+
+
+class ToolUse:
+    """
+    A tool call requested by the model.
+    
+    @param id: tool use id given by the model (None for models without ids)
+    @param name: name of the tool
+    @param input: parameters of the call
+    @param future: Future of the tool already running, when dispatched during the stream
+    """
+    
+    __slots__ = ("id", "name", "input", "future")
+    type = "tool_use"
+    
+    def __init__(self, id: str, name: str, input: dict, future=None) -> None:
+        self.id = id
+        self.name = name
+        self.input = input
+        self.future = future
+    
+    
+    def to_payload(self) -> dict:
+        return {"type": "tool_use", "id": self.id, "name": self.name, "input": self.input}
+
+
+class ToolResult:
+    """
+    The text result of a tool call, answering the ToolUse with the same id.
+    
+    @param tool_use_id: id of the answered ToolUse
+    @param content: text content of the result
+    """
+    
+    __slots__ = ("tool_use_id", "content")
+    type = "tool_result"
+    
+    def __init__(self, tool_use_id: str, content: str) -> None:
+        self.tool_use_id = tool_use_id
+        self.content = content
+    
+    
+    def to_payload(self) -> dict:
+        return {
+            "type": "tool_result",
+            "tool_use_id": self.tool_use_id,
+            "content": [{"type": "text", "text": self.content}]
+        }
+
+
+def block_from_payload(block: dict):
+    """
+    Build a content block object from its Bedrock JSON shape.
+    """
+    if block["type"] == "tool_use":
+        return ToolUse(block["id"], block["name"], block["input"])
+    if block["type"] == "tool_result":
+        content = block["content"]
+        if isinstance(content, list):
+            content = "".join(item.get("text", "") for item in content)
+        return ToolResult(block["tool_use_id"], content)
+    if block["type"] == "image":
+        source = block["source"]
+        return ContentBlock("image", image=Image(source["type"], source["media_type"], source["data"]))
+    return ContentBlock("text", text=block["text"])
+
+
+class Message:
+    """
+    A chat message. Serialized to the Bedrock JSON shape only when a payload is built.
+    
+    @param role: "user" or "assistant"
+    @param content: list of ContentBlock, ToolUse or ToolResult
+    @param marks: sanitization marks of the history pipeline
+    """
+    
+    __slots__ = ("role", "content", "marks")
+    
+    def __init__(self, role: str, content: list, marks: int = 0) -> None:
+        self.role = role
+        self.content = content
+        self.marks = marks
+    
+    
+    def to_payload(self) -> dict:
+        return {"role": self.role, "content": [block.to_payload() for block in self.content]}
+
+
+class ModelResponse:
+    """
+    Parsed response of a model invocation.
+    
+    @param response: full text of the answer
+    @param tool: tool calls requested by the model
+    @param stop_reason: why the model stopped ("end_turn", "tool_use", ...)
+    @param body: content blocks of the answer, to put back into the memory
+    @param usage: tokens of the invocation (techxmodule.usage.Usage), None if unknown
+    """
+    
+    __slots__ = ("response", "tool", "stop_reason", "body", "usage")
+    
+    def __init__(self, response: str, tool: list, stop_reason: str, body: list = None,
+                 usage=None) -> None:
+        self.response = response
+        self.tool = tool
+        self.stop_reason = stop_reason
+        self.body = body if body is not None else []
+        self.usage = usage
 
 
 class ChatMessage: 
     """
     A class that can store and handle images and text messages
     
+    With a session store, new messages are appended to the store as they are
+    added, and the history is read from it lazily: only the window the next
+    payload needs is loaded, on first access to `messages`.
+    
     @param max_chat_message: maximum number of internal chat message (affect the model recall memory)
+    @param store: optional SessionStore persisting the history
+    @param session_id: session of the history in the store
+    @param image_pipeline: ImagePipeline preparing the added images, the shared one by default
     """
     
-    def __init__(self, max_chat_message: int=10) -> None:
-        self.messages = []
+    def __init__(self, max_chat_message: int=10, store=None, session_id: str="default",
+                 image_pipeline=None) -> None:
         self.max_chat_message = max_chat_message
+        self.store = store
+        self.session_id = session_id
+        self.image_pipeline = image_pipeline or images_module.default_pipeline
+        self.__messages: list[Message]|None = None if store else []
+        # Sequence numbers and stored marks of the loaded messages, parallel to `messages`
+        self.__seqs: list[int] = []
+        self.__stored_marks: list[int] = []
+    
+    
+    @property
+    def messages(self) -> list[Message]:
+        if self.__messages is None:
+            self.__load()
+        return self.__messages
+    
+    
+    def __load(self) -> None:
+        loaded = self.store.load(self.session_id, self.max_chat_message + 1)
+        # The window must start on a user question, not in the middle of a tool exchange
+        start = 0
+        while start < len(loaded) and not self.__is_question(loaded[start][1]):
+            start += 1
+        loaded = loaded[start:]
+        self.__messages = [message for _, message in loaded]
+        self.__seqs = [seq for seq, _ in loaded]
+        self.__stored_marks = [message.marks for message in self.__messages]
+    
+    
+    @staticmethod
+    def __is_question(message: Message) -> bool:
+        return message.role == "user" and \
+            all(block.type != "tool_result" for block in message.content)
+    
+    
+    def __add(self, message: Message) -> None:
+        self.messages.append(message)
+        if self.store:
+            self.__seqs.extend(self.store.append(self.session_id, [message]))
+            self.__stored_marks.append(message.marks)
+    
+    
+    def flush(self) -> int:
+        """
+        Write back the loaded messages changed in place since they were stored.
+        
+        Messages are detected as changed through their sanitization marks.
+        
+        @return: number of messages written
+        """
+        if not self.store or self.__messages is None:
+            return 0
+        written = 0
+        for i, message in enumerate(self.__messages):
+            if message.marks != self.__stored_marks[i]:
+                self.store.update(self.session_id, self.__seqs[i], message)
+                self.__stored_marks[i] = message.marks
+                written += 1
+        return written
+    
+    
+    def unload(self) -> None:
+        """
+        Drop the loaded window of a stored history, it is read again on next access.
+        """
+        if self.store:
+            self.flush()
+            self.__messages = None
+            self.__seqs = []
+            self.__stored_marks = []
     
 
     def append_message(self, role :str, text: str, images: list[Image]|None=None) -> list:
         """
         Adds a message to the chat, including optional text and images.
         
-        This method constructs a message dictionary that includes a role, text content, and optional images.
+        This method constructs a message that includes a role, text content, and optional images.
         The message is then appended to the `messages` list.
         
         @param role: A string indicating the role of the sender (e.g., 'user', 'system', 'assistant').
@@ -41,49 +444,46 @@ class ChatMessage:
         content = self._add_text(content, text)
 
         # Append the constructed message to the messages list
-        self.messages.append({
-            "role": role,
-            "content": content
-        })
+        self.__add(Message(role, content))
         
         return self.messages
     
     
-    def append_tool(self, tool_content) -> list:
+    def append_tool(self, tool_content: list) -> list:
         
-        self.messages.append({
-            "role": "assistant",
-            "content": tool_content
-        })
+        self.__add(Message("assistant", list(tool_content)))
         
         return self.messages
     
     
-    def append_tool_result(self, result_list: list) -> list:
-        
-        container_list = []
-        
-        for result in result_list:
-
-            content = []
-
-            content = self._add_text(content, result["content"])
-            
-            container_list.append({
-                "type": "tool_result",
-                "tool_use_id": result["tool_id"],
-                "content": content
-            })
+    def append_tool_result(self, result_list: list[ToolResult]) -> list:
         
         # Append the constructed message to the messages list
-        self.messages.append({
-            "role": "user",
-            "content": container_list
-        })
+        self.__add(Message("user", list(result_list)))
         
         return self.messages
     
     
+    def pop_oldest(self) -> Message:
+        """
+        Remove and return the oldest message.
+        
+        A stored message stays in the store, it only leaves the loaded window.
+        """
+        message = self.messages.pop(0)
+        if self.store:
+            self.__seqs.pop(0)
+            self.__stored_marks.pop(0)
+        return message
+    
+    
+    def to_payload(self) -> list:
+        """
+        Serialize the messages to the Bedrock JSON shape.
+        """
+        return [message.to_payload() for message in self.messages]
+    
+    
     def _purify_recent_question(self) -> None:
         """
         Extracts the most recent chat message from the 'user' role and clears every other tag 
@@ -92,18 +492,18 @@ class ChatMessage:
         """
         
         # Iterate through the messages in reverse to find the most recent 'user' message
-        for message in reversed(self.messages):
+        for i in range(len(self.messages) - 1, -1, -1):
+            message = self.messages[i]
             
-            if message['role'] == 'user':
+            if message.role == 'user':
                 
-                purified_text = self._retain_request_tag(message['content'])
+                purified_text = self._retain_request_tag(message.content)
                 
                 # Update the content with the purified text
                 
-                message['content'] = [{
-                    "type": "text",
-                    "text": purified_text
-                }]
+                message.content = [ContentBlock("text", text=purified_text)]
+                if self.store:
+                    self.store.update(self.session_id, self.__seqs[i], message)
                 break
 
 
@@ -111,15 +511,15 @@ class ChatMessage:
         """
         Retains only the <request> tag in the content, removing all other tags.
         
-        @param content: A list of dictionaries representing the content of a message.
+        @param content: A list of content blocks of a message.
         @return: A string with only the <request> tag retained.
         """
         purified_text = ""
         
         for item in content:
             
-            if item['type'] == 'text':
-                text = item['text']
+            if item.type == 'text':
+                text = item.text
                 
                 # Retain only <request> tags and remove everything else
                 start_tag = "<request>"
@@ -136,23 +536,13 @@ class ChatMessage:
     
     def _add_image(self, content: list, images: list[Image]|None) -> list:
         """
-        Add images to content with appropriate labels
+        Add images to content with appropriate labels, deduplicated and downscaled
         """
         
         if images:
             for index, image in enumerate(images, start=1):
-                content.append({
-                    "type": "text",
-                    "text": f"Image {index}:"
-                })
-                content.append({
-                    "type": "image",
-                    "source": {
-                        "type": image.type,
-                        "media_type": image.media_type,
-                        "data": image.data,
-                    },
-                })
+                content.append(ContentBlock("text", text=f"Image {index}:"))
+                content.append(ContentBlock("image", image=self.image_pipeline.prepare(image)))
         
         return content
     
@@ -162,9 +552,113 @@ class ChatMessage:
         Add text message to content
         """
         
-        content.append({
-            "type": "text",
-            "text": text
-        })
+        content.append(ContentBlock("text", text=text))
         
-        return content
\ No newline at end of file
+        return content
+
+
+class LlamaTranscript:
+    """
+    Structured Llama 3 chat transcript rendered with a token-budgeted sliding window.
+    
+    Every turn is rendered once when it is appended and the rendered window is
+    cached, so appending a turn extends the cached prompt instead of
+    re-rendering the conversation. When the window exceeds the budget the
+    oldest exchanges slide out and are dropped, so the transcript stays as
+    small as its window; the window always starts on a user turn.
+    
+    @param system_prompt: system prompt, always kept at the start of the window
+    @param max_tokens: maximum estimated input tokens of the rendered prompt
+    """
+    
+    BEGIN_OF_TEXT = "<|begin_of_text|>"
+    END_OF_TURN = "<|eot_id|>"
+    
+    
+    def __init__(self, system_prompt: str = "", max_tokens: int = 4096) -> None:
+        self.max_tokens = max_tokens
+        self.turns = []
+        self.__segments = []
+        self.__tokens = []
+        self.__window_tokens = 0
+        self.__rendered = None
+        self.__system = self.BEGIN_OF_TEXT + \
+            (self._render_turn("system", system_prompt) if system_prompt else "")
+        self.__fixed_tokens = utils.estimate_tokens(self.__system) + \
+            utils.estimate_tokens(self._header("assistant"))
+    
+    
+    @staticmethod
+    def _header(role: str) -> str:
+        return f"<|start_header_id|>{role}<|end_header_id|>\n\n"
+    
+    
+    @classmethod
+    def _render_turn(cls, role: str, text: str) -> str:
+        return cls._header(role) + text.strip() + cls.END_OF_TURN
+    
+    
+    def append(self, role: str, text: str) -> None:
+        """
+        Adds a turn to the transcript.
+        
+        @param role: "user", "assistant" or "ipython" (tool results)
+        @param text: content of the turn
+        """
+        segment = self._render_turn(role, text)
+        self.turns.append((role, text))
+        self.__segments.append(segment)
+        self.__tokens.append(utils.estimate_tokens(segment))
+        self.__window_tokens += self.__tokens[-1]
+        
+        if self.__slide_window():
+            self.__rendered = None
+        elif self.__rendered is not None:
+            self.__rendered += segment
+    
+    
+    def render(self, system_prompt: str = None) -> str:
+        """
+        Renders the prompt of the window, ready for the assistant to answer.
+        
+        @param system_prompt: system prompt replacing the transcript's own for
+                              this render only, e.g. without tool definitions
+        @return: Llama 3 chat template string
+        """
+        if system_prompt is not None:
+            return self.BEGIN_OF_TEXT + self._render_turn("system", system_prompt) + \
+                "".join(self.__segments) + self._header("assistant")
+        if self.__rendered is None:
+            self.__rendered = self.__system + "".join(self.__segments)
+        return self.__rendered + self._header("assistant")
+    
+    
+    def window(self) -> list:
+        """
+        Returns the (role, text) turns currently inside the window.
+        """
+        return list(self.turns)
+    
+    
+    def __slide_window(self) -> bool:
+        """
+        Drops the oldest exchanges until the window fits in the budget.
+        
+        @return: True if turns were dropped
+        """
+        start = 0
+        # Never slide past the latest user question
+        last = max((i for i in range(len(self.turns) - 1, -1, -1)
+                    if self.turns[i][0] == "user"), default=0)
+        while self.__fixed_tokens + self.__window_tokens > self.max_tokens and start < last:
+            # Drop a whole exchange: the user turn and everything until the next user turn
+            self.__window_tokens -= self.__tokens[start]
+            start += 1
+            while start < last and self.turns[start][0] != "user":
+                self.__window_tokens -= self.__tokens[start]
+                start += 1
+        if start:
+            del self.turns[:start]
+            del self.__segments[:start]
+            del self.__tokens[:start]
+        return start > 0
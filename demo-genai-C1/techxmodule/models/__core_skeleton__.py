@@ -1,7 +1,13 @@
 import json
+import time
+
+from functools import partial
 
 from typing import List, Any, Dict, Callable
-from techxmodule.messages import ChatMessage
+from techxmodule.cancellation import CancellationToken
+from techxmodule.core import registry
+from techxmodule.events import EventBus, ERROR, TOOL_START, TOOL_END, USAGE
+from techxmodule.messages import ChatMessage, ModelResponse
 from termcolor import cprint    # type: ignore
 
 
@@ -11,17 +17,37 @@ class LLM():
     and tool integration.
     """
     
+    # Sent once the deadline of the turn is spent
+    FINAL_ANSWER_PROMPT = ("The time for this answer is up: do not call any tool, "
+                           "answer now with the information you already have.")
+    TOOLS_REFUSED_PROMPT = "Tools are disabled now and any tool call is refused: reply in plain text."
+    TOOL_SKIPPED = "Tool not called, the time budget of this answer is spent."
+    TOOL_TIMED_OUT = "Tool timed out, the time budget of this answer is spent."
+    
     
     def __init__(self, name: str, 
                  session: Any, 
                  region_name: str,
-                 max_chat_memory: int) -> None:
+                 max_chat_memory: int,
+                 session_store: Any = None,
+                 session_id: str = "default") -> None:
         self.name = name
         self.runtime = session.client("bedrock-runtime", 
                                       region_name=region_name)
-        self.memory = ChatMessage(max_chat_message=max_chat_memory)
+        self.memory = ChatMessage(max_chat_message=max_chat_memory,
+                                  store=session_store,
+                                  session_id=session_id)
         self.tools: List[Any] = []
-        self._is_streaming = False
+        # Functions of the tools, looked up by the name the model calls
+        self.tool_registry = registry
+        # Tokens, tool calls, usage and errors are published here, streamed text
+        # is also printed when echo is on
+        self.events = EventBus()
+        self.echo = True
+        # UsageLedger recording the tokens of every invocation, if any
+        self.ledger = None
+        # StreamRecorder saving every invocation for replay, if any
+        self.recorder = None
     
     
     def tool_add(self, tool_list: list):
@@ -48,15 +74,81 @@ class LLM():
         }
 
         # Call the model based on streaming tag
-        self._is_streaming = streaming
-        if self._is_streaming:
-            return self.runtime.invoke_model_with_response_stream(**invoke_kwargs)
-        return self.runtime.invoke_model(**invoke_kwargs)
+        started = time.perf_counter()
+        if streaming:
+            response = self.runtime.invoke_model_with_response_stream(**invoke_kwargs)
+        else:
+            response = self.runtime.invoke_model(**invoke_kwargs)
+        if self.recorder is not None:
+            response = self.recorder.record(modelId, payload, streaming, started, response)
+        return response
 
     
+    def _publish(self, topic: str, **data: Any) -> None:
+        """
+        Publish an event of this model, only building it if anyone listens.
+        """
+        if self.events.subscribers:
+            data["model"] = self.name
+            self.events.publish(topic, data)
+
+
+    def _record_usage(self, model_id: str, response: ModelResponse,
+                      session_id: str, iteration: int) -> None:
+        """
+        Publish the usage of an invocation and record it in the ledger.
+        """
+        if response is None or response.usage is None:
+            return
+        usage = response.usage
+        cost = None
+        if self.ledger is not None:
+            cost = self.ledger.record(session_id, model_id, iteration, usage).cost
+        self._publish(USAGE, model_id=model_id, session_id=session_id, iteration=iteration,
+                      input_tokens=usage.input_tokens, output_tokens=usage.output_tokens,
+                      cache_read_tokens=usage.cache_read_tokens,
+                      cache_write_tokens=usage.cache_write_tokens, cost=cost)
+
+
+    def _traced_tool(self, name: str, function: Callable, tool_id: str = None, deadline: Any = None) -> Callable:
+        """
+        Wrap a tool function to publish its start and end (with duration and error).
+
+        The deadline, if any, is passed to the tools taking one.
+        """
+        if deadline is not None and self.tool_registry.takes_deadline(name):
+            function = partial(function, deadline=deadline)
+        def run(**kwargs):
+            self._publish(TOOL_START, id=tool_id, name=name, input=kwargs)
+            start = time.perf_counter()
+            error = None
+            try:
+                return function(**kwargs)
+            except Exception as e:
+                error = str(e)
+                raise
+            finally:
+                self._publish(TOOL_END, id=tool_id, name=name,
+                              seconds=time.perf_counter() - start, error=error)
+        return run
+
+
+    @staticmethod
+    def _close_on_cancel(body: Any, cancel: CancellationToken) -> None:
+        """
+        Close a response body as soon as the call is cancelled, releasing its connection.
+        """
+        close = getattr(body, "close", None)
+        if cancel is not None and close is not None:
+            cancel.on_cancel(close)
+
+
     def _parse_response(self, invoke_result: Any, 
                  process_response_func: List[Callable], 
-                 debug: bool = False) -> Dict[str, Any]:
+                 streaming: bool,
+                 debug: bool = False,
+                 on_token: Callable[[str], None] = None,
+                 cancel: CancellationToken = None) -> Dict[str, Any]:
         
         """Process the model's response, 
             handling both streaming and non-streaming cases.
@@ -68,8 +160,15 @@ class LLM():
                 List of two functions, 
                 one for streaming, 
                 one for non-streaming
+            streaming (bool):
+                Whether invoke_result is a response stream, as requested 
+                from _invoke_with_payload by the same call.
             debug (bool, optional): 
                 Flag to enable debug mode.
+            on_token (Callable[[str], None], optional):
+                Called with the generated text of this call.
+            cancel (CancellationToken, optional):
+                Token closing the response body when cancelled.
 
         Raises:
             ValueError: 
@@ -93,10 +192,11 @@ class LLM():
             raise TypeError("Both items in the process_response_func list must be callable.")
             
         try:
-            if self._is_streaming:
-                return streaming_func(invoke_result, debug)
+            if streaming:
+                return streaming_func(invoke_result, debug, on_token, cancel)
             else:
-                return non_streaming_func(invoke_result, debug)
+                return non_streaming_func(invoke_result, debug, on_token, cancel)
         except Exception as e:
             cprint(f"Error processing response: {e}", "red")
+            self._publish(ERROR, error=str(e))
             return None  
\ No newline at end of file
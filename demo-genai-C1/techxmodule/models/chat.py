@@ -1,12 +1,19 @@
-import tools, json
-import xml.etree.ElementTree as ET
+import json
 
 from termcolor import cprint, colored    # type: ignore
 from typing import List, Optional, Any, Dict, Callable
-from functools import wraps
-from techxmodule import utils
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from functools import partial, wraps
+from techxmodule import utils, render
 from techxmodule.models.__core_skeleton__ import LLM
-from techxmodule.messages import Image
+from techxmodule.cancellation import CancellationToken
+from techxmodule.messages import ChatMessage, Image, ContentBlock, ToolUse, ToolResult, ModelResponse, block_from_payload
+from techxmodule.context import ContextPacker
+from techxmodule.deadline import Deadline
+from techxmodule.events import CONTEXT_PACKED, TOKEN
+from techxmodule.history import HistorySanitizer
+from techxmodule.toolcalls import ToolCallError
+from techxmodule.usage import Usage
 
 
 class ChatLLM(LLM):
@@ -23,7 +30,9 @@ class ChatLLM(LLM):
     def __init__(self, name: str, 
                  max_chat_memory: int, 
                  session: Any, 
-                 region_name: str):
+                 region_name: str,
+                 session_store: Any = None,
+                 session_id: str = "default"):
         """
         Initialize Chat model Instance
         
@@ -32,97 +41,121 @@ class ChatLLM(LLM):
                                 2 means 1 for user and 1 for assistant. Default is 0.
         :param session: Session object for API calls
         :param region_name: AWS region name
+        :param session_store: Optional SessionStore persisting the chat history
+        :param session_id: Session of the chat history in the store
         """
         super().__init__(name, 
                          session, 
                          region_name, 
-                         max_chat_memory+self.MEMORY_BUFFER)
+                         max_chat_memory+self.MEMORY_BUFFER,
+                         session_store,
+                         session_id)
+        self.sanitizer = HistorySanitizer()
+        # Runs the tools dispatched while the answer is still streaming
+        self.tool_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="tool")
     
     
     def manage_memory(func):
         """
-        Decorator to manage memory by cleaning tag in questions and removing old messages.
+        Decorator to manage memory by sanitizing old messages and removing the oldest ones.
         """
         
-        def clean_tag_question(self):
-            if len(self.memory.messages) > 2:
-                try:
-                    clean_text = utils.clean_tag(self.memory.messages[-3]["content"][0]["text"])
-                    self.memory.messages[-3]["content"][0]["text"] = clean_text
-                except (IndexError, KeyError) as e:
-                    pass
+        def sanitize_history(self, memory: ChatMessage):
+            saved = self.sanitizer.sanitize(memory)
+            if saved:
+                cprint(f"History cleaned, ~{saved} fewer input tokens per request", "cyan")
+            saved_bytes = self.sanitizer.sanitize_images(memory)
+            if saved_bytes:
+                cprint(f"Old images removed, {saved_bytes / 1024:.0f} KB less payload per request", "cyan")
     
-        def removing_old_messages(self):
-            while len(self.memory.messages) > self.memory.max_chat_message + 1:
-                self.memory.messages.pop(0)
-                if self.memory.messages and \
-                    self.memory.messages[0]["role"] == self.USER_ROLE and \
-                    self.memory.messages[0]["content"][0]["type"] != self.TOOL_RESULT:
+        def removing_old_messages(self, memory: ChatMessage):
+            while len(memory.messages) > memory.max_chat_message + 1:
+                memory.pop_oldest()
+                if memory.messages and \
+                    memory.messages[0].role == self.USER_ROLE and \
+                    memory.messages[0].content[0].type != self.TOOL_RESULT:
                     break
         
         @wraps(func)
-        def wrapper(self, *args, **kwargs):
-            clean_tag_question(self)
-            func(self, *args, **kwargs)
-            removing_old_messages(self)
+        def wrapper(self, *args, memory: Optional[ChatMessage] = None, **kwargs):
+            # Work on the memory of the caller's session, the model's own memory by default
+            if memory is None:
+                memory = self.memory
+            result = func(self, *args, memory=memory, **kwargs)
+            sanitize_history(self, memory)
+            memory.flush()
+            removing_old_messages(self, memory)
+            return result
         return wrapper
     
     
     @manage_memory
     def add_to_memory(self, role: str, 
                       text: str, 
-                      images: Optional[List[Image]] = None) -> List[Dict]:
+                      images: Optional[List[Image]] = None,
+                      memory: Optional[ChatMessage] = None) -> List[Dict]:
         """
         Add a new message to the memory.
 
         :param role: Role of the message sender ("user" or "assistant")
         :param text: Content of the message
         :param images: Optional list of associated images
+        :param memory: Memory of the session, the model's own memory by default
         :return: Memory for the LLM
         """
-        return self.memory.append_message(role, text, images)
+        return memory.append_message(role, text, images)
             
     
     @manage_memory
-    def add_tool_result_to_memory(self, results: List[Dict]) -> List[Dict]:
+    def add_tool_result_to_memory(self, results: List[ToolResult],
+                                  memory: Optional[ChatMessage] = None) -> List[Dict]:
         """
         Add tool execution results to the memory.
 
         :param results: Results from tool execution
+        :param memory: Memory of the session, the model's own memory by default
         :return: Memory for the LLM
         """
-        return self.memory.append_tool_result(results)
+        return memory.append_tool_result(results)
             
     
     @manage_memory
-    def add_tool_to_memory(self, tool_content: List[Dict]) -> List[Dict]:
+    def add_tool_to_memory(self, tool_content: List[Any],
+                           memory: Optional[ChatMessage] = None) -> List[Dict]:
         """
         Add tool-related content to the memory.
 
         :param tool_content: Content related to a tool
+        :param memory: Memory of the session, the model's own memory by default
         :return: Memory for the LLM
         """
-        return self.memory.append_tool(tool_content)
+        return memory.append_tool(tool_content)
     
 
-    def __assess_messages(self, messages: Optional[str] = None) -> List[str]:
+    def __assess_messages(self, messages: Optional[str] = None,
+                          memory: Optional[ChatMessage] = None) -> List[str]:
     
         """
         Assess whether to use the provided messages or retrieve from internal memory.
 
         :param messages: string of user message, or None to use internal memory
+        :param memory: Memory of the session, the model's own memory by default
         :return: user message formatted to payload
         """
         if not messages:
-            if not self.memory.messages:
+            if memory is None:
+                memory = self.memory
+            if not memory.messages:
                 raise AssertionError("Memory is empty. Please provide messages.")
-            return self.memory.messages
+            # Messages are only serialized to JSON here, when the payload is built
+            return memory.to_payload()
         return [{"role": self.USER_ROLE, "content": messages}]
     
 
     def _invoke_chat_model(self, modelId: str, 
             build_payload_func, 
-            payload_params: list, streaming: bool = False) -> Dict:
+            payload_params: list, streaming: bool = False,
+            memory: Optional[ChatMessage] = None) -> Dict:
         """
         A wrapper to invoke the chat model, 
         allowing for custom payload construction with flexible arguments.
@@ -131,10 +164,11 @@ class ChatLLM(LLM):
         @param build_payload_func: A function that builds the payload.
         @param payload_params: A list of parameters to be passed to the build_payload_func.
         @param streaming: Whether to stream the response (default is False).
+        @param memory: Memory of the session, the model's own memory by default.
         @return: JSON response from the model.
         """
         # Assess the messages in the payload (assuming the first item in payload_params is 'messages')
-        payload_params[0] = self.__assess_messages(payload_params[0])
+        payload_params[0] = self.__assess_messages(payload_params[0], memory)
 
         # Call the build_payload_func with parameters unpacked from the list
         payload = build_payload_func(*payload_params)
@@ -149,7 +183,10 @@ class Claude(ChatLLM):
     def __init__(self, model_name: str, 
                  session: Any, 
                  region: str, 
-                 max_chat_memory = 0) -> None:
+                 max_chat_memory = 0,
+                 context_token_budget = 8000,
+                 session_store = None,
+                 session_id = "default") -> None:
         """Initialize Claude model with specified version and session.
 
         Args:
@@ -163,13 +200,26 @@ class Claude(ChatLLM):
             max_chat_memory (int, optional): 
                 Maximum number of chats (plus buffer) the model can remember. 
                 Defaults to 0.
+            context_token_budget (int, optional):
+                Maximum estimated tokens of knowledge base documents 
+                put into a tool result.
+                Defaults to 8000.
+            session_store (SessionStore, optional):
+                Store persisting the chat history, see techxmodule.store.
+                Defaults to None, the history lives in process memory only.
+            session_id (str, optional):
+                Session of the chat history in the store.
+                Defaults to "default".
         """
 
         super().__init__("claude", 
                          max_chat_memory, 
                          session, 
-                         region)
+                         region,
+                         session_store,
+                         session_id)
         self.modelId = self.__set_model_id(model_name)
+        self.context_packer = ContextPacker(token_budget=context_token_budget)
 
 
     def invoke(self, messages: str = None, 
@@ -179,9 +229,19 @@ class Claude(ChatLLM):
                top_p = 0.8, 
                top_k = 50, 
                streaming = False,
-               verbose = False) -> Dict[str, Any]:
+               verbose = False,
+               memory: Optional[ChatMessage] = None,
+               on_token: Optional[Callable[[str], None]] = None,
+               cancel: Optional[CancellationToken] = None,
+               dispatch_tools: bool = False,
+               iteration: Optional[int] = None,
+               deadline: Optional[Deadline] = None) -> ModelResponse:
         """Invoke the model
 
+        The call keeps no state on the instance, so one Claude (and its 
+        pooled Bedrock client) can serve many sessions and threads at once, 
+        each passing its own memory.
+
         Args:
             messages (str, optional): 
                 Message prompt to the model
@@ -208,11 +268,75 @@ class Claude(ChatLLM):
             verbose (bool, optional): 
                 Whether to show log, tracking.
                 Defaults to False.
+            memory (ChatMessage, optional):
+                Chat history of the session, used when messages is None.
+                Defaults to the model's own memory.
+            on_token (Callable[[str], None], optional):
+                Called with each piece of generated text of this call.
+                Defaults to None.
+            cancel (CancellationToken, optional):
+                Cancelling it closes the response stream at once and the 
+                partial answer is returned with stop reason "cancelled".
+                Defaults to None.
+            dispatch_tools (bool, optional):
+                When streaming, start each valid tool call as soon as its
+                input is complete, while the rest of the answer streams.
+                `tool_use` then only collects the results.
+                Defaults to False.
+            iteration (int, optional):
+                Tool loop iteration of the call, recorded in the usage ledger.
+                Defaults to the tool rounds since the last question in memory.
+            deadline (Deadline, optional):
+                Budget of the turn. Once it is spent, the model is asked for 
+                a final answer; tools it still calls are dropped and the stop 
+                reason is "deadline_exceeded".
+                Defaults to None.
 
         Returns:
-            Dict: Json that contain full response output.
+            ModelResponse: The full response output.
         """
+        if cancel is not None and cancel.cancelled:
+            return ModelResponse("", [], "cancelled")
 
+        if memory is None:
+            memory = self.memory
+        if iteration is None:
+            iteration = 0 if messages else self.__tool_iteration(memory)
+        
+        final_answer = deadline is not None and deadline.spent
+        if final_answer:
+            # The tools stay in the payload: Bedrock rejects a request whose history
+            # holds tool_use or tool_result blocks without tool definitions, so past
+            # the deadline tools can only be forbidden by the system prompt
+            system_prompt = f"{system_prompt}\n{self.FINAL_ANSWER_PROMPT}"
+            dispatch_tools = False
+
+        # A final answer made of tool calls only is asked again once, with the tools refused
+        for attempt in range(2 if final_answer else 1):
+            response = self.__invoke_once(messages, system_prompt, max_token, temperature, top_p, top_k,
+                                          streaming, verbose, memory, on_token, cancel,
+                                          dispatch_tools, deadline)
+            self._record_usage(self.modelId, response, memory.session_id, iteration)
+            if not final_answer or response is None or response.stop_reason != "tool_use":
+                break
+            self.cancel_tools(response.tool)
+            cprint("Time budget of the turn spent, tools not called", "yellow")
+            # Tool use blocks can not stay in the history without results, only the text is kept
+            response = ModelResponse(response.response, [], "deadline_exceeded",
+                                     [ContentBlock("text", text=response.response)] if response.response else [],
+                                     response.usage)
+            if response.response:
+                break
+            system_prompt = f"{system_prompt}\n{self.TOOLS_REFUSED_PROMPT}"
+        return response
+
+
+    def __invoke_once(self, messages, system_prompt, max_token, temperature, top_p, top_k,
+                      streaming, verbose, memory, on_token, cancel,
+                      dispatch_tools, deadline) -> ModelResponse:
+        """
+        One model call of `invoke`: build the payload, call Bedrock and parse the response.
+        """
         # Invoke model through bedrock runtime service
         invoke_result = self._invoke_chat_model(self.modelId, 
             self.__build_claude_payload, 
@@ -222,37 +346,107 @@ class Claude(ChatLLM):
                             temperature, 
                             top_p, 
                             top_k], 
-            streaming=streaming)
+            streaming=streaming,
+            memory=memory)
         
         # Return the parse response from the invoke result
-        return self._parse_response(
+        response = self._parse_response(
             invoke_result, 
             [
-                self.__process_streaming_claude_response, 
+                partial(self.__process_streaming_claude_response, 
+                        dispatch_tools=dispatch_tools, deadline=deadline), 
                 self.__process_non_streaming_claude_response
             ], 
-            debug=verbose)
+            streaming=streaming,
+            debug=verbose,
+            on_token=on_token,
+            cancel=cancel)
+        if response is not None and response.stop_reason == "cancelled":
+            cancel.record_saved(max_token, utils.estimate_tokens(response.response))
+        return response
+
+
+    @staticmethod
+    def __tool_iteration(memory: ChatMessage) -> int:
+        """
+        Number of tool rounds since the last user question.
+        """
+        rounds = 0
+        for message in reversed(memory.messages):
+            if message.role != "user":
+                continue
+            if not any(block.type == "tool_result" for block in message.content):
+                break
+            rounds += 1
+        return rounds
     
 
-    def tool_use(self, tools_list: list) -> list:
+    def tool_use(self, tools_list: List[ToolUse], deadline: Optional[Deadline] = None) -> List[ToolResult]:
         """
         Invoke tools based on the provided list and process the results.
+        
+        The input of every call is validated by the tool registry first, a
+        call with bad parameters is answered with the error without running.
+        Tools already dispatched during the stream are only waited for.
+        
+        With a deadline, the tools run concurrently and get the deadline; 
+        a tool still running when the time is up is answered with a timeout, 
+        and once the budget is spent no tool is started.
+
+        @param tools_list: List of ToolUse requested by the model.
+        @param deadline: Budget of the turn, a tool round is counted on it.
+        @return: List of tool results answering each tool use.
+        """
+        if deadline is not None:
+            if deadline.spent:
+                self.cancel_tools(tools_list)
+                return [ToolResult(tool.id, self.TOOL_SKIPPED) for tool in tools_list]
+            deadline.count_round()
+            for tool in tools_list:
+                if tool.future is None:
+                    self.__dispatch_tool(tool, deadline)
 
-        @param tools_list: List of tools with 'name' and 'input' keys for invocation.
-        @return: List of tool results containing tool_id and content.
-        """
         results = []
         for tool in tools_list:
             cprint("Analyzing...", "cyan", attrs=["blink"])
-            tool_function = getattr(tools, tool["name"])
-            result = tool_function(**tool["input"])
-            results.append({
-                "tool_id": tool['id'],
-                "content": self.__process_tool_result(result)
-            })
+            if tool.future is not None:
+                try:
+                    result = tool.future.result(timeout=None if deadline is None else deadline.remaining)
+                except FutureTimeoutError:
+                    cprint(f"Tool {tool.name} timed out", "red")
+                    tool.future.cancel()
+                    tool.future = None
+                    results.append(ToolResult(tool.id, self.TOOL_TIMED_OUT))
+                    continue
+                tool.future = None
+                results.append(ToolResult(tool.id, self.__process_tool_result(result)))
+                continue
+            try:
+                self.tool_registry.validate(tool.name, tool.input)
+            except ToolCallError as e:
+                cprint("Error using tool, retrying with different tools...", "red")
+                results.append(ToolResult(tool.id, f"Error using tool: {e}"))
+                continue
+            tool_function = self._traced_tool(tool.name, self.tool_registry.get(tool.name), tool.id)
+            result = tool_function(**tool.input)
+            results.append(ToolResult(tool.id, self.__process_tool_result(result)))
         return results
 
 
+    def __dispatch_tool(self, tool: ToolUse, deadline: Optional[Deadline] = None) -> None:
+        """
+        Start a tool call in the tool executor, unless its input is invalid.
+        
+        An invalid call is left to `tool_use`, which answers it with the error.
+        """
+        try:
+            self.tool_registry.validate(tool.name, tool.input)
+        except ToolCallError:
+            return
+        tool_function = self._traced_tool(tool.name, self.tool_registry.get(tool.name), tool.id, deadline)
+        tool.future = self.tool_executor.submit(tool_function, **tool.input)
+
+
     def __process_tool_result(self, result: dict) -> str:
         """
         Process tool result based on its type.
@@ -281,26 +475,31 @@ class Claude(ChatLLM):
         """
         Build XML context prompt from retrieved knowledge base data.
 
+        Results are packed into `self.context_packer`'s token budget,
+        dropping near-duplicates and the least relevant chunks per token.
+        The pack report is published as a CONTEXT_PACKED event.
+
         @param retrieved_data: JSON object with retrieval results and metadata.
         @param min_relevance: Minimum relevance score for including context.
-        @param debug: Flag to enable XML structure debugging.
+        @param debug: Flag to print the pack report and the XML structure.
         @return: XML string representing the context.
         """
         if not retrieved_data:
             return ""
-        documents = ET.Element("documents")
         if retrieved_data["ResponseMetadata"]["HTTPStatusCode"] != 200:
-            documents.text = "Error retrieving data. No context provided."
+            documents = render.DOCUMENTS("Error retrieving data. No context provided.")
         else:
-            for i, context in enumerate(retrieved_data["retrievalResults"]):
-                if context["score"] < min_relevance:
-                    break
-                document = ET.SubElement(documents, "document", {"index": str(i + 1)})
-                ET.SubElement(document, "source").text = utils.iterate_through_location(context["location"])
-                ET.SubElement(document, "document_content").text = context["content"]["text"]
+            packed, report = self.context_packer.pack(retrieved_data["retrievalResults"],
+                                                      min_relevance)
+            self._publish(CONTEXT_PACKED, **report)
+            if debug:
+                cprint(ContextPacker.describe(report), "cyan")
+            documents = render.render_documents(
+                (utils.iterate_through_location(context["location"]), context["content"]["text"])
+                for context in packed)
         if debug:
-            ET.dump(documents)
-        return ET.tostring(documents, encoding="unicode", method="xml")
+            print(documents)
+        return documents
 
 
     def __build_claude_payload(self, messages: list, 
@@ -334,12 +533,20 @@ class Claude(ChatLLM):
 
     def __process_streaming_claude_response(
             self, model_response: Any, 
-            debug: bool = False) -> Dict[str, Any]:
+            debug: bool = False,
+            on_token: Optional[Callable[[str], None]] = None,
+            cancel: Optional[CancellationToken] = None,
+            dispatch_tools: bool = False,
+            deadline: Optional[Deadline] = None) -> ModelResponse:
         """
         Stream and print model output in real-time.
 
         :param model_response: The HTTP response containing streamed JSON data
         :param debug: Flag to enable debugging information
+        :param on_token: Called with each piece of generated text
+        :param cancel: Token stopping the stream
+        :param dispatch_tools: Start each tool as soon as its content block stops
+        :param deadline: Deadline given to the dispatched tools
         :return: Full stream response with text, tool data, and stop reason
         """
         full_response = ""
@@ -347,98 +554,138 @@ class Claude(ChatLLM):
         tools_used = []
         body = []
         stop_reason = ""
+        usage = Usage()
+        stream = model_response.get("body")
+        self._close_on_cancel(stream, cancel)
 
-        for event in model_response.get("body"):
-            chunk = json.loads(event["chunk"]["bytes"])
-
-            # Debugging info
-            if chunk['type'] == 'message_delta':
-                stop_reason = chunk['delta'].get('stop_reason', '')
-                stop_sequence = chunk['delta'].get('stop_sequence', '')
-                output_token = chunk['usage']['output_tokens']
-                if debug:
-                    print(f"\nStop reason: {stop_reason}")
-                    print(f"Stop sequence: {stop_sequence}")
-                    print(f"Output tokens: {output_token}\n")
-
-            # Processing streaming content
-            if chunk['type'] == 'content_block_delta':
-                if chunk['delta']['type'] == 'text_delta':
-                    text_chunk = chunk['delta']['text']
-                    print(colored(text_chunk, "green"), end="", flush=True)
-                    full_response += text_chunk
-                elif chunk['delta']['type'] == 'input_json_delta':
-                    tool_input += chunk['delta']['partial_json']
+        try:
+            for event in stream:
+                if cancel is not None and cancel.cancelled:
+                    break
+                chunk = json.loads(event["chunk"]["bytes"])
+
+                if chunk['type'] == 'message_start':
+                    usage = Usage.from_claude(chunk.get('message', {}).get('usage', {}))
+
+                # Debugging info
+                if chunk['type'] == 'message_delta':
+                    stop_reason = chunk['delta'].get('stop_reason', '')
+                    stop_sequence = chunk['delta'].get('stop_sequence', '')
+                    output_token = chunk['usage']['output_tokens']
+                    usage.output_tokens = output_token
+                    if debug:
+                        print(f"\nStop reason: {stop_reason}")
+                        print(f"Stop sequence: {stop_sequence}")
+                        print(f"Output tokens: {output_token}\n")
+
+                # Processing streaming content
+                if chunk['type'] == 'content_block_delta':
+                    if chunk['delta']['type'] == 'text_delta':
+                        text_chunk = chunk['delta']['text']
+                        if self.echo:
+                            print(colored(text_chunk, "green"), end="", flush=True)
+                        self._publish(TOKEN, text=text_chunk)
+                        if on_token:
+                            on_token(text_chunk)
+                        full_response += text_chunk
+                    elif chunk['delta']['type'] == 'input_json_delta':
+                        tool_input += chunk['delta']['partial_json']
             
-            # Record the tool need to use
-            if chunk['type'] == 'content_block_start' and chunk['index'] != 0:
-                tool_index = chunk['index'] - 1
-                tool_id = chunk['content_block']['id']
-                tool_name = chunk['content_block']['name']
+                # Record the tool need to use
+                if chunk['type'] == 'content_block_start' and chunk['index'] != 0:
+                    tool_index = chunk['index'] - 1
+                    tool_id = chunk['content_block']['id']
+                    tool_name = chunk['content_block']['name']
     
-            # End of content block
-            if chunk['type'] == 'content_block_stop':
-                if chunk['index'] == 0:
-                    body.append({"type": "text", "text": full_response})
-                else:
-                    try:
-                        tool_input_json = json.loads(tool_input)
-                    except json.JSONDecodeError:
-                        tool_input_json = {}
-
-                    tools_used.append({
-                        "type": "tool_use",
-                        "id": tool_id,
-                        "name": tool_name,
-                        "input": tool_input_json
-                    })
-                    body.append(tools_used[-1])
-                    tool_input = ""
-
-        return {
-            "response": full_response,
-            "tool": tools_used,
-            "stop_reason": stop_reason,
-            "body": body
-        }
+                # End of content block
+                if chunk['type'] == 'content_block_stop':
+                    if chunk['index'] == 0:
+                        body.append(ContentBlock("text", text=full_response))
+                    else:
+                        try:
+                            tool_input_json = json.loads(tool_input)
+                        except json.JSONDecodeError:
+                            tool_input_json = {}
+
+                        tools_used.append(ToolUse(tool_id, tool_name, tool_input_json))
+                        body.append(tools_used[-1])
+                        tool_input = ""
+                        # The input is complete, the tool can run while later blocks stream
+                        if dispatch_tools:
+                            self.__dispatch_tool(tools_used[-1], deadline)
+        except Exception:
+            # Reading fails when the stream is closed under the reader
+            if cancel is None or not cancel.cancelled:
+                self.cancel_tools(tools_used)
+                raise
+
+        if cancel is not None and cancel.cancelled:
+            self.cancel_tools(tools_used)
+            # The final count never came, the tokens generated until the cancel are estimated
+            usage.output_tokens = usage.output_tokens or utils.estimate_tokens(full_response)
+            # Unfinished tool calls are dropped, only the streamed text is kept
+            return ModelResponse(full_response, [], "cancelled",
+                                 [ContentBlock("text", text=full_response)] if full_response else [],
+                                 usage)
+        return ModelResponse(full_response, tools_used, stop_reason, body, usage)
+
+
+    @staticmethod
+    def cancel_tools(tools_list: List[ToolUse]) -> None:
+        """
+        Drop tool calls dispatched during the stream that will not be collected.
+        
+        A tool already running finishes, its result is dropped.
+        """
+        for tool in tools_list:
+            if tool.future is not None:
+                tool.future.cancel()
+                tool.future = None
 
 
     def __process_non_streaming_claude_response(
             self, model_response: Any, 
-            debug: bool = False) -> Dict[str, Any]:
+            debug: bool = False,
+            on_token: Optional[Callable[[str], None]] = None,
+            cancel: Optional[CancellationToken] = None) -> ModelResponse:
         """
         Handle and process non-streaming model output.
 
         :param model_response: The response object from the model
         :param debug: Flag to enable debugging information
+        :param on_token: Called once with each text block
+        :param cancel: Token stopping the read of the response
         :return: Processed response with tools and output
         """
         full_response = ""
         tools_used = []
-        body = json.loads(model_response.get("body").read())
+        content = []
+        self._close_on_cancel(model_response.get("body"), cancel)
+        try:
+            body = json.loads(model_response.get("body").read())
+        except Exception:
+            if cancel is None or not cancel.cancelled:
+                raise
+            return ModelResponse("", [], "cancelled")
 
         for content_block in body["content"]:
+            content.append(block_from_payload(content_block))
             if content_block["type"] == "text":
-                cprint(content_block["text"], "green")
+                if self.echo:
+                    cprint(content_block["text"], "green")
+                if on_token:
+                    on_token(content_block["text"])
                 full_response += content_block["text"]
             elif content_block["type"] == "tool_use":
-                tools_used.append({
-                    "id": content_block["id"],
-                    "name": content_block["name"],
-                    "input": content_block["input"]
-                })
+                tools_used.append(content[-1])
 
         if debug:
             print(f"\nStop reason: {body['stop_reason']}")
             print(f"Stop sequence: {body['stop_sequence']}")
             print(f"Output tokens: {body['usage']['output_tokens']}")
 
-        return {
-            "response": full_response,
-            "tool": tools_used,
-            "stop_reason": body['stop_reason'],
-            "body": body['content']
-        }
+        return ModelResponse(full_response, tools_used, body['stop_reason'], content,
+                             Usage.from_claude(body.get('usage', {})))
 
 
     def __set_model_id(self, model_name: str) -> str:
@@ -471,9 +718,7 @@ class Claude(ChatLLM):
         if not prompt:
             return ""
 
-        context_element = ET.Element("context")
-        context_element.text = prompt
-        return ET.tostring(context_element, encoding="unicode", method="xml")
+        return render.CONTEXT(prompt)
 
 
     def build_cot_prompt(self, prompt: str = None) -> str:
@@ -494,9 +739,7 @@ class Claude(ChatLLM):
 
         cot_content = prompt or default_prompt
 
-        instructions_element = ET.Element("instructions")
-        instructions_element.text = cot_content
-        return ET.tostring(instructions_element, encoding="unicode", method="xml")
+        return render.INSTRUCTIONS(cot_content)
 
 
     def build_example_prompt(self, prompt: str) -> str:
@@ -510,9 +753,7 @@ class Claude(ChatLLM):
         if not prompt:
             return ""
 
-        example_element = ET.Element("examples")
-        example_element.text = prompt
-        return ET.tostring(example_element, encoding="unicode", method="xml")
+        return render.EXAMPLES(prompt)
 
 
     def build_user_prompt(self, prompt: str) -> str:
@@ -523,7 +764,5 @@ class Claude(ChatLLM):
 
         @return: A string containing the XML representation of the user prompt.
         """
-        request_element = ET.Element("request")
-        request_element.text = prompt
-        return ET.tostring(request_element, encoding="unicode", method="xml")
+        return render.REQUEST(prompt)
     
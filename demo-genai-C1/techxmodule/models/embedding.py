@@ -0,0 +1,116 @@
+import json
+
+from typing import List, Any
+
+
+class Embedding:
+    """
+    Embedding model class that interacts with AWS Bedrock runtime service.
+    """
+
+    SEARCH_DOCUMENT = "search_document"
+    SEARCH_QUERY = "search_query"
+
+    # model name -> (model ID, vector dimensions, texts per request)
+    MODELS = {
+        "cohere-multilingual-v3": ("cohere.embed-multilingual-v3", 1024, 96),
+        "titan-v2": ("amazon.titan-embed-text-v2:0", 1024, 1)
+    }
+
+
+    def __init__(self, model_name: str,
+                 session: Any,
+                 region_name: str,
+                 config: Any = None) -> None:
+        """Initialize embedding model with specified version and session.
+
+        Args:
+            model_name (str):
+                Name of the embedding model to use.
+                Valid options are "cohere-multilingual-v3" or "titan-v2".
+            session (Any):
+                An instance of the boto3 session object for creating a Bedrock client.
+            region_name (str):
+                AWS region name where the service is run.
+            config (botocore.config.Config, optional):
+                Client configuration, e.g. the timeouts of a call made
+                under a deadline. Defaults to None.
+        """
+        self.name = "embedding"
+        self.model_name = model_name
+        self.runtime = session.client("bedrock-runtime",
+                                      region_name=region_name,
+                                      config=config)
+        self.modelId, self.dimensions, self.max_batch = \
+            self.__set_model_id(model_name)
+
+
+    @classmethod
+    def dimensions_of(cls, model_name: str) -> int:
+        """
+        Vector dimensions of a model, without creating a client.
+        """
+        if model_name not in cls.MODELS:
+            raise ValueError(f"Invalid model name: {model_name}")
+        return cls.MODELS[model_name][1]
+
+
+    def embed(self, texts: List[str],
+              input_type: str = SEARCH_DOCUMENT) -> List[List[float]]:
+        """
+        Embed a list of texts, splitting them into batches the model accepts.
+
+        @param texts: Texts to embed.
+        @param input_type: "search_document" for corpus chunks,
+                           "search_query" for retrieval queries.
+        @return: One vector per input text, in the same order.
+        """
+        vectors = []
+        for start in range(0, len(texts), self.max_batch):
+            batch = texts[start:start + self.max_batch]
+            vectors.extend(self.__embed_batch(batch, input_type))
+        return vectors
+
+
+    def __embed_batch(self, texts: List[str], input_type: str) -> List[List[float]]:
+        """
+        Invoke the bedrock API for a single batch of texts.
+        """
+        if self.modelId.startswith("cohere"):
+            body = self.__invoke({
+                "texts": texts,
+                "input_type": input_type,
+                "truncate": "END"
+            })
+            return body["embeddings"]
+
+        # Titan only embeds one text per request
+        return [
+            self.__invoke({
+                "inputText": text,
+                "dimensions": self.dimensions,
+                "normalize": True
+            })["embedding"]
+            for text in texts
+        ]
+
+
+    def __invoke(self, payload: dict) -> dict:
+        response = self.runtime.invoke_model(
+            modelId=self.modelId,
+            accept="application/json",
+            contentType="application/json",
+            body=json.dumps(payload))
+        return json.loads(response["body"].read())
+
+
+    def __set_model_id(self, model_name: str) -> tuple:
+        """
+        Set model ID, vector dimensions and batch size based on provided model name.
+
+        @param model_name: Name of the embedding model to use.
+        @return: Model ID, dimensions and maximum batch size of the chosen model.
+        """
+        if model_name not in self.MODELS:
+            raise ValueError(f"Invalid model name: {model_name}")
+        return self.MODELS[model_name]
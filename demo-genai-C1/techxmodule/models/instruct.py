@@ -2,7 +2,15 @@ import json
 
 from termcolor import cprint, colored    # type: ignore
 from typing import List, Optional, Any, Dict, Callable
+from techxmodule import utils, render
 from techxmodule.models.__core_skeleton__ import LLM
+from techxmodule.cancellation import CancellationToken
+from techxmodule.context import ContextPacker
+from techxmodule.deadline import Deadline
+from techxmodule.events import CONTEXT_PACKED, TOKEN
+from techxmodule.messages import ModelResponse
+from techxmodule.toolcalls import ToolCallParser, ToolCallError, run_concurrently
+from techxmodule.usage import Usage
 
 
 class InstructLLM(LLM):
@@ -53,7 +61,8 @@ class LLama(InstructLLM):
     def __init__(self, model_name: str, 
                  session: Any, 
                  region_name: str, 
-                 max_chat_memory: int = 0) -> None:
+                 max_chat_memory: int = 0,
+                 context_token_budget: int = 8000) -> None:
         """Initialize Llama model with specified version and session.
 
         Args:
@@ -66,10 +75,15 @@ class LLama(InstructLLM):
                 AWS region name where the service is run.
             max_chat_memory (int, optional): 
                 Maximum number of chats the model can remember. Defaults to 0.
+            context_token_budget (int, optional):
+                Maximum estimated tokens of knowledge base documents 
+                put into a tool result.
+                Defaults to 8000.
         """
         
         super().__init__("llama", max_chat_memory, session, region_name)
         self.modelId = self.__set_model_id(model_name)
+        self.context_packer = ContextPacker(token_budget=context_token_budget)
 
 
     def invoke(self, messages: str, 
@@ -77,9 +91,16 @@ class LLama(InstructLLM):
                temperature: float = 0.15, 
                top_p: float = 0.8, 
                streaming: bool = False,
-               verbose: bool = False) -> Dict:
+               verbose: bool = False,
+               on_token: Optional[Callable[[str], None]] = None,
+               cancel: Optional[CancellationToken] = None,
+               session_id: str = "default",
+               iteration: int = 0) -> ModelResponse:
         """Invoke the model
 
+        The call keeps no state on the instance, so one LLama can be 
+        invoked from many threads at once.
+
         Args:
             messages (str): 
                 Prompt to ask the model.
@@ -93,22 +114,115 @@ class LLama(InstructLLM):
                 Whether to stream the response. Defaults to False.
             verbose (bool, optional): 
                 Show the metatdata, log. Defaults to False.
+            on_token (Callable[[str], None], optional):
+                Called with each piece of answer text of this call, 
+                tool call lists excluded. Defaults to None.
+            cancel (CancellationToken, optional):
+                Cancelling it closes the response stream at once and the 
+                partial answer is returned with stop reason "cancelled".
+                Defaults to None.
+            session_id (str, optional):
+                Session the usage is recorded for in the ledger. Defaults to "default".
+            iteration (int, optional):
+                Tool loop iteration of the call, for the ledger. Defaults to 0.
 
         Returns:
-            Dict: the full response from the model.
+            ModelResponse: the full response from the model, with the parsed 
+                tool calls and "tool_use" as stop reason if Llama called tools.
         """
+        if cancel is not None and cancel.cancelled:
+            return ModelResponse("", [], "cancelled")
+
         invoke_result = self._invoke_instruct_model(
             self.modelId, 
             self.__build_llama_payload, 
             payload_params= [messages, max_token, temperature, top_p], 
             streaming=streaming)
         
-        return self._parse_response(invoke_result, 
+        response = self._parse_response(invoke_result, 
             [
                 self.__process_streaming_llama_response, 
                 self.__process_non_streaming_llama_response
             ], 
-            debug=verbose)
+            streaming=streaming,
+            debug=verbose,
+            on_token=on_token,
+            cancel=cancel)
+        if response is not None and response.stop_reason == "cancelled":
+            cancel.record_saved(max_token, utils.estimate_tokens(response.response))
+        self._record_usage(self.modelId, response, session_id, iteration)
+        return response
+
+
+    def tool_use(self, tools_list: list, deadline: Optional[Deadline] = None) -> list:
+        """
+        Validate the parsed tool calls and run them concurrently, 
+        with the same tool functions as Claude.
+
+        @param tools_list: List of ToolUse parsed from the generation.
+        @param deadline: Budget of the turn, passed to the tools; a tool round is 
+                         counted on it and tools still running when the time is up 
+                         are answered with a timeout.
+        @return: List of tool results containing the tool name and content.
+        """
+        if deadline is not None and deadline.spent:
+            return [{"name": call.name, "content": self.TOOL_SKIPPED}
+                    for call in tools_list]
+        if deadline is not None:
+            deadline.count_round()
+        cprint("Analyzing...", "cyan", attrs=["blink"])
+        valid_calls, results = [], {}
+        for i, call in enumerate(tools_list):
+            try:
+                self.tool_registry.validate(call.name, call.input)
+                valid_calls.append((i, call))
+            except ToolCallError as e:
+                cprint("Error using tool, retrying with different tools...", "red")
+                results[i] = str(e)
+
+        outputs = run_concurrently([call for _, call in valid_calls],
+                                   lambda name: self._traced_tool(name, self.tool_registry.get(name),
+                                                                  deadline=deadline),
+                                   timeout=None if deadline is None else deadline.remaining)
+        for (i, call), output in zip(valid_calls, outputs):
+            if output is None:
+                cprint(f"Tool {call.name} timed out", "red")
+                results[i] = self.TOOL_TIMED_OUT
+                continue
+            results[i] = self.__process_tool_result(output)
+
+        return [{
+            "name": call.name,
+            "content": results[i]
+        } for i, call in enumerate(tools_list)]
+
+
+    def __process_tool_result(self, result: dict) -> str:
+        """
+        Process tool result based on its type.
+
+        Knowledge base results are packed by `self.context_packer`, like
+        Claude's: relevance threshold, near-duplicates and token budget. The
+        pack report is published as a CONTEXT_PACKED event.
+
+        @param result: Result returned from the tool.
+        @return: Processed result string.
+        """
+        if result["type"] == "documents":
+            retrieved_data = result["text"]
+            if retrieved_data["ResponseMetadata"]["HTTPStatusCode"] != 200:
+                return "Error retrieving data. No context provided."
+            packed, report = self.context_packer.pack(retrieved_data["retrievalResults"])
+            self._publish(CONTEXT_PACKED, **report)
+            return render.render_documents(
+                (utils.iterate_through_location(context["location"]), context["content"]["text"])
+                for context in packed)
+        elif result["type"] == "data":
+            return result["text"]
+        elif result["type"] == "parameterError":
+            cprint("Error using tool, retrying with different tools...", "red")
+            return result["error"]
+        return ""
 
 
     def __build_llama_payload(self, 
@@ -128,39 +242,138 @@ class LLama(InstructLLM):
     
 
     def __process_streaming_llama_response(
-            self, model_response: Any, debug: bool = False) -> Dict[str, Any]:
+            self, model_response: Any, debug: bool = False,
+            on_token: Optional[Callable[[str], None]] = None,
+            cancel: Optional[CancellationToken] = None) -> ModelResponse:
         """
         Stream and print model output in real-time.
 
         :param model_response: The HTTP response containing streamed JSON data
         :param debug: Flag to enable debugging information
+        :param on_token: Called with each piece of answer text
+        :param cancel: Token stopping the stream
         :return: Full stream response with text, tool data, and stop reason
         """
-        full_response = ""
+        parser = ToolCallParser()
+        stop_reason = ""
+        printed = 0
+        usage = Usage()
+        stream = model_response["body"]
+        self._close_on_cancel(stream, cancel)
         
-        for event in model_response["body"]:
-            chunk = json.loads(event["chunk"]["bytes"])
-            text = chunk["generation"]
-            print(colored(text, "green"), end="", flush=True)
-            full_response += text
+        try:
+            for event in stream:
+                if cancel is not None and cancel.cancelled:
+                    break
+                chunk = json.loads(event["chunk"]["bytes"])
+                text = chunk["generation"]
+                stop_reason = chunk.get("stop_reason") or stop_reason
+                usage = self.__usage(chunk, usage)
+                
+                try:
+                    if parser.feed(text):
+                        # The call list is complete, the rest of the stream is not needed
+                        if hasattr(stream, "close"):
+                            stream.close()
+                        break
+                except ToolCallError:
+                    parser.is_tool_call = False
+                
+                # Tool call lists are not meant for the user, only print answers
+                if parser.is_tool_call is False and printed < len(parser.text):
+                    self.__emit(parser.text[printed:], on_token)
+                    printed = len(parser.text)
+        except Exception:
+            # Reading fails when the stream is closed under the reader
+            if cancel is None or not cancel.cancelled:
+                raise
+        
+        if cancel is not None and cancel.cancelled:
+            # A half generated tool call list is dropped, only printed answer text is kept
+            return ModelResponse(parser.text[:printed].strip(), [], "cancelled", usage=usage)
         
-        return full_response
+        if parser.is_tool_call and parser.calls is None:
+            # Started with "[" but no call list ever closed: it was an answer after all
+            parser.is_tool_call = False
+            self.__emit(parser.text[printed:], on_token)
+        
+        if debug:
+            print(f"\nStop reason: {stop_reason}")
+        
+        return self.__build_response(parser, stop_reason, usage)
 
 
     def __process_non_streaming_llama_response(
-            self, model_response: Any, debug: bool = False) -> Dict[str, Any]:
+            self, model_response: Any, debug: bool = False,
+            on_token: Optional[Callable[[str], None]] = None,
+            cancel: Optional[CancellationToken] = None) -> ModelResponse:
         """
         Handle and process non-streaming model output.
 
         :param model_response: The response object from the model
         :param debug: Flag to enable debugging information
+        :param on_token: Called once with the answer text
+        :param cancel: Token stopping the read of the response
         :return: Processed response with tools and output
         """
-        chunk = model_response["body"].read()
-        text = chunk["generation"]
-        print(colored(text, "green"), end="", flush=True)
+        self._close_on_cancel(model_response["body"], cancel)
+        try:
+            chunk = json.loads(model_response["body"].read())
+        except Exception:
+            if cancel is None or not cancel.cancelled:
+                raise
+            return ModelResponse("", [], "cancelled")
+        parser = ToolCallParser()
+        try:
+            parser.feed(chunk["generation"])
+        except ToolCallError:
+            parser.is_tool_call = False
         
-        return text
+        if not parser.calls:
+            # Answers starting with "[" without a closed call list included
+            parser.is_tool_call = False
+            self.__emit(chunk["generation"], on_token)
+        if debug:
+            print(f"\nStop reason: {chunk['stop_reason']}")
+        
+        return self.__build_response(parser, chunk["stop_reason"], self.__usage(chunk, Usage()))
+
+
+    def __emit(self, text: str, on_token: Optional[Callable[[str], None]]) -> None:
+        """
+        Print, publish and pass on a piece of answer text.
+        """
+        if self.echo:
+            print(colored(text, "green"), end="", flush=True)
+        self._publish(TOKEN, text=text)
+        if on_token:
+            on_token(text)
+
+
+    def __build_response(self, parser: ToolCallParser, stop_reason: str, usage: Usage) -> ModelResponse:
+        """
+        Build the response from the parsed generation.
+        """
+        if parser.calls:
+            cprint(f"Calling tools: {', '.join(call.name for call in parser.calls)}", "cyan")
+        return ModelResponse(parser.text.strip(), 
+                             parser.calls or [], 
+                             "tool_use" if parser.calls else stop_reason,
+                             usage=usage)
+
+
+    @staticmethod
+    def __usage(chunk: dict, usage: Usage) -> Usage:
+        """
+        Token counts of a Llama chunk, the invocation metrics of the last chunk preferred.
+        """
+        metrics = chunk.get("amazon-bedrock-invocationMetrics")
+        if metrics:
+            return Usage(metrics.get("inputTokenCount") or 0, metrics.get("outputTokenCount") or 0)
+        # Counts are cumulative, the prompt count only comes with the first chunk
+        usage.input_tokens = chunk.get("prompt_token_count") or usage.input_tokens
+        usage.output_tokens = chunk.get("generation_token_count") or usage.output_tokens
+        return usage
         
     
     def __set_model_id(self, model_name: str) -> str:
@@ -0,0 +1,80 @@
+from typing import Iterable, Optional, Tuple
+
+
+def escape_text(text: str) -> str:
+    """
+    Escape XML element text exactly like `xml.etree.ElementTree` does.
+
+    @param text: Raw text.
+    @return: Text with &, < and > escaped.
+    """
+    if "&" in text:
+        text = text.replace("&", "&amp;")
+    if "<" in text:
+        text = text.replace("<", "&lt;")
+    if ">" in text:
+        text = text.replace(">", "&gt;")
+    return text
+
+
+class Fragment:
+    """
+    Pre-rendered tag template for a text-only XML element.
+
+    Produces the same string as building an `ET.Element` with that text and
+    serializing it with `ET.tostring(..., encoding="unicode", method="xml")`,
+    including the `<tag />` form for empty text.
+    """
+
+    __slots__ = ("open", "close", "empty")
+
+    def __init__(self, tag: str) -> None:
+        self.open = f"<{tag}>"
+        self.close = f"</{tag}>"
+        self.empty = f"<{tag} />"
+
+    def __call__(self, text: Optional[str]) -> str:
+        if not text:
+            return self.empty
+        return self.open + escape_text(text) + self.close
+
+
+CONTEXT = Fragment("context")
+INSTRUCTIONS = Fragment("instructions")
+EXAMPLES = Fragment("examples")
+REQUEST = Fragment("request")
+DOCUMENTS = Fragment("documents")
+SOURCE = Fragment("source")
+DOCUMENT_CONTENT = Fragment("document_content")
+
+
+def render_documents(documents: Iterable[Tuple[Optional[str], Optional[str]]]) -> str:
+    """
+    Render the multi-document context block.
+
+    Every piece goes into one flat list joined once at the end, so the
+    (usually large) document texts are copied a single time.
+
+    @param documents: (source, content) pairs, indexed from 1 in order.
+    @return: The <documents> XML string, `<documents />` if there are none.
+    """
+    parts = [DOCUMENTS.open]
+    append = parts.append
+    for i, (source, content) in enumerate(documents, start=1):
+        append(f'<document index="{i}">')
+        _append_fragment(append, SOURCE, source)
+        _append_fragment(append, DOCUMENT_CONTENT, content)
+        append("</document>")
+    if len(parts) == 1:
+        return DOCUMENTS.empty
+    append(DOCUMENTS.close)
+    return "".join(parts)
+
+
+def _append_fragment(append, fragment: Fragment, text: Optional[str]) -> None:
+    if not text:
+        append(fragment.empty)
+        return
+    append(fragment.open)
+    append(escape_text(text))
+    append(fragment.close)
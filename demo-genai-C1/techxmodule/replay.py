@@ -0,0 +1,236 @@
+"""
+Record and replay of Bedrock invocations.
+
+A StreamRecorder set on a model (`model.recorder = StreamRecorder(path)`)
+appends every invocation to a gzip JSON lines file: the request payload,
+the time until the response came back, and the raw event-stream chunks
+with the time each one arrived (or the body of a non-streaming call).
+
+A ReplaySession stands in for the boto3 session of a model and serves the
+recorded responses back, in order, at their original pace or as fast as
+possible. Responses go through the model's own `_parse_response`, so
+parser throughput and turn latency can be compared across versions with
+real traffic shapes and no live calls.
+"""
+import gzip
+import io
+import json
+import threading
+import time
+
+from typing import Any, Dict, Iterator, List, Optional
+
+
+class Recording:
+    """
+    One recorded invocation.
+
+    @param model_id: model of the call
+    @param streaming: whether the response is an event stream
+    @param payload: request payload
+    @param latency: seconds until the response (first byte) came back
+    @param chunks: (seconds after the response, chunk bytes) of a stream
+    @param body: body of a non-streaming response
+    @param truncated: the stream was closed before its end, e.g. cancelled
+    """
+
+    __slots__ = ("model_id", "streaming", "payload", "latency", "chunks", "body", "truncated")
+
+    def __init__(self, model_id: str, streaming: bool, payload: Dict, latency: float,
+                 chunks: List[tuple] = None, body: bytes = None, truncated: bool = False) -> None:
+        self.model_id = model_id
+        self.streaming = streaming
+        self.payload = payload
+        self.latency = latency
+        self.chunks = chunks or []
+        self.body = body
+        self.truncated = truncated
+
+
+    def to_json(self) -> Dict:
+        data = {"model_id": self.model_id, "streaming": self.streaming, "payload": self.payload,
+                "latency": round(self.latency, 4)}
+        if self.streaming:
+            data["chunks"] = [[round(offset, 4), chunk.decode("utf-8")] for offset, chunk in self.chunks]
+            data["truncated"] = self.truncated
+        else:
+            data["body"] = self.body.decode("utf-8")
+        return data
+
+
+    @classmethod
+    def from_json(cls, data: Dict) -> "Recording":
+        return cls(data["model_id"], data["streaming"], data["payload"], data["latency"],
+                   [(offset, chunk.encode("utf-8")) for offset, chunk in data.get("chunks", [])],
+                   data["body"].encode("utf-8") if "body" in data else None,
+                   data.get("truncated", False))
+
+
+def load_recordings(path: str) -> List[Recording]:
+    """
+    Read the recordings of a file, in the order they were recorded.
+    """
+    with gzip.open(path, "rt", encoding="utf-8") as file:
+        return [Recording.from_json(json.loads(line)) for line in file if line.strip()]
+
+
+class StreamRecorder:
+    """
+    Records the invocations of the models it is set on.
+
+    Each invocation is appended once its response is fully read (or closed)
+    as a gzip member of its own, so the file stays valid if the process dies.
+
+    @param path: gzip JSON lines file, appended to.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.count = 0
+        self.__lock = threading.Lock()
+
+
+    def record(self, model_id: str, payload: Dict, streaming: bool,
+               started: float, response: Dict) -> Dict:
+        """
+        Wrap a response so that reading it records the invocation.
+
+        @param started: `time.perf_counter()` when the request was sent.
+        @return: The response, with its body wrapped.
+        """
+        latency = time.perf_counter() - started
+        if streaming:
+            body = RecordingStream(response["body"], lambda chunks, truncated: self.__write(
+                Recording(model_id, True, payload, latency, chunks, truncated=truncated)))
+        else:
+            raw = response["body"].read()
+            self.__write(Recording(model_id, False, payload, latency, body=raw))
+            body = io.BytesIO(raw)
+        return dict(response, body=body)
+
+
+    def __write(self, recording: Recording) -> None:
+        line = json.dumps(recording.to_json(), ensure_ascii=False) + "\n"
+        with self.__lock:
+            with gzip.open(self.path, "at", encoding="utf-8") as file:
+                file.write(line)
+            self.count += 1
+
+
+class RecordingStream:
+    """
+    Event stream passing the chunks through while recording them with their timing.
+    """
+
+    def __init__(self, stream: Any, done) -> None:
+        self.__stream = stream
+        self.__done = done
+        self.__chunks: List[tuple] = []
+        self.__start = time.perf_counter()
+        self.__finished = False
+
+
+    def __iter__(self) -> Iterator[Dict]:
+        try:
+            for event in self.__stream:
+                if "chunk" in event:
+                    self.__chunks.append((time.perf_counter() - self.__start, event["chunk"]["bytes"]))
+                yield event
+        finally:
+            self.__finish(truncated=False)
+
+
+    def close(self) -> None:
+        close = getattr(self.__stream, "close", None)
+        if close is not None:
+            close()
+        self.__finish(truncated=True)
+
+
+    def __finish(self, truncated: bool) -> None:
+        if not self.__finished:
+            self.__finished = True
+            self.__done(self.__chunks, truncated)
+
+
+class ReplayStream:
+    """
+    Event stream yielding recorded chunks, at the recorded pace scaled by `speed`.
+    """
+
+    def __init__(self, recording: Recording, speed: Optional[float]) -> None:
+        self.recording = recording
+        self.speed = speed
+        self.closed = False
+
+
+    def __iter__(self) -> Iterator[Dict]:
+        start = time.perf_counter()
+        for offset, chunk in self.recording.chunks:
+            if self.closed:
+                raise ConnectionError("Stream closed")
+            if self.speed:
+                delay = offset / self.speed - (time.perf_counter() - start)
+                if delay > 0:
+                    time.sleep(delay)
+            yield {"chunk": {"bytes": chunk}}
+
+
+    def close(self) -> None:
+        self.closed = True
+
+
+class ReplayRuntime:
+    """
+    Bedrock runtime client answering with recordings.
+
+    Streaming and non-streaming calls are served from their own recordings,
+    each in recorded order, starting over at the end.
+
+    @param recordings: Recorded invocations.
+    @param speed: 1.0 for the recorded pace, 2.0 twice as fast, None without waiting.
+    """
+
+    def __init__(self, recordings: List[Recording], speed: Optional[float] = None) -> None:
+        self.speed = speed
+        self.requests: List[Dict] = []
+        self.__recordings = {True: [r for r in recordings if r.streaming],
+                             False: [r for r in recordings if not r.streaming]}
+        self.__next = {True: 0, False: 0}
+        self.__lock = threading.Lock()
+
+
+    def invoke_model(self, **kwargs) -> Dict:
+        recording = self.__take(False, kwargs)
+        return {"body": io.BytesIO(recording.body)}
+
+
+    def invoke_model_with_response_stream(self, **kwargs) -> Dict:
+        recording = self.__take(True, kwargs)
+        return {"body": ReplayStream(recording, self.speed)}
+
+
+    def __take(self, streaming: bool, kwargs: Dict) -> Recording:
+        with self.__lock:
+            recordings = self.__recordings[streaming]
+            if not recordings:
+                raise LookupError(f"No {'streaming' if streaming else 'non-streaming'} recording to replay")
+            recording = recordings[self.__next[streaming] % len(recordings)]
+            self.__next[streaming] += 1
+            self.requests.append(kwargs)
+        if self.speed:
+            time.sleep(recording.latency / self.speed)
+        return recording
+
+
+class ReplaySession:
+    """
+    Stand-in for a boto3 session, giving models a ReplayRuntime.
+    """
+
+    def __init__(self, recordings: List[Recording], speed: Optional[float] = None) -> None:
+        self.runtime = ReplayRuntime(recordings, speed)
+
+
+    def client(self, *args, **kwargs) -> ReplayRuntime:
+        return self.runtime
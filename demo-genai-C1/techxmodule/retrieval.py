@@ -0,0 +1,188 @@
+import re
+import math
+import heapq
+import operator
+import unicodedata
+
+from array import array
+from typing import List, Dict, Tuple, Optional, Any
+from techxmodule.index import LocalIndex
+
+
+_WORD = re.compile(r"\w+", re.UNICODE)
+
+
+def tokenize(text: str, bigrams: bool = True) -> List[str]:
+    """
+    Vietnamese-aware tokenizer for keyword search.
+
+    Text is composed to NFC and case-folded, keeping the diacritics since they
+    carry meaning ("Bá" and "Ba" are different names). Vietnamese words are
+    made of several syllables separated by spaces, so adjacent syllable pairs
+    are added as extra terms ("bá_kiến") to reward exact name matches.
+
+    @param text: Text to tokenize.
+    @param bigrams: Whether to add syllable bigrams. Defaults to True.
+    @return: List of terms.
+    """
+    syllables = _WORD.findall(unicodedata.normalize("NFC", text).casefold())
+    if not bigrams:
+        return syllables
+    return syllables + [f"{a}_{b}" for a, b in zip(syllables, syllables[1:])]
+
+
+class BM25:
+    """
+    Okapi BM25 scorer over an inverted index with array-backed postings.
+
+    Each term owns two parallel arrays: the ids of the documents containing it
+    and the term frequency in each of them.
+    """
+
+    def __init__(self, documents: List[str], k1: float = 1.2, b: float = 0.75) -> None:
+        """
+        Build the inverted index.
+
+        @param documents: Document texts, the position is the document id.
+        @param k1: Term frequency saturation. Defaults to 1.2.
+        @param b: Document length normalization. Defaults to 0.75.
+        """
+        self.k1 = k1
+        self.b = b
+        self.doc_count = len(documents)
+        self.doc_lengths = array("I")
+        self.postings: Dict[str, Tuple[array, array]] = {}
+
+        for doc_id, text in enumerate(documents):
+            terms = tokenize(text)
+            self.doc_lengths.append(len(terms))
+            counts: Dict[str, int] = {}
+            for term in terms:
+                counts[term] = counts.get(term, 0) + 1
+            for term, count in counts.items():
+                if term not in self.postings:
+                    self.postings[term] = (array("I"), array("I"))
+                ids, tfs = self.postings[term]
+                ids.append(doc_id)
+                tfs.append(count)
+
+        self.avg_length = (sum(self.doc_lengths) / self.doc_count) if self.doc_count else 0.0
+        # Length part of the BM25 denominator only depends on the document, compute it once
+        self.__norms = array("d", (
+            k1 * (1 - b + b * length / self.avg_length) if self.avg_length else k1
+            for length in self.doc_lengths
+        ))
+
+
+    def idf(self, term: str) -> float:
+        df = len(self.postings[term][0]) if term in self.postings else 0
+        return math.log(1 + (self.doc_count - df + 0.5) / (df + 0.5))
+
+
+    def search(self, query: str, top_k: int = 10) -> List[Tuple[int, float]]:
+        """
+        Score every document sharing a term with the query.
+
+        @param query: Query text.
+        @param top_k: Number of results to return.
+        @return: List of (document id, score) sorted by score descending.
+        """
+        scores: Dict[int, float] = {}
+        k1 = self.k1
+        norms = self.__norms
+        for term in set(tokenize(query)):
+            if term not in self.postings:
+                continue
+            idf = self.idf(term)
+            ids, tfs = self.postings[term]
+            for doc_id, tf in zip(ids, tfs):
+                scores[doc_id] = scores.get(doc_id, 0.0) + \
+                    idf * tf * (k1 + 1) / (tf + norms[doc_id])
+        return heapq.nlargest(top_k, scores.items(), key=operator.itemgetter(1))
+
+
+class HybridRetriever:
+    """
+    Local replacement for Bedrock's HYBRID knowledge base search.
+
+    Keyword (BM25) and vector results over a `LocalIndex` are fused on their
+    ranks only, which needs no calibration between the two very different
+    score scales.
+    """
+
+    def __init__(self, index: LocalIndex,
+                 embedder: Optional[Any] = None,
+                 rrf_k: int = 60,
+                 score_rank: int = 5) -> None:
+        """
+        @param index: Local index built by `techxmodule.ingest`.
+        @param embedder: Embedding model for the queries. Without it only BM25 is used.
+        @param rrf_k: Rank smoothing constant of reciprocal rank fusion, which breaks
+                      ties between equal scores. Defaults to 60.
+        @param score_rank: Rank scoring 0.5 in a single ranking, see `retrieve`. Defaults to 5.
+        """
+        self.index = index
+        self.embedder = embedder
+        self.rrf_k = rrf_k
+        self.score_rank = score_rank
+        self.bm25 = BM25([chunk["text"] for chunk in index.chunks])
+
+
+    def retrieve(self, query: str,
+                 number_of_results: int = 10,
+                 candidates: int = 50,
+                 query_vector: Optional[List[float]] = None) -> Dict:
+        """
+        Retrieve the chunks most relevant to the query.
+
+        Results are chosen and ordered by the score returned with each, which
+        falls in [0, 1] like Bedrock's, for the `min_relevance` filter of the
+        context builders: each ranking gives a hit `1 / (1 + (rank - 1) / (score_rank - 1))`,
+        1.0 at rank 1 and 0.5 at `score_rank`, and the rankings are combined as
+        independent evidence, `1 - prod(1 - s)`. A chunk only one ranking found
+        (e.g. an exact name match BM25 finds and the vectors miss) therefore
+        scores as high as its rank in that ranking, and agreement between both
+        rankings raises the score. Equal scores are ordered by reciprocal rank
+        fusion.
+
+        @param query: Query text.
+        @param number_of_results: Number of results to return.
+        @param candidates: Results taken from each ranking before fusion.
+        @param query_vector: Precomputed query embedding, skips the embedding call.
+        @return: Response shaped like `bedrock-agent-runtime.retrieve`.
+        """
+        rankings = [self.bm25.search(query, candidates)]
+        if query_vector is None and self.embedder is not None:
+            query_vector = self.embedder.embed([query], self.embedder.SEARCH_QUERY)[0]
+        if query_vector is not None:
+            rankings.append(self.index.search(query_vector, candidates))
+
+        fused: Dict[int, float] = {}
+        misses: Dict[int, float] = {}
+        for ranking in rankings:
+            for rank, (doc_id, _) in enumerate(ranking, start=1):
+                fused[doc_id] = fused.get(doc_id, 0.0) + 1.0 / (self.rrf_k + rank)
+                misses[doc_id] = misses.get(doc_id, 1.0) * (1.0 - self.rank_score(rank))
+
+        results = []
+        for doc_id in heapq.nlargest(number_of_results, fused,
+                                     key=lambda doc_id: (-misses[doc_id], fused[doc_id])):
+            chunk = self.index.chunks[doc_id]
+            results.append({
+                "content": {"text": chunk["text"]},
+                "location": chunk["location"],
+                "score": 1.0 - misses[doc_id],
+                "metadata": {"source": chunk["source"], "chunkId": chunk["id"]}
+            })
+
+        return {
+            "ResponseMetadata": {"HTTPStatusCode": 200},
+            "retrievalResults": results
+        }
+
+
+    def rank_score(self, rank: int) -> float:
+        """
+        Score in [0, 1] of a hit at a rank (from 1) of one ranking.
+        """
+        return 1.0 / (1.0 + (rank - 1) / max(self.score_rank - 1, 1))
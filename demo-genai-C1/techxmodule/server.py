@@ -0,0 +1,679 @@
+"""
+Multi-session chat server.
+
+Serves the same Claude + Prompts + tool loop as `main.py` to many users at
+once, with only the standard library: an asyncio HTTP/1.1 server streaming
+tokens and tool status either as Server-Sent Events or over a WebSocket.
+
+    POST   /sessions/{id}/messages   {"message": "..."}  -> text/event-stream
+    GET    /sessions/{id}/ws         WebSocket, send {"message": "..."} frames
+    DELETE /sessions/{id}            forget the session and delete its stored history
+    GET    /sessions/{id}/usage      tokens, estimated cost and remaining budget
+    GET    /health
+    GET    /metrics/http             latency of the hosts called by the tools
+
+Every event is a JSON object: token {"text"}, tool_start {"name", "input"},
+tool_end {"names"}, done {"stop_reason"} and error {"error"}.
+
+Run from demo-genai-C1:
+    python -m techxmodule.server --port 8080
+    python -m techxmodule.server --port 8080 --workers 4    # see techxmodule.workers
+"""
+import asyncio
+import base64
+import hashlib
+import json
+import struct
+import threading
+
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+from termcolor import cprint    # type: ignore
+from techxmodule.cancellation import CancellationToken
+from techxmodule.core import Prompts
+from techxmodule.deadline import Deadline
+from techxmodule.httppool import pool as http_pool
+from techxmodule.messages import ToolResult
+from techxmodule.usage import UsageLedger
+
+
+WEBSOCKET_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC11B65"
+MAX_HEADER_BYTES = 64 * 1024
+MAX_BODY_BYTES = 1024 * 1024
+STATUS_TEXT = {200: "OK", 204: "No Content", 400: "Bad Request", 404: "Not Found",
+               409: "Conflict", 413: "Payload Too Large", 429: "Too Many Requests",
+               503: "Service Unavailable"}
+
+
+class TurnCancelled(BaseException):
+    """
+    Raised in the model thread when the client of a turn went away.
+
+    Like `asyncio.CancelledError` it is not an `Exception`, so the error
+    handlers of the models and tools let it through.
+    """
+
+
+class Turn:
+    """
+    Event channel between a model thread and the connection streaming its events.
+
+    The queue is bounded: when the client reads slower than the model
+    generates, `emit` blocks the model thread (per-session backpressure)
+    until the client catches up or the turn is cancelled.
+
+    @param loop: Event loop of the connection.
+    @param queue_size: Maximum number of events waiting for the client.
+    """
+
+    POLL_SECONDS = 0.5
+
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, queue_size: int) -> None:
+        self.loop = loop
+        self.queue: asyncio.Queue = asyncio.Queue()
+        self.cancelled = False
+        self.partial = ""
+        # Closes the model's response stream as soon as the client goes away
+        self.cancellation = CancellationToken()
+        # Free places in the queue; the model thread only waits on the loop when there are none
+        self.__free = threading.Semaphore(queue_size)
+
+
+    def emit(self, event: str, data: Dict) -> None:
+        """
+        Queue an event for the client, from the model thread.
+
+        @raises TurnCancelled: If the turn was cancelled.
+        """
+        while not self.__free.acquire(timeout=self.POLL_SECONDS):
+            if self.cancelled:
+                raise TurnCancelled()
+        if self.cancelled:
+            self.__free.release()
+            raise TurnCancelled()
+        self.loop.call_soon_threadsafe(self.queue.put_nowait, (event, data))
+
+
+    def release(self) -> None:
+        """
+        Free the place of an event taken from the queue.
+        """
+        self.__free.release()
+
+
+    def token(self, text: str) -> None:
+        self.partial += text
+        self.emit("token", {"text": text})
+
+
+    def cancel(self) -> None:
+        self.cancelled = True
+        self.cancellation.cancel()
+
+
+class ChatSession:
+    """
+    One user's model instance, prompt builder and current turn.
+    """
+
+    def __init__(self, session_id: str, model: Any) -> None:
+        self.id = session_id
+        self.model = model
+        self.prompts = Prompts(model)
+        self.lock = asyncio.Lock()
+        self.turn: Optional[Turn] = None
+        model.echo = False
+
+
+class ChatServer:
+    """
+    Asyncio HTTP server running chat turns for many sessions.
+
+    Model calls and tools are blocking, so each turn runs in a thread pool.
+    At most `max_concurrency` turns run at the same time, a session runs one
+    turn at a time, and the least recently used idle sessions are evicted
+    beyond `max_sessions` (a session store keeps their history).
+
+    @param model_factory: Creates the model of a new session from its id. Its `store`
+                          attribute, if any, is the session store of its models,
+                          used to delete the history of a session that is not loaded.
+    @param system_prompt: System prompt of every turn.
+    @param max_concurrency: Maximum number of turns running at the same time.
+    @param queue_size: Maximum number of events buffered per session.
+    @param max_sessions: Maximum number of sessions kept in memory.
+    @param max_tool_rounds: Tool rounds of one turn before the model must answer without tools.
+    @param session_budget: Tokens a session may use, None for unlimited.
+    @param turn_seconds: Time budget of one turn before the model must answer without tools,
+                         None for unlimited.
+    """
+
+    def __init__(self, model_factory: Callable[[str], Any],
+                 system_prompt: str = "",
+                 max_concurrency: int = 16,
+                 queue_size: int = 256,
+                 max_sessions: int = 1000,
+                 max_tool_rounds: int = 8,
+                 session_budget: Optional[int] = None,
+                 turn_seconds: Optional[float] = None) -> None:
+        self.model_factory = model_factory
+        self.system_prompt = system_prompt
+        self.max_concurrency = max_concurrency
+        self.queue_size = queue_size
+        self.max_sessions = max_sessions
+        self.max_tool_rounds = max_tool_rounds
+        self.turn_seconds = turn_seconds
+        self.ledger = UsageLedger(budget=session_budget)
+        self.sessions: "OrderedDict[str, ChatSession]" = OrderedDict()
+        self.active_turns = 0
+        self.__semaphore: Optional[asyncio.Semaphore] = None
+        self.__executor = ThreadPoolExecutor(max_workers=max_concurrency,
+                                             thread_name_prefix="chat-turn")
+
+
+    async def serve(self, host: str = "127.0.0.1", port: int = 8080,
+                    sock: Any = None, path: str = None) -> None:
+        """
+        Accept connections until cancelled.
+
+        @param sock: Already bound listening socket, instead of host and port.
+        @param path: Unix socket path to listen on, instead of host and port.
+        """
+        self.__semaphore = asyncio.Semaphore(self.max_concurrency)
+        if path is not None:
+            server = await asyncio.start_unix_server(self.handle_connection, path,
+                                                     limit=MAX_HEADER_BYTES)
+        elif sock is not None:
+            server = await asyncio.start_server(self.handle_connection, sock=sock,
+                                                limit=MAX_HEADER_BYTES)
+        else:
+            server = await asyncio.start_server(self.handle_connection, host, port,
+                                                limit=MAX_HEADER_BYTES)
+        async with server:
+            await server.serve_forever()
+
+
+    def close(self) -> None:
+        self.__executor.shutdown(wait=False, cancel_futures=True)
+
+
+    def session(self, session_id: str) -> ChatSession:
+        """
+        Get a session, creating it on first use.
+        """
+        session = self.sessions.get(session_id)
+        if session is None:
+            session = ChatSession(session_id, self.model_factory(session_id))
+            session.model.ledger = self.ledger
+            self.sessions[session_id] = session
+            self.__evict()
+        self.sessions.move_to_end(session_id)
+        return session
+
+
+    def __evict(self) -> None:
+        for session_id in list(self.sessions):
+            if len(self.sessions) <= self.max_sessions:
+                break
+            session = self.sessions[session_id]
+            if not session.lock.locked():
+                session.model.memory.unload()
+                del self.sessions[session_id]
+                self.ledger.forget(session_id)
+
+
+    # HTTP
+
+    async def handle_connection(self, reader: asyncio.StreamReader,
+                                writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                request = await read_request(reader)
+                if request is None:
+                    break
+                method, path, headers, body = request
+                keep_alive = await self.__route(method, path, headers, body, reader, writer)
+                if not keep_alive or headers.get("connection", "").lower() == "close":
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        except HTTPError as e:
+            await send_json(writer, e.status, {"error": e.message}, keep_alive=False)
+        finally:
+            writer.close()
+
+
+    async def __route(self, method: str, path: str, headers: Dict[str, str], body: bytes,
+                      reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> bool:
+        """
+        Dispatch a request.
+
+        @return: True if the connection can serve another request.
+        """
+        parts = path.split("?", 1)[0].strip("/").split("/")
+        if method == "GET" and parts == ["health"]:
+            await send_json(writer, 200, {"sessions": len(self.sessions),
+                                          "active_turns": self.active_turns})
+            return True
+        if method == "GET" and parts == ["metrics", "http"]:
+            await send_json(writer, 200, http_pool.metrics())
+            return True
+        if len(parts) < 2 or parts[0] != "sessions" or not parts[1]:
+            raise HTTPError(404, "Not found")
+
+        session_id = parts[1]
+        if method == "DELETE" and len(parts) == 2:
+            session = self.sessions.get(session_id)
+            if session is not None and session.lock.locked():
+                raise HTTPError(409, "Session is answering")
+            store = session.model.memory.store if session is not None \
+                else getattr(self.model_factory, "store", None)
+            self.sessions.pop(session_id, None)
+            self.ledger.forget(session_id)
+            if store is not None:
+                try:
+                    await asyncio.get_running_loop().run_in_executor(
+                        self.__executor, store.delete, session_id)
+                except Exception as e:
+                    raise HTTPError(500, f"Could not delete the session history: {e}")
+            await send_json(writer, 204, None)
+            return True
+        if method == "GET" and parts[2:] == ["usage"]:
+            await send_json(writer, 200, dict(self.ledger.totals(session_id),
+                                              remaining_tokens=self.ledger.remaining(session_id)))
+            return True
+        if method == "POST" and parts[2:] == ["messages"]:
+            await self.__serve_sse(self.session(session_id), parse_message(body), reader, writer)
+            return False
+        if method == "GET" and parts[2:] == ["ws"]:
+            await self.__serve_websocket(self.session(session_id), headers, reader, writer)
+            return False
+        raise HTTPError(404, "Not found")
+
+
+    async def __serve_sse(self, session: ChatSession, message: str,
+                          reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        if session.lock.locked():
+            raise HTTPError(409, "Session is already answering")
+        if self.ledger.exceeded(session.id):
+            raise HTTPError(429, "Token budget of the session is exhausted")
+
+        writer.write(b"HTTP/1.1 200 OK\r\n"
+                     b"Content-Type: text/event-stream\r\n"
+                     b"Cache-Control: no-cache\r\n"
+                     b"Connection: close\r\n\r\n")
+        await writer.drain()
+
+        async def send(event: str, data: Dict) -> None:
+            writer.write(f"event: {event}\ndata: {json.dumps(data)}\n\n".encode())
+            await writer.drain()
+
+        # An SSE client sends nothing more, EOF on the socket means it went away
+        disconnected = asyncio.ensure_future(reader.read())
+        try:
+            await self.run_turn(session, message, send, disconnected)
+        finally:
+            disconnected.cancel()
+
+
+    async def __serve_websocket(self, session: ChatSession, headers: Dict[str, str],
+                                reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        key = headers.get("sec-websocket-key")
+        if headers.get("upgrade", "").lower() != "websocket" or not key:
+            raise HTTPError(400, "Expected a WebSocket upgrade")
+        accept = base64.b64encode(hashlib.sha1((key + WEBSOCKET_GUID).encode()).digest()).decode()
+        writer.write(("HTTP/1.1 101 Switching Protocols\r\n"
+                      "Upgrade: websocket\r\n"
+                      "Connection: Upgrade\r\n"
+                      f"Sec-WebSocket-Accept: {accept}\r\n\r\n").encode())
+        await writer.drain()
+
+        async def send(event: str, data: Dict) -> None:
+            await write_frame(writer, 0x1, json.dumps({"event": event, "data": data}).encode())
+
+        # Frames are read in a task of their own so a close frame cancels the running turn
+        frames: asyncio.Queue = asyncio.Queue()
+        closed = asyncio.get_running_loop().create_future()
+
+        async def read_frames() -> None:
+            try:
+                while True:
+                    opcode, payload = await read_frame(reader)
+                    if opcode == 0x8:
+                        break
+                    if opcode == 0x9:
+                        await write_frame(writer, 0xA, payload)
+                    elif opcode == 0x1:
+                        await frames.put(payload)
+            except (ConnectionError, asyncio.IncompleteReadError):
+                pass
+            finally:
+                if not closed.done():
+                    closed.set_result(None)
+
+        frame_reader = asyncio.ensure_future(read_frames())
+        try:
+            while not closed.done():
+                getter = asyncio.ensure_future(frames.get())
+                await asyncio.wait({getter, closed}, return_when=asyncio.FIRST_COMPLETED)
+                if not getter.done():
+                    getter.cancel()
+                    break
+                try:
+                    message = parse_message(getter.result())
+                except HTTPError as e:
+                    await send("error", {"error": e.message})
+                    continue
+                if session.lock.locked():
+                    await send("error", {"error": "Session is already answering"})
+                    continue
+                await self.run_turn(session, message, send, closed)
+            await write_frame(writer, 0x8, b"")
+        except ConnectionError:
+            pass
+        finally:
+            frame_reader.cancel()
+
+
+    # Turns
+
+    async def run_turn(self, session: ChatSession, message: str,
+                       send: Callable[[str, Dict], Awaitable[None]],
+                       disconnected: "asyncio.Future" = None) -> None:
+        """
+        Run one user turn and stream its events.
+
+        The turn is cancelled if sending fails or `disconnected` completes.
+        """
+        loop = asyncio.get_running_loop()
+        async with session.lock:
+            turn = Turn(loop, self.queue_size)
+            async with self.__semaphore:
+                session.turn = turn
+                self.active_turns += 1
+                producer = loop.run_in_executor(self.__executor, self.__turn, session, message, turn)
+                try:
+                    while True:
+                        getter = asyncio.ensure_future(turn.queue.get())
+                        waits = {getter, producer}
+                        if disconnected is not None:
+                            waits.add(disconnected)
+                        done, _ = await asyncio.wait(waits, return_when=asyncio.FIRST_COMPLETED)
+                        if getter in done:
+                            turn.release()
+                            await send(*getter.result())
+                            continue
+                        getter.cancel()
+                        if producer not in done:
+                            break
+                        while not turn.queue.empty():
+                            turn.release()
+                            await send(*turn.queue.get_nowait())
+                        break
+                finally:
+                    turn.cancel()
+                    # The thread keeps its pool slot until the model call notices the cancellation
+                    await asyncio.shield(producer)
+                    session.turn = None
+                    self.active_turns -= 1
+
+
+    def __turn(self, session: ChatSession, message: str, turn: Turn) -> None:
+        """
+        The blocking tool loop of `main.py`, run in a pool thread.
+        """
+        model = session.model
+        if self.ledger.exceeded(session.id):
+            turn.emit("error", {"error": "Token budget of the session is exhausted"})
+            return
+        model.add_to_memory("user", session.prompts.build(message))
+        deadline = Deadline(self.turn_seconds, self.max_tool_rounds)
+        try:
+            # Ends once the deadline is spent, the model is then asked for an answer without tools
+            while True:
+                response = model.invoke(system_prompt=self.system_prompt, streaming=True,
+                                        on_token=turn.token, cancel=turn.cancellation,
+                                        dispatch_tools=True, deadline=deadline)
+                if response is None:
+                    turn.emit("error", {"error": "Model invocation failed"})
+                    break
+                if response.stop_reason == "cancelled":
+                    break
+                if response.stop_reason != "tool_use":
+                    model.add_to_memory("assistant", response.response or "(no answer in time)")
+                    turn.emit("done", {"stop_reason": response.stop_reason})
+                    break
+                if self.ledger.exceeded(session.id):
+                    # No more tool rounds, the turn ends on the text answered so far
+                    model.cancel_tools(response.tool)
+                    model.add_to_memory("assistant", response.response or "(token budget exhausted)")
+                    turn.emit("done", {"stop_reason": "budget_exceeded"})
+                    break
+                model.add_tool_to_memory(response.body)
+                for tool in response.tool:
+                    turn.emit("tool_start", {"name": tool.name, "input": tool.input})
+                results = model.tool_use(response.tool, deadline)
+                model.add_tool_result_to_memory(results)
+                turn.emit("tool_end", {"names": [tool.name for tool in response.tool]})
+        except TurnCancelled:
+            pass
+        except Exception as e:
+            if not turn.cancelled:
+                cprint(f"Error in session {session.id}: {e}", "red")
+                try:
+                    turn.emit("error", {"error": str(e)})
+                except TurnCancelled:
+                    pass
+        finally:
+            self.__close_turn(model, turn)
+
+
+    @staticmethod
+    def __close_turn(model: Any, turn: Turn) -> None:
+        """
+        Leave the history valid for the next turn when a turn stopped halfway:
+        every tool use gets a result and the user is answered.
+        """
+        messages = model.memory.messages
+        if not messages:
+            return
+        last = messages[-1]
+        if last.role == model.ASSISTANT_ROLE:
+            pending = [block for block in last.content if block.type == "tool_use"]
+            if not pending:
+                return
+            model.add_tool_result_to_memory([ToolResult(block.id, "Cancelled.") for block in pending])
+        model.add_to_memory("assistant", turn.partial or "(cancelled)")
+
+
+class HTTPError(Exception):
+
+    def __init__(self, status: int, message: str) -> None:
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+async def read_request(reader: asyncio.StreamReader) -> Optional[Tuple[str, str, Dict[str, str], bytes]]:
+    """
+    Read one HTTP/1.1 request.
+
+    @return: (method, path, lower-cased headers, body), None on a clean EOF.
+    """
+    try:
+        head = await reader.readuntil(b"\r\n\r\n")
+    except asyncio.IncompleteReadError as e:
+        if not e.partial:
+            return None
+        raise
+    except asyncio.LimitOverrunError:
+        raise HTTPError(413, "Request headers too large")
+
+    lines = head.decode("latin-1").split("\r\n")
+    try:
+        method, path, _ = lines[0].split(" ", 2)
+    except ValueError:
+        raise HTTPError(400, "Malformed request line")
+    headers = {}
+    for line in lines[1:]:
+        if ":" in line:
+            name, value = line.split(":", 1)
+            headers[name.strip().lower()] = value.strip()
+
+    length = int(headers.get("content-length") or 0)
+    if length > MAX_BODY_BYTES:
+        raise HTTPError(413, "Request body too large")
+    body = await reader.readexactly(length) if length else b""
+    return method.upper(), path, headers, body
+
+
+def parse_message(body: bytes) -> str:
+    try:
+        message = json.loads(body)["message"]
+    except (ValueError, KeyError, TypeError):
+        raise HTTPError(400, 'Expected a JSON body {"message": "..."}')
+    if not isinstance(message, str) or not message.strip():
+        raise HTTPError(400, "Message must be a non-empty string")
+    return message
+
+
+async def send_json(writer: asyncio.StreamWriter, status: int, data: Any,
+                    keep_alive: bool = True) -> None:
+    body = b"" if data is None else json.dumps(data).encode()
+    head = f"HTTP/1.1 {status} {STATUS_TEXT.get(status, '')}\r\n"
+    if data is not None:
+        head += "Content-Type: application/json\r\n"
+    head += f"Content-Length: {len(body)}\r\n"
+    head += f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+    writer.write(head.encode() + body)
+    await writer.drain()
+
+
+async def read_frame(reader: asyncio.StreamReader) -> Tuple[int, bytes]:
+    """
+    Read one WebSocket message, joining fragmented frames.
+
+    @return: (opcode, unmasked payload).
+    """
+    opcode, payload = None, b""
+    while True:
+        first, second = await reader.readexactly(2)
+        length = second & 0x7F
+        if length == 126:
+            length = struct.unpack("!H", await reader.readexactly(2))[0]
+        elif length == 127:
+            length = struct.unpack("!Q", await reader.readexactly(8))[0]
+        if length > MAX_BODY_BYTES:
+            raise ConnectionError("WebSocket frame too large")
+        mask = await reader.readexactly(4) if second & 0x80 else None
+        data = await reader.readexactly(length)
+        if mask:
+            data = bytes(byte ^ mask[i % 4] for i, byte in enumerate(data))
+
+        frame_opcode = first & 0x0F
+        if frame_opcode >= 0x8:
+            # Control frames may come between fragments and are never fragmented
+            return frame_opcode, data
+        if frame_opcode != 0x0:
+            opcode = frame_opcode
+        payload += data
+        if first & 0x80:
+            return opcode, payload
+
+
+async def write_frame(writer: asyncio.StreamWriter, opcode: int, payload: bytes) -> None:
+    """
+    Write one unfragmented, unmasked (server to client) WebSocket frame.
+    """
+    length = len(payload)
+    if length < 126:
+        head = struct.pack("!BB", 0x80 | opcode, length)
+    elif length < 1 << 16:
+        head = struct.pack("!BBH", 0x80 | opcode, 126, length)
+    else:
+        head = struct.pack("!BBQ", 0x80 | opcode, 127, length)
+    writer.write(head + payload)
+    await writer.drain()
+
+
+def claude_factory(model_name: str = "3.5-sonnet",
+                   region: str = "us-east-1",
+                   max_chat_memory: int = 10,
+                   store_path: str = None) -> Callable[[str], Any]:
+    """
+    Model factory giving each session a Claude with the demo tools.
+
+    @param store_path: Optional SQLite file, so evicted or restarted sessions keep their history.
+    """
+    import boto3
+    from techxmodule.models.chat import Claude
+    from techxmodule.store import SQLiteSessionStore
+    from toolsdata import return_tool
+
+    boto_session = boto3.Session()
+    store = SQLiteSessionStore(store_path) if store_path else None
+    tool_list = return_tool()
+
+    def create(session_id: str) -> Any:
+        model = Claude(model_name, boto_session, region, max_chat_memory,
+                       session_store=store, session_id=session_id)
+        model.tool_add(tool_list)
+        return model
+    # Lets the server delete the history of sessions it has not loaded
+    create.store = store
+    return create
+
+
+def main() -> None:
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Multi-session chat server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--model", default="3.5-sonnet")
+    parser.add_argument("--region", default="us-east-1")
+    parser.add_argument("--max-chat-memory", type=int, default=10)
+    parser.add_argument("--max-concurrency", type=int, default=16)
+    parser.add_argument("--max-sessions", type=int, default=1000)
+    parser.add_argument("--store", help="SQLite file keeping the chat histories")
+    parser.add_argument("--system-prompt", default="")
+    parser.add_argument("--session-budget", type=int,
+                        help="Tokens each session may use, unlimited by default")
+    parser.add_argument("--turn-seconds", type=float,
+                        help="Time budget of a turn before answering without tools, unlimited by default")
+    parser.add_argument("--max-tool-rounds", type=int, default=8)
+    parser.add_argument("--workers", type=int, default=0,
+                        help="Number of worker processes, 0 to serve in this process")
+    args = parser.parse_args()
+
+    builder_args = (args.model, args.region, args.max_chat_memory, args.store)
+    server_options = {"system_prompt": args.system_prompt,
+                      "max_concurrency": args.max_concurrency,
+                      "max_sessions": args.max_sessions,
+                      "session_budget": args.session_budget,
+                      "turn_seconds": args.turn_seconds,
+                      "max_tool_rounds": args.max_tool_rounds}
+    cprint(f"Serving on http://{args.host}:{args.port}", "cyan")
+
+    if args.workers:
+        from techxmodule.workers import Supervisor
+
+        supervisor = Supervisor(claude_factory, builder_args, args.workers, server_options)
+        try:
+            asyncio.run(supervisor.serve(args.host, args.port))
+        except KeyboardInterrupt:
+            pass
+        return
+
+    server = ChatServer(claude_factory(*builder_args), **server_options)
+    try:
+        asyncio.run(server.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+
+
+if __name__ == "__main__":
+    main()
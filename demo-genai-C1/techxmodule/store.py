@@ -0,0 +1,295 @@
+import json
+import sqlite3
+import threading
+
+from abc import ABC, abstractmethod
+from functools import partial
+from typing import Dict, List, Tuple
+from techxmodule.messages import ContentBlock, Image, Message, block_from_payload
+
+
+class SessionStore(ABC):
+    """
+    Base class of the persistent chat histories.
+
+    Messages of a session are numbered by a sequence that starts at 0. They are
+    appended as they arrive and never rewritten as a whole; a message changed
+    in place (e.g. by the history sanitizer) is written back on its own.
+    """
+
+    @abstractmethod
+    def append(self, session_id: str, messages: List[Message]) -> List[int]:
+        """
+        Store new messages at the end of a session.
+
+        @param session_id: Session the messages belong to.
+        @param messages: Messages in the order they were added.
+        @return: Sequence numbers given to the messages.
+        """
+
+
+    @abstractmethod
+    def update(self, session_id: str, seq: int, message: Message) -> None:
+        """
+        Replace one stored message.
+
+        @param session_id: Session of the message.
+        @param seq: Sequence number of the message.
+        @param message: New content of the message.
+        """
+
+
+    @abstractmethod
+    def load(self, session_id: str, limit: int) -> List[Tuple[int, Message]]:
+        """
+        Read the most recent messages of a session.
+
+        @param session_id: Session to read.
+        @param limit: Maximum number of messages.
+        @return: (sequence number, message) pairs, oldest first.
+        """
+
+
+    @abstractmethod
+    def count(self, session_id: str) -> int:
+        """
+        Number of messages stored for a session.
+        """
+
+
+    @abstractmethod
+    def delete(self, session_id: str) -> None:
+        """
+        Remove a session and all of its messages.
+        """
+
+
+    def close(self) -> None:
+        pass
+
+
+class InMemorySessionStore(SessionStore):
+    """
+    Session store kept in process memory, for a single process and for testing.
+    """
+
+    def __init__(self) -> None:
+        self.__sessions: Dict[str, List[Message]] = {}
+        self.__lock = threading.Lock()
+
+
+    def append(self, session_id: str, messages: List[Message]) -> List[int]:
+        with self.__lock:
+            history = self.__sessions.setdefault(session_id, [])
+            start = len(history)
+            history.extend(messages)
+        return list(range(start, start + len(messages)))
+
+
+    def update(self, session_id: str, seq: int, message: Message) -> None:
+        with self.__lock:
+            self.__sessions[session_id][seq] = message
+
+
+    def load(self, session_id: str, limit: int) -> List[Tuple[int, Message]]:
+        with self.__lock:
+            history = self.__sessions.get(session_id, [])
+            start = max(len(history) - limit, 0)
+            return list(enumerate(history[start:], start=start))
+
+
+    def count(self, session_id: str) -> int:
+        with self.__lock:
+            return len(self.__sessions.get(session_id, []))
+
+
+    def delete(self, session_id: str) -> None:
+        with self.__lock:
+            self.__sessions.pop(session_id, None)
+
+
+class SQLiteSessionStore(SessionStore):
+    """
+    Session store in a SQLite database in WAL mode.
+
+    Readers do not block the writer, so many sessions (and several worker
+    processes) can share one file. Each thread gets its own connection.
+
+    Images are stored once per content digest as raw bytes in their own
+    table, and messages only refer to them: a reloaded image is a lazy
+    `Image.from_loader` reading its blob when a payload is built, so a
+    store-backed history keeps the memory savings of lazy images.
+
+    @param path: Database file.
+    @param timeout: Seconds to wait for a lock held by another connection.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS messages (
+            session_id TEXT NOT NULL,
+            seq INTEGER NOT NULL,
+            role TEXT NOT NULL,
+            content TEXT NOT NULL,
+            marks INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (session_id, seq)
+        ) WITHOUT ROWID
+    """
+    IMAGE_SCHEMA = (
+        """
+        CREATE TABLE IF NOT EXISTS images (
+            digest TEXT PRIMARY KEY,
+            data BLOB NOT NULL
+        ) WITHOUT ROWID
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS image_refs (
+            session_id TEXT NOT NULL,
+            digest TEXT NOT NULL,
+            PRIMARY KEY (session_id, digest)
+        ) WITHOUT ROWID
+        """,
+    )
+
+
+    def __init__(self, path: str, timeout: float = 30.0) -> None:
+        self.path = path
+        self.timeout = timeout
+        self.__local = threading.local()
+        self.__connections: List[sqlite3.Connection] = []
+        self.__lock = threading.Lock()
+        connection = self.__connection()
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute(self.SCHEMA)
+        for schema in self.IMAGE_SCHEMA:
+            connection.execute(schema)
+
+
+    def __connection(self) -> sqlite3.Connection:
+        connection = getattr(self.__local, "connection", None)
+        if connection is None:
+            # Autocommit mode, transactions are opened explicitly where needed
+            connection = sqlite3.connect(self.path, timeout=self.timeout,
+                                         isolation_level=None, check_same_thread=False)
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self.__local.connection = connection
+            with self.__lock:
+                self.__connections.append(connection)
+        return connection
+
+
+    @staticmethod
+    def __dump(connection: sqlite3.Connection, session_id: str, message: Message) -> str:
+        """
+        JSON content of a message, its images stored apart and referred to by digest.
+        """
+        content = []
+        for block in message.content:
+            if block.type != "image":
+                content.append(block.to_payload())
+                continue
+            image = block.image
+            if connection.execute("SELECT 1 FROM images WHERE digest = ?", (image.digest,)).fetchone() is None:
+                with image.open() as file:
+                    connection.execute("INSERT INTO images (digest, data) VALUES (?, ?)",
+                                       (image.digest, file.read()))
+            connection.execute("INSERT OR IGNORE INTO image_refs (session_id, digest) VALUES (?, ?)",
+                               (session_id, image.digest))
+            content.append({"type": "image", "source": {"type": image.type, "media_type": image.media_type,
+                                                         "digest": image.digest, "size": image.size}})
+        return json.dumps(content, ensure_ascii=False)
+
+
+    def __parse(self, role: str, content: str, marks: int) -> Message:
+        blocks = []
+        for block in json.loads(content):
+            source = block.get("source", {})
+            if block["type"] == "image" and "digest" in source:
+                blocks.append(ContentBlock("image", image=Image.from_loader(
+                    partial(self.__image_bytes, source["digest"]),
+                    source["media_type"], source["digest"], source["size"])))
+            else:
+                blocks.append(block_from_payload(block))
+        return Message(role, blocks, marks)
+
+
+    def __image_bytes(self, digest: str) -> bytes:
+        row = self.__connection().execute("SELECT data FROM images WHERE digest = ?", (digest,)).fetchone()
+        if row is None:
+            raise KeyError(f"Image {digest} is not in the store")
+        return bytes(row[0])
+
+
+    def append(self, session_id: str, messages: List[Message]) -> List[int]:
+        if not messages:
+            return []
+        connection = self.__connection()
+        # Take the write lock first so two writers can not read the same last sequence number
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            start = connection.execute(
+                "SELECT COALESCE(MAX(seq), -1) + 1 FROM messages WHERE session_id = ?",
+                (session_id,)
+            ).fetchone()[0]
+            connection.executemany(
+                "INSERT INTO messages (session_id, seq, role, content, marks) VALUES (?, ?, ?, ?, ?)",
+                [(session_id, start + i, message.role, self.__dump(connection, session_id, message),
+                  message.marks)
+                 for i, message in enumerate(messages)]
+            )
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        return list(range(start, start + len(messages)))
+
+
+    def update(self, session_id: str, seq: int, message: Message) -> None:
+        connection = self.__connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            connection.execute(
+                "UPDATE messages SET role = ?, content = ?, marks = ? WHERE session_id = ? AND seq = ?",
+                (message.role, self.__dump(connection, session_id, message), message.marks, session_id, seq)
+            )
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+
+
+    def load(self, session_id: str, limit: int) -> List[Tuple[int, Message]]:
+        rows = self.__connection().execute(
+            "SELECT seq, role, content, marks FROM messages WHERE session_id = ? "
+            "ORDER BY seq DESC LIMIT ?",
+            (session_id, limit)
+        ).fetchall()
+        return [(seq, self.__parse(role, content, marks))
+                for seq, role, content, marks in reversed(rows)]
+
+
+    def count(self, session_id: str) -> int:
+        return self.__connection().execute(
+            "SELECT COUNT(*) FROM messages WHERE session_id = ?", (session_id,)
+        ).fetchone()[0]
+
+
+    def delete(self, session_id: str) -> None:
+        connection = self.__connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            connection.execute("DELETE FROM messages WHERE session_id = ?", (session_id,))
+            connection.execute("DELETE FROM image_refs WHERE session_id = ?", (session_id,))
+            # Images are shared between sessions, only those no session refers to go
+            connection.execute("DELETE FROM images WHERE digest NOT IN (SELECT digest FROM image_refs)")
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+
+
+    def close(self) -> None:
+        with self.__lock:
+            for connection in self.__connections:
+                connection.close()
+            self.__connections.clear()
+        self.__local = threading.local()
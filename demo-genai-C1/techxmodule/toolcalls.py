@@ -0,0 +1,143 @@
+import ast
+
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import List, Any, Callable, Optional
+from techxmodule.messages import ToolUse
+
+
+class ToolCallError(ValueError):
+    """
+    Raised when a tool call emitted by a model can not be parsed or is invalid.
+    """
+
+
+class ToolCallParser:
+    """
+    Incremental parser for the pythonic tool call lists Llama emits,
+    `[func_name1(param=value, ...), func_name2(...)]`.
+
+    Text is fed chunk by chunk while streaming. The first non-blank character
+    decides whether the answer is a tool call list, and the list is parsed as
+    soon as its closing bracket arrives, without waiting for the stream to end.
+    """
+
+    PYTHON_TAG = "<|python_tag|>"
+    LITERAL_NAMES = {"true": True, "false": False, "null": None,
+                     "True": True, "False": False, "None": None}
+
+
+    def __init__(self) -> None:
+        self.text = ""
+        self.is_tool_call: Optional[bool] = None
+        self.calls: Optional[List[ToolUse]] = None
+        self.__start = 0
+        self.__scanned = 0
+        self.__depth = 0
+        self.__quote = None
+        self.__escaped = False
+
+
+    def feed(self, chunk: str) -> bool:
+        """
+        Add streamed text.
+
+        @param chunk: Next piece of generated text.
+        @return: True once a complete tool call list has been parsed.
+        """
+        self.text += chunk
+        if self.is_tool_call is None:
+            stripped = self.text.lstrip()
+            if stripped.startswith(self.PYTHON_TAG):
+                stripped = stripped[len(self.PYTHON_TAG):].lstrip()
+            if not stripped or self.PYTHON_TAG.startswith(stripped):
+                return False
+            self.is_tool_call = stripped[0] == "["
+            self.__start = self.__scanned = len(self.text) - len(stripped)
+        if not self.is_tool_call or self.calls is not None:
+            return self.calls is not None
+
+        # Track bracket depth outside of string literals, only over the new characters
+        for i in range(self.__scanned, len(self.text)):
+            char = self.text[i]
+            if self.__quote:
+                if self.__escaped:
+                    self.__escaped = False
+                elif char == "\\":
+                    self.__escaped = True
+                elif char == self.__quote:
+                    self.__quote = None
+            elif char in "\"'":
+                self.__quote = char
+            elif char in "[(":
+                self.__depth += 1
+            elif char in "])":
+                self.__depth -= 1
+                if self.__depth == 0:
+                    self.calls = self.parse(self.text[self.__start:i + 1])
+                    return True
+        self.__scanned = len(self.text)
+        return False
+
+
+    @classmethod
+    def parse(cls, text: str) -> List[ToolUse]:
+        """
+        Parse a complete tool call list.
+
+        @param text: Text such as `[get_article(search_term="Nam Cao")]`.
+        @return: List of calls, without ids since Llama does not give any.
+        @raises ToolCallError: If the text is not a list of keyword-only calls with literal values.
+        """
+        try:
+            tree = ast.parse(text.strip(), mode="eval").body
+        except SyntaxError as e:
+            raise ToolCallError(f"Invalid tool call syntax: {e}") from e
+        if not isinstance(tree, ast.List):
+            raise ToolCallError("Tool calls must be a list")
+
+        calls = []
+        for node in tree.elts:
+            if not isinstance(node, ast.Call) or not isinstance(node.func, ast.Name):
+                raise ToolCallError(f"Invalid tool call: {ast.unparse(node)}")
+            if node.args:
+                raise ToolCallError(f"Tool {node.func.id} must be called with named parameters")
+            calls.append(ToolUse(None, node.func.id, {
+                keyword.arg: cls.__literal(keyword.value) for keyword in node.keywords
+            }))
+        return calls
+
+
+    @classmethod
+    def __literal(cls, node: ast.AST) -> Any:
+        if isinstance(node, ast.Name) and node.id in cls.LITERAL_NAMES:
+            return cls.LITERAL_NAMES[node.id]
+        try:
+            return ast.literal_eval(node)
+        except ValueError as e:
+            raise ToolCallError(f"Parameter value must be a literal: {ast.unparse(node)}") from e
+
+
+def run_concurrently(calls: List[ToolUse],
+                     tool_function: Callable[[str], Callable],
+                     max_workers: int = 8,
+                     timeout: Optional[float] = None) -> List[Any]:
+    """
+    Execute tool calls in parallel threads.
+
+    @param calls: Parsed calls.
+    @param tool_function: Resolves a tool name to its function.
+    @param max_workers: Maximum number of tools running at the same time.
+    @param timeout: Seconds to wait for the calls, None to wait until they finish.
+    @return: Tool results, in the order of the calls, None for a call still running at the timeout.
+    """
+    if not calls:
+        return []
+    executor = ThreadPoolExecutor(max_workers=min(max_workers, len(calls)))
+    try:
+        futures = [executor.submit(tool_function(call.name), **call.input)
+                   for call in calls]
+        wait(futures, timeout)
+        return [future.result() if future.done() else None for future in futures]
+    finally:
+        # Calls still running at the timeout finish in the background, their results dropped
+        executor.shutdown(wait=False, cancel_futures=True)
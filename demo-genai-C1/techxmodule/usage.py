@@ -0,0 +1,208 @@
+import threading
+import time
+
+from collections import deque
+from typing import Any, Deque, Dict, Optional
+
+
+# On-demand prices in USD per million tokens: input, output, cache write, cache read.
+# Estimates only, check the Bedrock pricing page of your region.
+PRICES: Dict[str, tuple] = {
+    "anthropic.claude-3-haiku-20240307-v1:0": (0.25, 1.25, 0.3, 0.03),
+    "anthropic.claude-3-sonnet-20240229-v1:0": (3.0, 15.0, 3.75, 0.3),
+    "us.anthropic.claude-3-opus-20240229-v1:0": (15.0, 75.0, 18.75, 1.5),
+    "anthropic.claude-3-5-sonnet-20240620-v1:0": (3.0, 15.0, 3.75, 0.3),
+    "us.meta.llama3-2-1b-instruct-v1:0": (0.1, 0.1, 0.0, 0.0),
+    "us.meta.llama3-2-3b-instruct-v1:0": (0.15, 0.15, 0.0, 0.0),
+    "us.meta.llama3-2-11b-instruct-v1:0": (0.35, 0.35, 0.0, 0.0),
+    "us.meta.llama3-2-90b-instruct-v1:0": (2.0, 2.0, 0.0, 0.0),
+}
+
+
+class Usage:
+    """
+    Tokens of one model invocation.
+
+    @param input_tokens: prompt tokens, without the cached ones
+    @param output_tokens: generated tokens
+    @param cache_read_tokens: prompt tokens read from the prompt cache
+    @param cache_write_tokens: prompt tokens written to the prompt cache
+    """
+
+    __slots__ = ("input_tokens", "output_tokens", "cache_read_tokens", "cache_write_tokens")
+
+    def __init__(self, input_tokens: int = 0, output_tokens: int = 0,
+                 cache_read_tokens: int = 0, cache_write_tokens: int = 0) -> None:
+        self.input_tokens = input_tokens
+        self.output_tokens = output_tokens
+        self.cache_read_tokens = cache_read_tokens
+        self.cache_write_tokens = cache_write_tokens
+
+
+    @classmethod
+    def from_claude(cls, usage: dict) -> "Usage":
+        """
+        Usage of a Claude message, from its `usage` field.
+        """
+        return cls(usage.get("input_tokens") or 0,
+                   usage.get("output_tokens") or 0,
+                   usage.get("cache_read_input_tokens") or 0,
+                   usage.get("cache_creation_input_tokens") or 0)
+
+
+    @property
+    def total_tokens(self) -> int:
+        return self.input_tokens + self.output_tokens + self.cache_read_tokens + self.cache_write_tokens
+
+
+class UsageRecord:
+    """
+    Usage of one invocation, attributed to its session, model and tool loop iteration.
+
+    @param iteration: 0 for the call answering the user, n for the call after n tool rounds
+    """
+
+    __slots__ = ("session_id", "model_id", "iteration", "usage", "cost", "time")
+
+    def __init__(self, session_id: str, model_id: str, iteration: int, usage: Usage, cost: float) -> None:
+        self.session_id = session_id
+        self.model_id = model_id
+        self.iteration = iteration
+        self.usage = usage
+        self.cost = cost
+        self.time = time.time()
+
+
+class UsageLedger:
+    """
+    Thread-safe ledger of the tokens and the estimated cost of model invocations.
+
+    A model with a ledger (`model.ledger = ledger`) records every invocation.
+    Sessions can be given a token budget; once it is spent, `exceeded` tells
+    the tool loops to stop calling tools and finish the turn.
+
+    Usage is summed as it is recorded into running totals by session, model
+    and tool loop iteration, so the ledger of a long-running server stays
+    small; only the last `max_records` raw records are kept, and `forget`
+    drops a session.
+
+    @param prices: USD per million tokens by model ID: input, output, cache write, cache read
+    @param budget: Default token budget of every session, None for unlimited.
+    @param max_records: Number of most recent raw records kept in `records`.
+    """
+
+    FIELDS = ("calls", "input_tokens", "output_tokens", "cache_read_tokens", "cache_write_tokens", "cost")
+
+    def __init__(self, prices: Dict[str, tuple] = PRICES, budget: Optional[int] = None,
+                 max_records: int = 1000) -> None:
+        self.prices = prices
+        self.budget = budget
+        self.records: Deque[UsageRecord] = deque(maxlen=max_records)
+        self.__totals: Dict[tuple, Dict] = {}
+        self.__budgets: Dict[str, Optional[int]] = {}
+        self.__session_tokens: Dict[str, int] = {}
+        self.__lock = threading.Lock()
+
+
+    def record(self, session_id: str, model_id: str, iteration: int, usage: Usage) -> UsageRecord:
+        """
+        Record the usage of an invocation.
+
+        @return: The record, with its estimated cost.
+        """
+        record = UsageRecord(session_id, model_id, iteration, usage, self.cost(model_id, usage))
+        with self.__lock:
+            self.records.append(record)
+            total = self.__totals.get((session_id, model_id, iteration))
+            if total is None:
+                total = self.__totals[(session_id, model_id, iteration)] = dict.fromkeys(self.FIELDS, 0)
+            total["calls"] += 1
+            total["input_tokens"] += usage.input_tokens
+            total["output_tokens"] += usage.output_tokens
+            total["cache_read_tokens"] += usage.cache_read_tokens
+            total["cache_write_tokens"] += usage.cache_write_tokens
+            total["cost"] += record.cost
+            self.__session_tokens[session_id] = self.__session_tokens.get(session_id, 0) + usage.total_tokens
+        return record
+
+
+    def cost(self, model_id: str, usage: Usage) -> float:
+        """
+        Estimated cost in USD, 0 for a model without price.
+        """
+        input_price, output_price, write_price, read_price = self.prices.get(model_id, (0, 0, 0, 0))
+        return (usage.input_tokens * input_price + usage.output_tokens * output_price +
+                usage.cache_write_tokens * write_price + usage.cache_read_tokens * read_price) / 1e6
+
+
+    def set_budget(self, session_id: str, max_tokens: Optional[int]) -> None:
+        """
+        Set the token budget of a session, None for unlimited.
+        """
+        with self.__lock:
+            self.__budgets[session_id] = max_tokens
+
+
+    def remaining(self, session_id: str) -> Optional[int]:
+        """
+        Tokens left in the budget of a session, None without budget.
+        """
+        with self.__lock:
+            budget = self.__budgets.get(session_id, self.budget)
+            if budget is None:
+                return None
+            return budget - self.__session_tokens.get(session_id, 0)
+
+
+    def exceeded(self, session_id: str) -> bool:
+        remaining = self.remaining(session_id)
+        return remaining is not None and remaining <= 0
+
+
+    def forget(self, session_id: str) -> None:
+        """
+        Drop the totals, the records and the budget of a session.
+        """
+        with self.__lock:
+            for key in [key for key in self.__totals if key[0] == session_id]:
+                del self.__totals[key]
+            self.__budgets.pop(session_id, None)
+            self.__session_tokens.pop(session_id, None)
+            kept = [record for record in self.records if record.session_id != session_id]
+            self.records.clear()
+            self.records.extend(kept)
+
+
+    def totals(self, session_id: str = None, model_id: str = None, group_by: str = None) -> Dict:
+        """
+        Sum the usage, optionally filtered by session and model.
+
+        @param group_by: "session_id", "model_id" or "iteration" to get one total per value.
+        @return: Totals of tokens and cost, or a dict of them by the grouped value.
+        """
+        position = {"session_id": 0, "model_id": 1, "iteration": 2}
+        with self.__lock:
+            groups: Dict[Any, Dict] = {}
+            for key, total in self.__totals.items():
+                if (session_id is not None and key[0] != session_id) \
+                        or (model_id is not None and key[1] != model_id):
+                    continue
+                group = groups.setdefault(key[position[group_by]] if group_by else None,
+                                          dict.fromkeys(self.FIELDS, 0))
+                for field in self.FIELDS:
+                    group[field] += total[field]
+        if group_by:
+            return groups
+        return groups.get(None, dict.fromkeys(self.FIELDS, 0))
+
+
+    def report(self, session_id: str = None) -> str:
+        """
+        @return: One line per model with the tokens and the estimated cost.
+        """
+        lines = []
+        for model_id, total in self.totals(session_id, group_by="model_id").items():
+            lines.append(f"{model_id}: {total['calls']} calls, {total['input_tokens']} in / "
+                         f"{total['output_tokens']} out / {total['cache_read_tokens']} cache read / "
+                         f"{total['cache_write_tokens']} cache write tokens, ~${total['cost']:.4f}")
+        return "\n".join(lines)
@@ -1,10 +1,13 @@
 import json
 import re
+import os
+import time
 import pytz
 
-import platform,socket,re,uuid,json,psutil,logging # type: ignore
+import platform,socket,re,uuid,json,logging # type: ignore
+from concurrent.futures import Future
 from datetime import datetime
-import geocoder, geopy      # type: ignore
+from threading import Thread, Lock
 
 from termcolor import cprint # type: ignore
     
@@ -18,10 +21,9 @@ def combine_string(list_of_string: list) -> str:
     @return: A single string formed by joining the input strings with newline characters.
     """
     
-    result = ""
-    for s in list_of_string:
-        result = result + s + "\n"
-    return result
+    if not list_of_string:
+        return ""
+    return "\n".join(list_of_string) + "\n"
         
 
 def iterate_through_location(location: json):
@@ -69,14 +71,19 @@ def sanitize_input(text: str) -> str:
     return text
         
         
+# Compiled once, DOTALL so multi-line blocks are removed too
+_CLEAN_TAG_PATTERN = re.compile(r"<(instructions|examples|context|documents)>.*?</\1>", re.DOTALL)
+
+
 def clean_tag(string: str) -> str:
     """
     Function to remove text between specified tag from a string
     """
-    return re.sub(r"<(instructions|examples|context|documents)>.*?</\1>", "", string)
+    return _CLEAN_TAG_PATTERN.sub("", string)
 
 
 def system() -> str:
+    import psutil   # type: ignore
     try:
         info={}
         info['platform']=platform.system()
@@ -94,8 +101,111 @@ def system() -> str:
         
     
 def location():
+    # The geo stack is slow to import and only needed here
+    import geocoder             # type: ignore
+    import geopy.geocoders      # type: ignore
     return geopy.geocoders.Nominatim(user_agent="GetLoc").reverse(geocoder.ip('me').latlng)
 
 
+PROBE_CACHE_PATH = os.path.join(os.path.expanduser("~"), ".cache", "techxmodule", "environment.json")
+PROBE_TTL = {
+    "system": 24 * 3600,
+    "location": 3600,
+}
+_probe_cache_lock = Lock()
+
+
+def cached_probe(name: str, probe, ttl: float, path: str = PROBE_CACHE_PATH) -> str:
+    """
+    Return a probed environment value, from an on-disk cache while it is fresh.
+
+    @param name: Cache key of the value.
+    @param probe: Function computing the value when the cache is missing or stale.
+    @param ttl: Seconds a cached value stays valid.
+    @param path: JSON cache file.
+    @return: The value as a string, "unknown" if the probe failed.
+    """
+    with _probe_cache_lock:
+        cache = _read_probe_cache(path)
+    entry = cache.get(name)
+    if entry and time.time() - entry["time"] < ttl:
+        return entry["value"]
+
+    try:
+        value = probe()
+    except Exception as e:
+        logging.warning(f"Environment probe {name} failed: {e}")
+        value = None
+    if value is None:
+        # Failed probes are not cached so the next start tries again
+        return "unknown"
+
+    value = str(value)
+    with _probe_cache_lock:
+        cache = _read_probe_cache(path)
+        cache[name] = {"time": time.time(), "value": value}
+        _write_probe_cache(path, cache)
+    return value
+
+
+def _read_probe_cache(path: str) -> dict:
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _write_probe_cache(path: str, cache: dict) -> None:
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(cache, f)
+        os.replace(path + ".tmp", path)
+    except OSError as e:
+        logging.warning(f"Can not write environment cache {path}: {e}")
+
+
+def probe_environment(path: str = PROBE_CACHE_PATH) -> Future:
+    """
+    Probe system information and location in a background thread.
+
+    The slow lookups (DNS, IP geolocation, reverse geocoding) overlap with
+    whatever the caller does next, typically waiting for the first user input.
+
+    @param path: JSON cache file, values are reused until their TTL in `PROBE_TTL` expires.
+    @return: Future resolving to {"system": ..., "location": ...}.
+    """
+    future = Future()
+
+    def run():
+        try:
+            future.set_result({
+                "system": cached_probe("system", system, PROBE_TTL["system"], path),
+                "location": cached_probe("location", location, PROBE_TTL["location"], path)
+            })
+        except BaseException as e:
+            future.set_exception(e)
+
+    Thread(target=run, name="probe-environment", daemon=True).start()
+    return future
+
+
 def real_time():
     return datetime.now(tz = pytz.timezone("Asia/Bangkok")).strftime('%Y-%m-%d %H:%M:%S %Z')
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Cheap token count estimate for budgeting, without a tokenizer.
+
+    Counts about 4 UTF-8 bytes per token, so Vietnamese text with multi-byte
+    diacritics is (correctly) estimated as more tokens than ASCII of the same length.
+
+    @param text: input text
+
+    @return: estimated number of tokens
+    """
+    if not text:
+        return 0
+    return (len(text.encode("utf-8")) + 3) // 4
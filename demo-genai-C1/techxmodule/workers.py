@@ -0,0 +1,265 @@
+"""
+Pre-fork worker mode of the chat server.
+
+A supervisor starts one `ChatServer` process per worker, each listening on
+its own Unix socket, and a router accepting the client connections. The
+router hashes the session id of each request to a worker, so a session's
+memory always stays in the same process and workers share nothing. The
+supervisor restarts crashed workers, and requests for a worker that is
+restarting get a 503.
+
+Run from demo-genai-C1:
+    python -m techxmodule.server --workers 4 --port 8080
+"""
+import asyncio
+import multiprocessing
+import os
+import tempfile
+import time
+import zlib
+
+from typing import Any, Callable, Dict, List, Optional
+from termcolor import cprint    # type: ignore
+from techxmodule.server import ChatServer, HTTPError, MAX_HEADER_BYTES, send_json
+
+
+# Headers about one connection, rewritten by the router on both sides
+HOP_BY_HOP_HEADERS = ("connection", "keep-alive", "proxy-connection")
+
+
+def session_worker(session_id: str, workers: int) -> int:
+    """
+    Worker owning a session. Stable across processes and restarts,
+    unlike the built-in `hash` of strings.
+    """
+    return zlib.crc32(session_id.encode("utf-8")) % workers
+
+
+def _run_worker(path: str, factory_builder: Callable[..., Callable[[str], Any]],
+                builder_args: tuple, server_options: Dict) -> None:
+    # Runs in the worker process, which builds its own models and boto3 clients
+    server = ChatServer(factory_builder(*builder_args), **server_options)
+    try:
+        asyncio.run(server.serve(path=path))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+
+
+class Supervisor:
+    """
+    Start, route to, and restart chat server worker processes.
+
+    Worker processes are spawned, so `factory_builder` must be importable
+    (a module-level function); it is called in each worker with
+    `builder_args` to create that worker's model factory.
+
+    @param factory_builder: Returns the model factory of a worker.
+    @param builder_args: Arguments of `factory_builder`.
+    @param workers: Number of worker processes, one per core by default.
+    @param server_options: Keyword arguments of each worker's ChatServer.
+    @param max_restart_delay: Maximum seconds to wait before restarting a crashing worker.
+    @param stable_seconds: Uptime after which a restarted worker counts as healthy again,
+                           so its next crash is restarted at once.
+    """
+
+    CONNECT_TIMEOUT = 5.0
+    MONITOR_SECONDS = 0.5
+
+
+    def __init__(self, factory_builder: Callable[..., Callable[[str], Any]],
+                 builder_args: tuple = (),
+                 workers: int = None,
+                 server_options: Dict = None,
+                 max_restart_delay: float = 30.0,
+                 stable_seconds: float = 60.0) -> None:
+        self.factory_builder = factory_builder
+        self.builder_args = builder_args
+        self.workers = workers or os.cpu_count() or 1
+        self.server_options = server_options or {}
+        self.max_restart_delay = max_restart_delay
+        self.stable_seconds = stable_seconds
+        self.runtime_dir = tempfile.mkdtemp(prefix="techxmodule-workers-")
+        self.processes: List[Optional[multiprocessing.Process]] = [None] * self.workers
+        self.restarts = [0] * self.workers
+        self.__next_start = [0.0] * self.workers
+        self.__started = [0.0] * self.workers
+        self.__context = multiprocessing.get_context("spawn")
+        self.__stopping = False
+
+
+    def socket_path(self, index: int) -> str:
+        return os.path.join(self.runtime_dir, f"worker-{index}.sock")
+
+
+    def start_worker(self, index: int) -> None:
+        path = self.socket_path(index)
+        if os.path.exists(path):
+            os.unlink(path)
+        process = self.__context.Process(
+            target=_run_worker,
+            args=(path, self.factory_builder, self.builder_args, self.server_options),
+            name=f"chat-worker-{index}",
+            daemon=True
+        )
+        process.start()
+        self.processes[index] = process
+        self.__started[index] = time.monotonic()
+
+
+    def start(self) -> None:
+        """
+        Start every worker, before any connection is accepted.
+        """
+        for index in range(self.workers):
+            self.start_worker(index)
+
+
+    def stop(self) -> None:
+        self.__stopping = True
+        for process in self.processes:
+            if process is not None and process.is_alive():
+                process.terminate()
+        for process in self.processes:
+            if process is not None:
+                process.join(timeout=5)
+        for index in range(self.workers):
+            if os.path.exists(self.socket_path(index)):
+                os.unlink(self.socket_path(index))
+
+
+    async def monitor(self) -> None:
+        """
+        Restart crashed workers, waiting longer after each consecutive crash.
+        """
+        while not self.__stopping:
+            now = time.monotonic()
+            for index, process in enumerate(self.processes):
+                if process is not None and process.is_alive():
+                    if self.restarts[index] and now - self.__started[index] >= self.stable_seconds:
+                        self.restarts[index] = 0
+                    continue
+                if process is None or now < self.__next_start[index]:
+                    continue
+                self.restarts[index] += 1
+                delay = min(2 ** (self.restarts[index] - 1), self.max_restart_delay)
+                cprint(f"Worker {index} exited with code {process.exitcode}, "
+                       f"restarting (restart {self.restarts[index]})", "red")
+                self.start_worker(index)
+                self.__next_start[index] = now + delay
+            await asyncio.sleep(self.MONITOR_SECONDS)
+
+
+    async def serve(self, host: str = "127.0.0.1", port: int = 8080) -> None:
+        """
+        Start the workers, then route client connections until cancelled.
+        """
+        self.start()
+        monitor = asyncio.ensure_future(self.monitor())
+        server = await asyncio.start_server(self.route, host, port, limit=MAX_HEADER_BYTES)
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            monitor.cancel()
+            self.stop()
+
+
+    def health(self) -> Dict:
+        return {"workers": [{
+            "index": index,
+            "pid": process.pid if process else None,
+            "alive": bool(process and process.is_alive()),
+            "restarts": self.restarts[index]
+        } for index, process in enumerate(self.processes)]}
+
+
+    async def route(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """
+        Forward one client connection to the worker of its session.
+
+        The router only reads the request head and the response head; the
+        body and the streamed answer are copied as bytes. Plain requests are
+        forwarded with `Connection: close`, so a keep-alive connection can not
+        carry the next request of another session to the wrong worker, and
+        the worker's response is relayed with `Connection: close` too.
+        """
+        try:
+            head = await reader.readuntil(b"\r\n\r\n")
+            lines = head.decode("latin-1").split("\r\n")
+            try:
+                method, path, _ = lines[0].split(" ", 2)
+            except ValueError:
+                raise HTTPError(400, "Malformed request line")
+
+            parts = path.split("?", 1)[0].strip("/").split("/")
+            if method.upper() == "GET" and parts == ["health"]:
+                await send_json(writer, 200, self.health(), keep_alive=False)
+                return
+            if len(parts) < 2 or parts[0] != "sessions" or not parts[1]:
+                raise HTTPError(404, "Not found")
+
+            index = session_worker(parts[1], self.workers)
+            try:
+                upstream_reader, upstream_writer = await asyncio.wait_for(
+                    asyncio.open_unix_connection(self.socket_path(index), limit=MAX_HEADER_BYTES),
+                    self.CONNECT_TIMEOUT)
+            except (OSError, asyncio.TimeoutError):
+                raise HTTPError(503, f"Worker {index} is unavailable")
+
+            upgrade = any(line.lower().startswith("upgrade:") for line in lines[1:])
+            if not upgrade:
+                lines = close_connection(lines)
+            upstream_writer.write("\r\n".join(lines).encode("latin-1"))
+
+            # The request body is copied while the response head is read
+            to_worker = asyncio.ensure_future(pipe(reader, upstream_writer))
+            try:
+                if not upgrade:
+                    response = await upstream_reader.readuntil(b"\r\n\r\n")
+                    writer.write("\r\n".join(close_connection(response.decode("latin-1").split("\r\n")))
+                                 .encode("latin-1"))
+                await asyncio.gather(to_worker, pipe(upstream_reader, writer))
+            finally:
+                to_worker.cancel()
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+            pass
+        except HTTPError as e:
+            await send_json(writer, e.status, {"error": e.message}, keep_alive=False)
+        finally:
+            writer.close()
+
+
+def close_connection(lines: List[str]) -> List[str]:
+    """
+    Lines of a request or response head with its hop-by-hop connection
+    headers replaced by `Connection: close`.
+    """
+    lines = [line for line in lines
+             if line.split(":", 1)[0].strip().lower() not in HOP_BY_HOP_HEADERS]
+    lines.insert(1, "Connection: close")
+    return lines
+
+
+async def pipe(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+    """
+    Copy bytes until EOF, then close the writing side.
+    """
+    try:
+        while True:
+            data = await reader.read(64 * 1024)
+            if not data:
+                break
+            writer.write(data)
+            await writer.drain()
+    except ConnectionError:
+        pass
+    finally:
+        if writer.can_write_eof():
+            try:
+                writer.write_eof()
+            except OSError:
+                pass
+        else:
+            writer.close()
@@ -1,45 +1,99 @@
 from techxmodule.core import Tools
+from techxmodule.deadline import Deadline, NO_DEADLINE
+from techxmodule.httppool import pool
 
-import boto3, json
-import wikipedia # type: ignore
+import json
+from functools import lru_cache
 
-import requests
-from langchain_community.tools import DuckDuckGoSearchRun # type: ignore
+# boto3 and langchain_community are imported inside the tools that use them,
+# and requests on the first HTTP call, so importing this module does not slow
+# down startup. HTTP calls go through the shared keep-alive pool.
 
-import urllib.parse
+WOLFRAM_URL = "https://www.wolframalpha.com/api/v1/llm-api"
+WIKIPEDIA_URL = "https://en.wikipedia.org/w/api.php"
+
+# Directory of a local index built by techxmodule.ingest: link_to_knowledgebase
+# then searches it with the local hybrid retriever instead of the Bedrock
+# knowledge base. None to use the knowledge base.
+LOCAL_INDEX_PATH = None
+KNOWLEDGE_BASE_RESULTS = 100
+# Region of the knowledge base and of the embedding model of the local index
+REGION = "us-east-1"
+
+# Timeouts in seconds of the network calls, shortened to the time left in the turn
+HTTP_TIMEOUT = 15
+RETRIEVE_TIMEOUT = 30
 
 
 @Tools.tool("retrieve", "data")
-def call_wolframalpha(query: str) -> str:
-    """
-    Function to call wolframalpha API
+def call_wolframalpha(query: str, deadline: Deadline = NO_DEADLINE) -> str:
     """
+    WolframAlpha understands natural language queries about entities in chemistry, physics, geography, history, art, astronomy, and more.
+    WolframAlpha performs mathematical calculations, date and unit conversions, formula solving, etc.
+    Convert inputs to simplified keyword queries whenever possible (e.g. convert 'how many people live in France' to 'France population').
+    Send queries in English only; translate non-English queries before sending, then respond in the original language.
+    Display image URLs with Markdown syntax: ![URL]
+    ALWAYS use this exponent notation: `6*10^14`, NEVER `6e14`.
+    ALWAYS use {'input': query} structure for queries to Wolfram endpoints; `query` must ONLY be a single-line string.
+    ALWAYS use proper Markdown formatting for all math, scientific, and chemical formulas, symbols, etc.:  '$$\\n[expression]\\n$$' for standalone cases and '\\( [expression] \\)' when inline.
+    Never mention your knowledge cutoff date; Wolfram may return more recent data.
+    Use ONLY single-letter variable names, with or without integer subscript (e.g., n, n1, n_1).
+    Use named physical constants (e.g., 'speed of light') without numerical substitution.
+    Include a space between compound units (e.g., 'Ω m' for 'ohm*meter').
+    To solve for a variable in an equation with units, consider solving a corresponding equation without units; exclude counting units (e.g., books), include genuine units (e.g., kg).
+    If data for multiple properties is needed, make separate calls for each property.
+    If a WolframAlpha result is not relevant to the query:
+    If Wolfram provides multiple 'Assumptions' for a query, choose the more relevant one(s) without explaining the initial result. If you are unsure, ask the user to choose.
+    Re-send the exact same 'input' with NO modifications, and add the 'assumption' parameter, formatted as a list, with the relevant values.
+    ONLY simplify or rephrase the initial query if a more relevant 'Assumption' or other input suggestions are not provided.
+    Do not explain each step unless user input is needed. Proceed directly to making a better API call based on the available assumptions.
     
-    encoded_query = urllib.parse.quote(query)
+    @param query: The query to search on wolframalpha. query Must strictly follow the description of the function.
+    """
     
-    url = f"https://www.wolframalpha.com/api/v1/llm-api?input={encoded_query}s&appid=AQHXEG-WE9WU4T6K6"
+    params = {"input": query, "appid": "AQHXEG-WE9WU4T6K6"}
     
-    return requests.get(url).text
+    return pool.get(WOLFRAM_URL, params=params, timeout=deadline.timeout(HTTP_TIMEOUT),
+                    retries=_http_retries(deadline)).text
 
 
 @Tools.tool("retrieve","documents")
-def link_to_knowledgebase(query: str) -> json:
+def link_to_knowledgebase(query: str, deadline: Deadline = NO_DEADLINE) -> json:
     """
-    Function to call API to knowledge base and retrieve data source from it.
+    A datasource that store every things about Chí Phèo story by Nam Cao. Use this to search more about the story,
+    the characters name Bá Kiến, Thị Nở, Tự Lãng, Chí Phèo, or other small characters in the story.
+    Use this to know more and to analysis when asking about the story and the characters.
     
-    @param query: The query we want to search for
+    @param query: The texts or keywords that you want to search for the reference  or for more information about it.
+                  This should be a pargraphs, a lot of string that you want to find more context,or a text that can help
+                  you understand more about the story, the characters
     
     @return: Compressed json file with chunking base and link-sources
     """
-        
-    runtime = boto3.client("bedrock-agent-runtime", region_name="us-east-1")
+    import boto3
+
+    if LOCAL_INDEX_PATH:
+        retriever = _local_retriever(LOCAL_INDEX_PATH)
+        model = retriever.index.manifest.get("model")
+        if not model:
+            # An index without embedding model is searched with BM25 only
+            return retriever.retrieve(query, KNOWLEDGE_BASE_RESULTS)
+        from techxmodule.models.embedding import Embedding
+
+        # Queries are embedded with the model the index was built with
+        embedder = Embedding(model, boto3.Session(), REGION, config=_bedrock_config(deadline))
+        query_vector = embedder.embed([query], Embedding.SEARCH_QUERY)[0]
+        return retriever.retrieve(query, KNOWLEDGE_BASE_RESULTS, query_vector=query_vector)
+    
+    runtime = boto3.client("bedrock-agent-runtime", region_name=REGION,
+                           config=_bedrock_config(deadline))
     
     # Compress into API POST request to send to knowledge base
     kwargs = {
         "knowledgeBaseId": "AYP6WXNCZ0",
         "retrievalConfiguration": {
             "vectorSearchConfiguration": {
-                "numberOfResults": 100,
+                "numberOfResults": KNOWLEDGE_BASE_RESULTS,
                 "overrideSearchType": "HYBRID"   
             }
         },
@@ -52,31 +106,87 @@ def link_to_knowledgebase(query: str) -> json:
     return runtime.retrieve(**kwargs)
 
 
+def _http_retries(deadline: Deadline):
+    """
+    Retries of an HTTP call: none under a deadline, each one would wait for
+    the full timeout again past the time left; the pool default otherwise.
+    """
+    return 0 if deadline.remaining is not None else None
+
+
+def _bedrock_config(deadline: Deadline):
+    """
+    Client configuration of a Bedrock call: timeouts shortened to the time
+    left, and no retries under a deadline.
+    """
+    from botocore.config import Config
+
+    timeout = deadline.timeout(RETRIEVE_TIMEOUT)
+    return Config(connect_timeout=min(timeout, 5), read_timeout=timeout,
+                  retries={"max_attempts": 1 if deadline.remaining is not None else 3})
+
+
+@lru_cache(maxsize=1)
+def _local_retriever(path: str):
+    """
+    Hybrid retriever over the local index, opened on first use and shared by the calls.
+    """
+    from techxmodule.index import LocalIndex
+    from techxmodule.retrieval import HybridRetriever
+
+    return HybridRetriever(LocalIndex(path))
+
+
 @Tools.tool("retrieve", "data")
-def get_article(search_term):
-    """_
-    Function to retrieve data from wiki page
+def get_article(search_term: str, deadline: Deadline = NO_DEADLINE) -> str:
     """
+    A tool to retrieve an up to date Wikipedia article.
+    Use side by side with get_information tool for comparing and evaluation informations
     
-    results = wikipedia.search(search_term)
+    @param search_term: The search term to find a wikipedia article by title
+    """
+    # Search and plain text of the best match in one MediaWiki API request
+    params = {
+        "action": "query",
+        "format": "json",
+        "generator": "search",
+        "gsrsearch": search_term,
+        "gsrlimit": 1,
+        "prop": "extracts",
+        "explaintext": 1,
+        "redirects": 1,
+    }
+    pages = pool.get(WIKIPEDIA_URL, params=params, timeout=deadline.timeout(HTTP_TIMEOUT),
+                     retries=_http_retries(deadline)).json() \
+        .get("query", {}).get("pages", {})
     
-    if not results:
+    if not pages:
         return "Can not find any relevant information about that"
-    first_result = results[0]
-    
-    page = wikipedia.page(first_result, auto_suggest=False)
     
-    return page.content
+    return next(iter(pages.values())).get("extract", "")
 
 
 @Tools.tool("retrieve", "data")
 def get_information(search_term: str) -> str:
     """
-    Use this tool to search for. Use this tool when the users asks for general news.
+    Use this tool to search for anything on the internet.
+    Use side by side with wiki tool for comparing and evaluation informations.
+    Can Use this tool when the users asks for general news, that is recently.
+    Must use this tool to get information of everything on the internet.
     
-    @param search_term: Query search tool
+    @param search_term: The search query to find the information about it
     """
-    search = DuckDuckGoSearchRun(max_results = 5)
-    result = search.run(search_term)
+    # DuckDuckGoSearchRun has no timeout option, tool_use stops waiting at the deadline
+    result = _duckduckgo().run(search_term)
     return result
 
+
+@lru_cache(maxsize=1)
+def _duckduckgo():
+    """
+    DuckDuckGo search tool, created on first use and shared by the calls.
+    """
+    from langchain_community.tools import DuckDuckGoSearchRun # type: ignore
+
+    return DuckDuckGoSearchRun(max_results = 5)
+